@@ -1,20 +1,29 @@
 # API module initialization
-from .stream_fetcher import get_m3u8_from_multiembed
-from .mixdrop_scraper import extract_m3u8_from_mixdrop
-from .auto_stream_scraper import get_best_stream
-from .m3u8_scraper import extract_m3u8_playwright
-from .omdb_fetcher import fetch_movie_by_title, search_movies_by_keyword, get_movie_details
-from .vidsrc_api import get_stream_for_imdb
-from .vidsrc_scraper import extract_from_vidsrc
+#
+# Scrapers pull in BeautifulSoup, Redis and friends, so they are only
+# imported when one of the names below is first accessed.
+from .startup import timed_import
 
-__all__ = [
-    'get_m3u8_from_multiembed',
-    'extract_m3u8_from_mixdrop',
-    'get_best_stream',
-    'extract_m3u8_playwright',
-    'fetch_movie_by_title',
-    'search_movies_by_keyword',
-    'get_movie_details',
-    'get_best_stream_api',
-    'extract_from_vidsrc'
-]
+_LAZY_EXPORTS = {
+    'get_m3u8_from_multiembed': 'stream_fetcher',
+    'extract_m3u8_from_mixdrop': 'mixdrop_scraper',
+    'get_best_stream': 'auto_stream_scraper',
+    'extract_m3u8_playwright': 'm3u8_scraper',
+    'fetch_movie_by_title': 'omdb_fetcher',
+    'search_movies_by_keyword': 'omdb_fetcher',
+    'get_movie_details': 'omdb_fetcher',
+    'get_stream_for_imdb': 'vidsrc_api',
+    'extract_from_vidsrc': 'vidsrc_scraper',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(timed_import(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = list(_LAZY_EXPORTS)
@@ -0,0 +1,24 @@
+import os
+import hmac
+
+# Shared secret for admin-only diagnostics (proxy stats, request profiling, memory reports); empty disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def is_authorized(req):
+    """
+    Whether `req` carries the admin token
+
+    The token is read from the X-Admin-Token header, or the admin_token
+    query parameter for tools that cannot set headers.
+
+    Args:
+        req: The Flask request
+
+    Returns:
+        bool: False whenever ADMIN_TOKEN is unset
+    """
+    if not ADMIN_TOKEN:
+        return False
+    supplied = req.headers.get("X-Admin-Token") or req.args.get("admin_token") or ""
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
@@ -1,92 +1,40 @@
-import concurrent.futures
-import time
+from .providers import BEST_STREAM, providers_for
 
-from .vidsrc_api import get_stream_for_imdb as get_vidsrc
-from .multiembed_scraper import get_stream_for_imdb as get_multiembed
-from .flixhq_scraper import get_stream_for_imdb as get_flixhq
-from .tplayer_scraper import get_stream_for_imdb as get_tplayer
-from .allmovieshub_scraper import get_stream_for_imdb as get_allmovieshub
 
-# Cache successful stream per IMDb ID: { imdb_id: (timestamp, result_dict) }
-_stream_cache = {}
-CACHE_TTL_SECONDS = 300  # Cache 5 minutes
-
-
-def _fetch_source(func, imdb_id, title=None, year=None):
+def _fetch_source(provider, imdb_id, title=None, year=None, deadline=None):
     try:
-        return func(imdb_id, title, year)
+        return provider.resolve(imdb_id, title, year, deadline=deadline)
     except Exception as e:
-        print(f"[auto_stream_scraper] Exception in {func.__name__}: {e}")
+        print(f"[auto_stream_scraper] Exception in {provider.name}: {e}")
         return None
 
 
-def get_best_stream(imdb_id, title=None, year=None):
+def get_best_stream(imdb_id, title=None, year=None, deadline=None):
     """
-    Concurrently query known sources for the first playable stream.
-    Uses a cache to speed up repeated calls.
+    First usable stream from the BEST_STREAM providers, in registry order.
+
+    Every BEST_STREAM provider is a URL template (network=False), so this
+    makes no upstream requests and needs neither the resolver pool nor the
+    stream cache; `deadline` is passed through to the providers.
     Returns dict with stream_url, source, embed flag, or error.
     """
-    now = time.time()
-
-    # Return cache if fresh enough
-    cached = _stream_cache.get(imdb_id)
-    if cached:
-        cached_time, result = cached
-        if now - cached_time < CACHE_TTL_SECONDS:
-            return result
-
-    sources = [
-        ("VidSrc", get_vidsrc),
-        ("MultiEmbed", get_multiembed),
-        ("FlixHQ", get_flixhq),
-        ("TPlayer", get_tplayer),
-        ("AllMoviesHub", get_allmovieshub),
-    ]
-
     embed_stream = None
-    direct_stream = None
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(sources)) as executor:
-        future_to_source = {
-            executor.submit(_fetch_source, func, imdb_id, title, year): name
-            for name, func in sources
-        }
-
-        # Using as_completed with timeout ensures no hang beyond timeout
-        try:
-            for future in concurrent.futures.as_completed(future_to_source, timeout=7):
-                source_name = future_to_source[future]
-                try:
-                    result = future.result(timeout=5)
-                    if not result or not result.get("stream_url"):
-                        continue
+    for provider in providers_for(BEST_STREAM):
+        result = _fetch_source(provider, imdb_id, title, year, deadline)
+        if not result or not result.get("stream_url"):
+            continue
 
-                    result["source"] = source_name
-                    url = result["stream_url"]
-                    result["m3u8"] = url  # unify naming for frontend
+        result["source"] = provider.name
+        url = result["stream_url"]
+        result["m3u8"] = url  # unify naming for frontend
 
-                    # Priority: return first direct playable URL (m3u8 or mp4)
-                    if url.endswith(".m3u8") or url.endswith(".mp4"):
-                        direct_stream = result
-                        break
-                    else:
-                        # Keep first embed stream as fallback (iframe or other)
-                        if embed_stream is None:
-                            embed_stream = result
-
-                except Exception as e:
-                    print(f"[auto_stream_scraper] Exception in future result ({source_name}): {e}")
-        except concurrent.futures.TimeoutError:
-            print("[auto_stream_scraper] Source queries timed out")
+        # Priority: return first direct playable URL (m3u8 or mp4)
+        if url.endswith(".m3u8") or url.endswith(".mp4"):
+            return result
+        # Keep first embed stream as fallback (iframe or other)
+        if embed_stream is None:
+            embed_stream = result
 
-    # Cache and return best available stream
-    if direct_stream:
-        _stream_cache[imdb_id] = (now, direct_stream)
-        return direct_stream
-    elif embed_stream:
-        _stream_cache[imdb_id] = (now, embed_stream)
+    if embed_stream:
         return embed_stream
-    else:
-        error_result = {"success": False, "error": "No working stream found"}
-        _stream_cache[imdb_id] = (now, error_result)
-        return error_result
+    return {"success": False, "error": "No working stream found"}
@@ -0,0 +1,244 @@
+import os
+import time
+import logging
+import threading
+import itertools
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Global egress cap for /api/proxy in bytes per second (0 = unlimited)
+PROXY_EGRESS_CAP_BPS = int(os.getenv("PROXY_EGRESS_CAP_BPS", "0"))
+# Hard per-client ceiling in bytes per second (0 = only the fair share applies)
+PROXY_CLIENT_RATE_BPS = int(os.getenv("PROXY_CLIENT_RATE_BPS", "0"))
+# Seconds worth of tokens a bucket may accumulate while a client is idle
+PROXY_BURST_SECONDS = float(os.getenv("PROXY_BURST_SECONDS", "2"))
+
+# Window over which per-stream throughput is sampled for the stats view
+THROUGHPUT_WINDOW_SECONDS = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers go into debt instead of blocking inside
+    the lock. `reserve` returns how long the caller must sleep before the
+    reserved bytes are allowed on the wire.
+    """
+
+    def __init__(self, rate):
+        self.rate = 0
+        self.capacity = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate)
+        # Start full so a new client gets its burst for a quick first byte
+        self.tokens = self.capacity
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = max(0, rate)
+        self.capacity = self.rate * PROXY_BURST_SECONDS
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        if not self.rate:
+            return 0.0
+        self._refill()
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class ProxyStream:
+    """Byte accounting for a single proxied upstream response."""
+
+    def __init__(self, stream_id, client_id, url):
+        self.stream_id = stream_id
+        self.client_id = client_id
+        self.url = url
+        self.started = time.time()
+        self.bytes_sent = 0
+        self.throttled_seconds = 0.0
+        self.throughput_bps = 0.0
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def record(self, amount):
+        self.bytes_sent += amount
+        self._window_bytes += amount
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= THROUGHPUT_WINDOW_SECONDS:
+            self.throughput_bps = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+
+    def current_throughput(self):
+        # Streams that stalled since the last full window report their partial rate
+        elapsed = time.monotonic() - self._window_start
+        if elapsed >= THROUGHPUT_WINDOW_SECONDS:
+            return self._window_bytes / elapsed
+        return self.throughput_bps
+
+    def to_dict(self):
+        return {
+            "id": self.stream_id,
+            "client": self.client_id,
+            "url": self.url,
+            "started": self.started,
+            "bytes_sent": self.bytes_sent,
+            "throughput_bps": round(self.current_throughput(), 1),
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+class BandwidthScheduler:
+    """
+    Fair-share egress scheduler for the proxy.
+
+    Every client gets its own token bucket whose rate is the global cap divided
+    by the number of active clients (optionally clamped by a per-client
+    ceiling), so a client opening many parallel range requests only splits its
+    own share instead of starving everybody else. A global bucket enforces the
+    overall cap across bursts.
+    """
+
+    def __init__(self, global_rate=0, client_rate=0):
+        self.global_rate = global_rate
+        self.client_rate = client_rate
+        self._lock = threading.Lock()
+        self._global_bucket = TokenBucket(global_rate)
+        self._client_buckets = {}
+        self._client_streams = {}
+        self._streams = {}
+        self._ids = itertools.count(1)
+        self._bytes_total = 0
+
+    def _client_share(self):
+        active = max(1, len(self._client_streams))
+        rates = []
+        if self.global_rate:
+            rates.append(self.global_rate / active)
+        if self.client_rate:
+            rates.append(self.client_rate)
+        return min(rates) if rates else 0
+
+    def _rebalance(self):
+        share = self._client_share()
+        for bucket in self._client_buckets.values():
+            bucket.set_rate(share)
+
+    def open_stream(self, client_id, url):
+        with self._lock:
+            stream = ProxyStream(next(self._ids), client_id, url)
+            self._streams[stream.stream_id] = stream
+            self._client_streams.setdefault(client_id, set()).add(stream.stream_id)
+            if client_id not in self._client_buckets:
+                self._client_buckets[client_id] = TokenBucket(self._client_share())
+            self._rebalance()
+            return stream
+
+    def close_stream(self, stream):
+        with self._lock:
+            if self._streams.pop(stream.stream_id, None) is None:
+                return
+            client_streams = self._client_streams.get(stream.client_id)
+            if client_streams is not None:
+                client_streams.discard(stream.stream_id)
+                if not client_streams:
+                    del self._client_streams[stream.client_id]
+                    self._client_buckets.pop(stream.client_id, None)
+            self._rebalance()
+
+    def throttle(self, stream, amount):
+        """Account `amount` bytes for `stream`, sleeping if its client is over budget."""
+        with self._lock:
+            bucket = self._client_buckets.get(stream.client_id)
+            wait = max(
+                bucket.reserve(amount) if bucket else 0.0,
+                self._global_bucket.reserve(amount),
+            )
+            stream.record(amount)
+            stream.throttled_seconds += wait
+            self._bytes_total += amount
+        if wait > 0:
+            time.sleep(wait)
+
+    def iter_throttled(self, stream, chunks):
+        """Wrap an iterable of byte chunks so each one is paced by the scheduler."""
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.throttle(stream, len(chunk))
+                yield chunk
+        finally:
+            self.close_stream(stream)
+
+    def get_stats(self):
+        with self._lock:
+            streams = [s.to_dict() for s in self._streams.values()]
+            share = self._client_share()
+            clients = {}
+            for s in streams:
+                client = clients.setdefault(s["client"], {
+                    "streams": 0,
+                    "bytes_sent": 0,
+                    "throughput_bps": 0.0,
+                    "rate_limit_bps": share,
+                })
+                client["streams"] += 1
+                client["bytes_sent"] += s["bytes_sent"]
+                client["throughput_bps"] += s["throughput_bps"]
+            return {
+                "global": {
+                    "egress_cap_bps": self.global_rate,
+                    "client_rate_bps": self.client_rate,
+                    "fair_share_bps": share,
+                    "active_clients": len(self._client_streams),
+                    "active_streams": len(streams),
+                    "throughput_bps": round(sum(s["throughput_bps"] for s in streams), 1),
+                    "bytes_total": self._bytes_total,
+                },
+                "clients": clients,
+                "streams": sorted(streams, key=lambda s: s["throughput_bps"], reverse=True),
+            }
+
+
+# Shared scheduler used by the /api/proxy route
+proxy_scheduler = BandwidthScheduler(PROXY_EGRESS_CAP_BPS, PROXY_CLIENT_RATE_BPS)
+
+
+def _collect_metrics():
+    stats = proxy_scheduler.get_stats()["global"]
+    return [
+        ("mushh_proxy_bytes_total", "counter", "Bytes sent to clients through /api/proxy",
+         [({}, stats["bytes_total"])]),
+        ("mushh_proxy_active_streams", "gauge", "Open /api/proxy responses", [({}, stats["active_streams"])]),
+        ("mushh_proxy_active_clients", "gauge", "Clients with an open /api/proxy response",
+         [({}, stats["active_clients"])]),
+        ("mushh_proxy_throughput_bytes_per_second", "gauge", "Current /api/proxy egress",
+         [({}, stats["throughput_bps"])]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def get_client_id(req):
+    """
+    Identify the downstream client by its address
+
+    X-Forwarded-For is not read here: its leading entries are whatever the
+    client sent, so rotating them would buy a fresh token bucket per
+    request. app.py resolves the trusted hop into `remote_addr` instead
+    (TRUSTED_PROXY_HOPS).
+    """
+    return req.remote_addr or "unknown"
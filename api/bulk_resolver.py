@@ -0,0 +1,146 @@
+import os
+import queue
+import logging
+import threading
+import concurrent.futures
+
+from . import stream_cache
+from .deadline import Deadline
+from .omdb_fetcher import validate_imdb_id
+from .resolver_pool import resolver_pool, ResolverSaturated
+from .stream_fetcher import get_m3u8_from_multiembed, stream_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Most IDs accepted per batch; a category row is well below this
+BULK_RESOLVE_MAX_IDS = int(os.getenv("BULK_RESOLVE_MAX_IDS", "24"))
+# Time budget shared by every resolution in one batch
+BULK_RESOLVE_BUDGET_SECONDS = float(os.getenv("BULK_RESOLVE_BUDGET", "30"))
+# Titles of one batch resolved at once; all batches together are further capped by
+# RESOLVER_BACKGROUND_MAX_INFLIGHT and never take the slots reserved for clicks
+BULK_RESOLVE_CONCURRENCY = int(os.getenv("BULK_RESOLVE_CONCURRENCY", "4"))
+
+# IMDb IDs being prefetched by any batch or speculative resolution in this process
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def claim(imdb_ids, source='auto'):
+    """
+    Sort a batch into work to do and IDs that need none
+
+    Returns:
+        tuple: (statuses, todo) where statuses maps IDs that are 'invalid',
+               'cached' or already 'in_progress', and todo lists IDs now
+               claimed by this batch
+    """
+    statuses = {}
+    todo = []
+    for imdb_id in dict.fromkeys(imdb_ids):
+        if not isinstance(imdb_id, str) or not validate_imdb_id(imdb_id):
+            statuses[str(imdb_id)] = 'invalid'
+            continue
+        if stream_cache.get(stream_cache_key(imdb_id, source)) is not None:
+            statuses[imdb_id] = 'cached'
+            continue
+        with _inflight_lock:
+            if imdb_id in _inflight:
+                statuses[imdb_id] = 'in_progress'
+                continue
+            _inflight.add(imdb_id)
+        todo.append(imdb_id)
+    return statuses, todo
+
+
+def release(imdb_id):
+    """Give up the claim on `imdb_id` so it can be resolved again"""
+    with _inflight_lock:
+        _inflight.discard(imdb_id)
+
+
+def run(todo, source='auto', budget=BULK_RESOLVE_BUDGET_SECONDS, concurrency=BULK_RESOLVE_CONCURRENCY):
+    """
+    Resolve claimed IDs into the stream cache under one shared deadline
+
+    Returns:
+        dict: { imdb_id: 'resolved' | 'failed' | 'skipped' }
+    """
+    deadline = Deadline(budget)
+    work = queue.Queue()
+    for imdb_id in todo:
+        work.put(imdb_id)
+    statuses = {}
+
+    def worker():
+        while True:
+            try:
+                imdb_id = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if deadline.expired():
+                    statuses[imdb_id] = 'skipped'
+                    continue
+                with resolver_pool.background():
+                    result = get_m3u8_from_multiembed(imdb_id, source, deadline=deadline)
+                statuses[imdb_id] = 'resolved' if stream_cache.is_success(result) else 'failed'
+            except ResolverSaturated:
+                # Out of background quota; the rest of the batch is skipped below
+                statuses[imdb_id] = 'skipped'
+                return
+            except Exception as e:
+                logger.warning(f"Bulk resolution failed for {imdb_id}: {str(e)}")
+                statuses[imdb_id] = 'failed'
+            finally:
+                release(imdb_id)
+
+    futures = []
+    for _ in range(min(concurrency, len(todo))):
+        try:
+            futures.append(resolver_pool.submit(worker))
+        except ResolverSaturated:
+            break
+    if futures:
+        concurrent.futures.wait(futures, timeout=deadline.remaining())
+
+    # Whatever no worker got to is given up on and may be claimed again
+    while True:
+        try:
+            imdb_id = work.get_nowait()
+        except queue.Empty:
+            break
+        statuses[imdb_id] = 'skipped'
+        release(imdb_id)
+    return statuses
+
+
+def resolve_many(imdb_ids, source='auto', budget=BULK_RESOLVE_BUDGET_SECONDS, concurrency=BULK_RESOLVE_CONCURRENCY):
+    """
+    Resolve a batch of titles concurrently and wait for the outcome
+
+    Args:
+        imdb_ids (list): IMDb IDs, at most BULK_RESOLVE_MAX_IDS are used
+        source (str): Preferred source for every title
+        budget (float): Seconds the whole batch may take
+        concurrency (int): Titles resolved at once
+
+    Returns:
+        dict: { imdb_id: status }
+    """
+    statuses, todo = claim(imdb_ids[:BULK_RESOLVE_MAX_IDS], source)
+    statuses.update(run(todo, source, budget, concurrency))
+    return statuses
+
+
+def prefetch(imdb_ids, source='auto'):
+    """
+    Start resolving a batch in the background and return at once
+
+    Returns:
+        dict: { imdb_id: status } with 'accepted' for IDs now being resolved
+    """
+    statuses, todo = claim(imdb_ids[:BULK_RESOLVE_MAX_IDS], source)
+    if todo:
+        threading.Thread(target=run, args=(todo, source), daemon=True, name="bulk-prefetch").start()
+    statuses.update({imdb_id: 'accepted' for imdb_id in todo})
+    return statuses
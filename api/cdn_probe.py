@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+from urllib.parse import urlparse
+
+
+from .hls_manifest import parse_playlist
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Probing downloads real media, so it is opt-in
+STREAM_PROBE_ENABLED = os.getenv("STREAM_PROBE_ENABLED", "0") == "1"
+PROBE_TIMEOUT_SECONDS = float(os.getenv("STREAM_PROBE_TIMEOUT", "5"))
+PROBE_MAX_BYTES = int(os.getenv("STREAM_PROBE_MAX_BYTES", str(1024 * 1024)))
+PROBE_CACHE_TTL_SECONDS = int(os.getenv("STREAM_PROBE_CACHE_TTL", "600"))
+PROBE_MAX_WORKERS = 4
+
+PROBE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://multiembed.mov/"
+}
+
+# Measurements per CDN host: { host: (timestamp, measurement_dict) }
+_host_cache = {}
+_host_cache_lock = threading.Lock()
+metrics.register_cache("cdn_probe", _host_cache)
+
+
+def _timed_get(url, max_bytes, timeout):
+    """GET `url`, returning (body, ttfb_seconds, total_seconds) for at most `max_bytes`."""
+    headers = dict(PROBE_HEADERS)
+    headers["Range"] = f"bytes=0-{max_bytes - 1}"
+    start = time.monotonic()
+    response = tracing.get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        body = b''
+        ttfb = None
+        for chunk in response.iter_content(16384):
+            if ttfb is None:
+                ttfb = time.monotonic() - start
+            body += chunk
+            if len(body) >= max_bytes:
+                break
+        total = time.monotonic() - start
+        return body, (ttfb if ttfb is not None else total), total
+    finally:
+        response.close()
+
+
+def _first_segment_url(manifest_url, timeout):
+    """Follow a master playlist to its first variant and return its first segment URL."""
+    body, ttfb, _ = _timed_get(manifest_url, 256 * 1024, timeout)
+    playlist = parse_playlist(body.decode('utf-8', errors='ignore'), manifest_url)
+    if playlist["is_master"]:
+        variant_url = playlist["variants"][0]["url"]
+        body, _, _ = _timed_get(variant_url, 256 * 1024, timeout)
+        playlist = parse_playlist(body.decode('utf-8', errors='ignore'), variant_url)
+    segments = playlist["segments"]
+    return (segments[0] if segments else None), ttfb
+
+
+def probe_stream(url, timeout=PROBE_TIMEOUT_SECONDS):
+    """
+    Measure delivery speed of a stream candidate
+
+    For HLS the first media segment is downloaded, for anything else the first
+    `PROBE_MAX_BYTES` of the file itself.
+
+    Args:
+        url (str): Manifest or media URL
+        timeout (float): Per-request timeout in seconds
+
+    Returns:
+        dict: {'ok': bool, 'ttfb': float, 'throughput_bps': float, 'bytes': int}
+    """
+    try:
+        manifest_ttfb = None
+        media_url = url
+        if '.m3u8' in url.lower():
+            media_url, manifest_ttfb = _first_segment_url(url, timeout)
+            if not media_url:
+                return {"ok": False, "error": "Playlist has no segments"}
+
+        body, ttfb, total = _timed_get(media_url, PROBE_MAX_BYTES, timeout)
+        transfer = max(total - ttfb, 1e-3)
+        return {
+            "ok": bool(body),
+            "ttfb": round(manifest_ttfb if manifest_ttfb is not None else ttfb, 4),
+            "segment_ttfb": round(ttfb, 4),
+            "throughput_bps": round(len(body) / transfer, 1),
+            "bytes": len(body),
+            "measured_at": time.time()
+        }
+    except Exception as e:
+        logger.debug(f"Probe failed for {url}: {str(e)}")
+        return {"ok": False, "error": str(e), "measured_at": time.time()}
+
+
+def get_host_measurement(url):
+    """Return the cached measurement for the CDN host of `url`, if still fresh."""
+    host = urlparse(url).netloc
+    with _host_cache_lock:
+        cached = _host_cache.get(host)
+    if cached and time.time() - cached[0] < PROBE_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+def _probe_host(url, timeout=PROBE_TIMEOUT_SECONDS):
+    measurement = get_host_measurement(url)
+    if measurement is not None:
+        metrics.cache_event("cdn_probe", "hit")
+        return measurement
+    metrics.cache_event("cdn_probe", "miss")
+    measurement = probe_stream(url, timeout)
+    with _host_cache_lock:
+        _host_cache[urlparse(url).netloc] = (time.time(), measurement)
+    return measurement
+
+
+def _score(measurement):
+    # Failed probes sort last, then highest throughput, then fastest first byte
+    if not measurement or not measurement.get("ok"):
+        return (1, 0, float('inf'))
+    return (0, -measurement["throughput_bps"], measurement["ttfb"])
+
+
+def rank_candidates(urls, max_workers=PROBE_MAX_WORKERS, timeout=PROBE_TIMEOUT_SECONDS):
+    """
+    Probe candidate stream URLs in parallel and order them by delivery speed
+
+    Candidates on the same CDN host share one measurement. The input order is
+    kept as the tie-breaker, so callers can pre-sort by their own heuristics.
+    Measurements are cached per host, where source_health.score_candidate
+    picks them up.
+
+    Args:
+        urls (list): Candidate manifest/media URLs
+        timeout (float): Per-request timeout of each probe
+
+    Returns:
+        list: [(url, measurement_dict)] best first
+    """
+    unique = list(dict.fromkeys(u for u in urls if u))
+    if len(unique) < 2:
+        return [(u, get_host_measurement(u)) for u in unique]
+
+    # One probe per host, using that host's first candidate
+    per_host = {}
+    for u in unique:
+        per_host.setdefault(urlparse(u).netloc, u)
+
+    measurements = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(per_host))) as executor:
+        futures = {executor.submit(tracing.bind(_probe_host), u, timeout): host for host, u in per_host.items()}
+        for future in concurrent.futures.as_completed(futures):
+            measurements[futures[future]] = future.result()
+
+    ranked = sorted(
+        enumerate(unique),
+        key=lambda item: (_score(measurements.get(urlparse(item[1]).netloc)), item[0])
+    )
+    return [(u, measurements.get(urlparse(u).netloc)) for _, u in ranked]
+
+
+def get_probe_cache_stats():
+    """Snapshot of cached per-host measurements."""
+    with _host_cache_lock:
+        return {host: dict(m, cached_at=ts) for host, (ts, m) in _host_cache.items()}
@@ -0,0 +1,94 @@
+import os
+import time
+
+# Total time one /api/stream request may spend resolving
+STREAM_REQUEST_BUDGET_SECONDS = float(os.getenv("STREAM_REQUEST_BUDGET", "20"))
+# Outbound calls are not worth starting with less time than this left
+MIN_CALL_TIMEOUT_SECONDS = 0.5
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage is started after the request's time budget ran out."""
+
+
+class Deadline:
+    """
+    Time budget for one request, handed down the resolution chain
+
+    Every outbound call derives its timeout from `timeout(cap)` so the
+    per-call limits can no longer stack past the budget. `Deadline(None)`
+    never expires, which keeps callers that pass no deadline on their old
+    per-call timeouts.
+    """
+
+    def __init__(self, budget_seconds=None, parent=None):
+        self.budget = budget_seconds
+        self.started = time.monotonic()
+        self.expires_at = None if budget_seconds is None else self.started + budget_seconds
+        self.parent = parent
+        self.cancelled = False
+
+    def child(self):
+        """Deadline with the same expiry that can be cancelled on its own, e.g. for a losing provider task."""
+        child = Deadline(None, parent=self)
+        child.budget = self.budget
+        child.started = self.started
+        child.expires_at = self.expires_at
+        return child
+
+    def sub(self, cap_seconds):
+        """Child deadline that also expires after `cap_seconds`, e.g. a per-provider timeout."""
+        child = self.child()
+        limit = time.monotonic() + cap_seconds
+        child.budget = cap_seconds if self.expires_at is None else min(cap_seconds, self.remaining())
+        child.expires_at = limit if self.expires_at is None else min(self.expires_at, limit)
+        return child
+
+    def cancel(self):
+        """Make every further `timeout()` call fail, so work that lost a race stops at its next request."""
+        self.cancelled = True
+
+    def is_cancelled(self):
+        return self.cancelled or (self.parent is not None and self.parent.is_cancelled())
+
+    def remaining(self):
+        if self.is_cancelled():
+            return 0.0
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.remaining() < MIN_CALL_TIMEOUT_SECONDS
+
+    def allows(self, seconds):
+        """True if at least `seconds` of budget is left, e.g. before an expensive stage."""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap):
+        """
+        Timeout for the next outbound call: `cap` or whatever is left, if less
+
+        Raises:
+            DeadlineExceeded: if too little budget is left to start the call
+        """
+        remaining = self.remaining()
+        if remaining < MIN_CALL_TIMEOUT_SECONDS:
+            raise DeadlineExceeded(f"Time budget of {self.budget}s exhausted")
+        return min(cap, remaining)
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget}, remaining={self.remaining():.2f})"
+
+
+def ensure_deadline(deadline):
+    """Return `deadline`, or an unbounded one when the caller passed None."""
+    return deadline if deadline is not None else Deadline(None)
+
+
+def request_deadline():
+    """New deadline sized for one /api/stream request."""
+    return Deadline(STREAM_REQUEST_BUDGET_SECONDS)
@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+
+from . import provider_stats
+from .deadline import Deadline, STREAM_REQUEST_BUDGET_SECONDS
+from .omdb_fetcher import validate_imdb_id
+from .providers import DIRECT_EMBED, providers_for
+from .resolver_pool import resolver_pool, ResolverSaturated
+from .stream_fetcher import check_direct_embed, iter_multiembed_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLES = {
+    "tt0111161": "The Shawshank Redemption",
+    "tt0068646": "The Godfather",
+    "tt0468569": "The Dark Knight",
+    "tt0108052": "Schindler's List",
+    "tt0167260": "The Lord of the Rings: The Return of the King"
+}
+# Comma-separated IMDb IDs checked by each run; defaults to a few well-known titles
+HEALTH_BENCHMARK_TITLES = [t.strip() for t in os.getenv("HEALTH_BENCHMARK_TITLES", "").split(",") if t.strip()]
+# Most titles one run accepts, including ?ids= overrides
+HEALTH_BENCHMARK_MAX_TITLES = 20
+# Provider checks run at once per run
+HEALTH_BENCHMARK_CONCURRENCY = int(os.getenv("HEALTH_BENCHMARK_CONCURRENCY", "4"))
+# Time budget shared by every check in one background run
+HEALTH_BENCHMARK_BUDGET_SECONDS = float(os.getenv("HEALTH_BENCHMARK_BUDGET", "60"))
+# Budget of a run the caller waits for; kept under the 30 s request timeout of most proxies in front
+HEALTH_BENCHMARK_SYNC_BUDGET_SECONDS = min(HEALTH_BENCHMARK_BUDGET_SECONDS,
+                                           float(os.getenv("HEALTH_BENCHMARK_SYNC_BUDGET", "20")))
+# Runs kept in memory for the summary
+HEALTH_BENCHMARK_HISTORY = int(os.getenv("HEALTH_BENCHMARK_HISTORY", "50"))
+# JSON lines file every run is appended to and history is reloaded from ("" = memory only)
+HEALTH_BENCHMARK_LOG = os.getenv("HEALTH_BENCHMARK_LOG", "health_benchmark.jsonl")
+# Seconds between scheduled runs in each worker process (0 = only on request)
+HEALTH_BENCHMARK_INTERVAL_SECONDS = float(os.getenv("HEALTH_BENCHMARK_INTERVAL", "0"))
+# Recent runs shown per provider and host, to spot regressions
+TREND_RUNS = 10
+
+_history = deque(maxlen=HEALTH_BENCHMARK_HISTORY)
+_history_loaded = False
+_run_lock = threading.Lock()
+_lock = threading.Lock()
+_state = {"running": None, "next_id": 1}
+_scheduler = None
+
+
+def default_titles():
+    return HEALTH_BENCHMARK_TITLES or list(DEFAULT_TITLES)
+
+
+def _load_history():
+    global _history_loaded
+    with _lock:
+        if _history_loaded:
+            return
+        _history_loaded = True
+        if not HEALTH_BENCHMARK_LOG or not os.path.exists(HEALTH_BENCHMARK_LOG):
+            return
+        try:
+            with open(HEALTH_BENCHMARK_LOG, encoding='utf-8') as f:
+                lines = deque(f, maxlen=HEALTH_BENCHMARK_HISTORY)
+            for line in lines:
+                try:
+                    _history.append(json.loads(line))
+                except ValueError:
+                    continue
+            if _history:
+                _state["next_id"] = max(run.get("id", 0) for run in _history) + 1
+        except OSError as e:
+            logger.warning(f"Could not read health benchmark history: {str(e)}")
+
+
+def _save(run):
+    if not HEALTH_BENCHMARK_LOG:
+        return
+    try:
+        with open(HEALTH_BENCHMARK_LOG, "a", encoding='utf-8') as f:
+            f.write(json.dumps(run) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write health benchmark run: {str(e)}")
+
+
+def _merge_raw(into, raw):
+    for kind in ("providers", "hosts"):
+        for name, e in raw.get(kind, {}).items():
+            entry = into[kind].setdefault(name, {"attempts": 0, "successes": 0, "samples": []})
+            entry["attempts"] += e["attempts"]
+            entry["successes"] += e["successes"]
+            entry["samples"].extend(e["samples"])
+
+
+def _stages():
+    # Every direct embed on its own, then the multiembed page with its iframe extractors
+    return providers_for(DIRECT_EMBED) + [None]
+
+
+def _check(imdb_id, provider, deadline):
+    """
+    Run one resolution stage for a title past the stream cache and time it
+
+    Args:
+        provider (Provider): A DIRECT_EMBED provider, or None for the multiembed stage
+
+    Returns:
+        tuple: (check dict, raw attempts recorded by the stage)
+    """
+    started = time.perf_counter()
+    with provider_stats.collect() as raw:
+        try:
+            if provider is not None:
+                result = check_direct_embed(provider, imdb_id, deadline.sub(provider.timeout)) \
+                    or {"success": False, "error": "No usable embed page"}
+            else:
+                # Every iframe is extracted, so each extractor is measured too
+                results = [r for r in iter_multiembed_results(imdb_id, 'auto', deadline.sub(STREAM_REQUEST_BUDGET_SECONDS))
+                           if r.get("success")]
+                result = next((r for r in results if r.get("type") != 'iframe'), None) \
+                    or (results[0] if results else {"success": False, "error": "Multiembed extraction failed"})
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+    return {
+        "stage": provider.name if provider is not None else "multiembed",
+        "success": bool(result.get("success")),
+        "seconds": round(time.perf_counter() - started, 3),
+        "source": result.get("source"),
+        "type": result.get("type") if result.get("success") else None,
+        "error": result.get("error"),
+        "result": result
+    }, raw
+
+
+def _title_outcome(imdb_id, checks, skipped):
+    """
+    Combine the checks of one title
+
+    A direct stream beats an embed page; the title's time is that of its
+    fastest working check, what racing the stages would have taken.
+    """
+    outcome = {"imdb_id": imdb_id, "movie": DEFAULT_TITLES.get(imdb_id, imdb_id),
+               "checks": [{k: c[k] for k in ("stage", "success", "seconds", "type")} for c in checks]}
+    if skipped:
+        outcome["skipped_checks"] = skipped
+    if not checks:
+        outcome.update({"success": False, "skipped": True, "error": "Resolver saturated or out of time"})
+        return outcome
+    working = sorted((c for c in checks if c["success"]), key=lambda c: c["seconds"])
+    best = next((c for c in working if c["type"] != 'iframe'), working[0] if working else None)
+    outcome.update({
+        "success": best is not None,
+        "seconds": working[0]["seconds"] if working else max(c["seconds"] for c in checks),
+        "source": best["source"] if best else None,
+        "type": best["type"] if best else None,
+        "error": None if best else checks[-1]["error"],
+        "result": best["result"] if best else {"success": False, "error": checks[-1]["error"]}
+    })
+    return outcome
+
+
+def _run(run_id, imdb_ids, budget):
+    deadline = Deadline(budget)
+    work = queue.Queue()
+    # Title by title, so a run cut short still has every provider measured on the first titles
+    for imdb_id in imdb_ids:
+        for provider in _stages():
+            work.put((imdb_id, provider))
+    checks = {imdb_id: [] for imdb_id in imdb_ids}
+    skipped = {imdb_id: 0 for imdb_id in imdb_ids}
+    raw = {"providers": {}, "hosts": {}}
+    raw_lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                imdb_id, provider = work.get_nowait()
+            except queue.Empty:
+                return
+            if deadline.expired():
+                with raw_lock:
+                    skipped[imdb_id] += 1
+                continue
+            check, check_raw = _check(imdb_id, provider, deadline)
+            with raw_lock:
+                checks[imdb_id].append(check)
+                _merge_raw(raw, check_raw)
+
+    started_at = time.time()
+    started = time.perf_counter()
+    futures = []
+    for _ in range(min(HEALTH_BENCHMARK_CONCURRENCY, work.qsize())):
+        try:
+            futures.append(resolver_pool.submit(worker))
+        except ResolverSaturated:
+            break
+    if futures:
+        concurrent.futures.wait(futures, timeout=deadline.remaining())
+
+    with raw_lock:
+        # Whatever no worker got to, e.g. when the pool was saturated
+        while True:
+            try:
+                imdb_id, _ = work.get_nowait()
+            except queue.Empty:
+                break
+            skipped[imdb_id] += 1
+        titles = [_title_outcome(imdb_id, list(checks[imdb_id]), skipped[imdb_id]) for imdb_id in imdb_ids]
+    types = {}
+    for title in titles:
+        kind = title.get("type") or "none"
+        types[kind] = types.get(kind, 0) + 1
+    checked = [t for t in titles if not t.get("skipped")]
+    return {
+        "id": run_id,
+        "started_at": started_at,
+        "seconds": round(time.perf_counter() - started, 3),
+        "titles": titles,
+        "types": types,
+        "summary": provider_stats.summarize(
+            len(checked), sum(1 for t in checked if t["success"]), [t["seconds"] for t in checked]
+        ),
+        "raw": raw
+    }
+
+
+def run_benchmark(imdb_ids=None, budget=HEALTH_BENCHMARK_BUDGET_SECONDS):
+    """
+    Check every provider on a set of titles concurrently, bypassing the stream cache, and keep the outcome
+
+    Args:
+        imdb_ids (list): IMDb IDs to check; defaults to HEALTH_BENCHMARK_TITLES
+        budget (float): Seconds the whole run may take
+
+    Returns:
+        dict: The run, or None if another run is in progress in this process
+    """
+    _load_history()
+    imdb_ids = [i for i in dict.fromkeys(imdb_ids or default_titles()) if validate_imdb_id(i)]
+    imdb_ids = imdb_ids[:HEALTH_BENCHMARK_MAX_TITLES]
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        with _lock:
+            run_id = _state["next_id"]
+            _state["next_id"] += 1
+            _state["running"] = {"id": run_id, "titles": imdb_ids, "started_at": time.time()}
+        run = _run(run_id, imdb_ids, budget)
+        with _lock:
+            _history.append(run)
+        _save(run)
+        logger.info(f"Health benchmark run {run_id}: {run['summary']['successes']}/{len(imdb_ids)} titles resolved "
+                    f"in {run['seconds']:.1f}s")
+        return run
+    finally:
+        with _lock:
+            _state["running"] = None
+        _run_lock.release()
+
+
+def start_benchmark(imdb_ids=None):
+    """
+    Start a run in the background
+
+    Returns:
+        bool: False if a run is already in progress
+    """
+    if _run_lock.locked():
+        return False
+    threading.Thread(target=run_benchmark, args=(imdb_ids,), daemon=True, name="health-benchmark").start()
+    return True
+
+
+def _schedule_loop():
+    while True:
+        time.sleep(HEALTH_BENCHMARK_INTERVAL_SECONDS)
+        try:
+            run_benchmark()
+        except Exception as e:
+            logger.warning(f"Scheduled health benchmark failed: {str(e)}")
+
+
+def schedule():
+    """Start periodic runs if HEALTH_BENCHMARK_INTERVAL is set; safe to call more than once"""
+    global _scheduler
+    if HEALTH_BENCHMARK_INTERVAL_SECONDS <= 0:
+        return False
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_schedule_loop, daemon=True, name="health-benchmark-schedule")
+            _scheduler.start()
+    return True
+
+
+def public_run(run):
+    """A run as served by the API, without the raw samples"""
+    stats = {
+        kind: {name: provider_stats.summarize(e["attempts"], e["successes"], e["samples"])
+               for name, e in sorted(table.items())}
+        for kind, table in run["raw"].items()
+    }
+    return {**{key: value for key, value in run.items() if key != "raw"}, **stats}
+
+
+def get_benchmark_summary(runs=None):
+    """
+    Aggregate the kept runs per provider and per host
+
+    Args:
+        runs (int): Only use the most recent `runs` runs
+
+    Returns:
+        dict: Overall and per provider/host success rate and latency, stream
+              types, and each provider's success rate over the last runs
+    """
+    _load_history()
+    with _lock:
+        history = list(_history)
+        running = dict(_state["running"]) if _state["running"] else None
+    if runs:
+        history = history[-runs:]
+
+    raw = {"providers": {}, "hosts": {}}
+    types = {}
+    title_samples = []
+    title_successes = 0
+    for run in history:
+        _merge_raw(raw, run["raw"])
+        for kind, count in run.get("types", {}).items():
+            types[kind] = types.get(kind, 0) + count
+        for title in run["titles"]:
+            if not title.get("skipped"):
+                title_samples.append(title["seconds"])
+                title_successes += 1 if title["success"] else 0
+
+    recent = history[-TREND_RUNS:]
+
+    def trend(kind, name):
+        rates = []
+        for run in recent:
+            e = run["raw"].get(kind, {}).get(name)
+            rates.append(round(e["successes"] / e["attempts"], 3) if e and e["attempts"] else None)
+        return rates
+
+    return {
+        "runs": len(history),
+        "running": running,
+        "titles": default_titles(),
+        "latest": public_run(history[-1]) if history else None,
+        "overall": provider_stats.summarize(len(title_samples), title_successes, title_samples),
+        "types": types,
+        "trend_runs": [run["id"] for run in recent],
+        **{
+            kind: {
+                name: {**provider_stats.summarize(e["attempts"], e["successes"], e["samples"]),
+                       "trend": trend(kind, name)}
+                for name, e in sorted(table.items())
+            }
+            for kind, table in raw.items()
+        }
+    }
@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import logging
+import threading
+from urllib.parse import urljoin
+
+
+from .deadline import ensure_deadline
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_CACHE_TTL_SECONDS = int(os.getenv("HLS_MANIFEST_CACHE_TTL", "300"))
+MANIFEST_CACHE_MAX_ENTRIES = 512
+MANIFEST_FETCH_TIMEOUT = 5
+MANIFEST_MAX_BYTES = 512 * 1024
+
+MANIFEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://multiembed.mov/"
+}
+
+# Matches KEY=VALUE pairs in an attribute list, where VALUE may be a quoted string
+_ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+# Parsed ladders per manifest URL: { url: (timestamp, variants) }
+_manifest_cache = {}
+_manifest_cache_lock = threading.Lock()
+metrics.register_cache("hls_manifest", _manifest_cache)
+
+
+def parse_attributes(attribute_list):
+    """Parse an HLS attribute list (e.g. 'BANDWIDTH=800000,CODECS="avc1,mp4a"') into a dict"""
+    return {
+        key: value.strip('"')
+        for key, value in _ATTRIBUTE_PATTERN.findall(attribute_list)
+    }
+
+
+def parse_playlist(text, base_url):
+    """
+    Parse an M3U8 playlist
+
+    Args:
+        text (str): Playlist body
+        base_url (str): URL the playlist was fetched from, for resolving relative URIs
+
+    Returns:
+        dict: {'is_master': bool, 'variants': list, 'segments': list}
+    """
+    variants = []
+    segments = []
+    pending_variant = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending_variant = parse_attributes(line.split(':', 1)[1])
+        elif line.startswith('#'):
+            continue
+        elif pending_variant is not None:
+            variants.append(_format_variant(pending_variant, urljoin(base_url, line)))
+            pending_variant = None
+        else:
+            segments.append(urljoin(base_url, line))
+
+    return {
+        "is_master": bool(variants),
+        "variants": variants,
+        "segments": segments
+    }
+
+
+def _format_variant(attributes, url):
+    width = height = None
+    resolution = attributes.get('RESOLUTION')
+    if resolution and 'x' in resolution:
+        try:
+            width, height = (int(v) for v in resolution.lower().split('x', 1))
+        except ValueError:
+            width = height = None
+
+    def _int(key):
+        try:
+            return int(attributes[key])
+        except (KeyError, ValueError):
+            return None
+
+    frame_rate = attributes.get('FRAME-RATE')
+    return {
+        "url": url,
+        "bandwidth": _int('BANDWIDTH'),
+        "average_bandwidth": _int('AVERAGE-BANDWIDTH'),
+        "resolution": resolution,
+        "width": width,
+        "height": height,
+        "codecs": attributes.get('CODECS'),
+        "frame_rate": float(frame_rate) if frame_rate and re.match(r'^[\d.]+$', frame_rate) else None,
+        "label": f"{height}p" if height else None
+    }
+
+
+def fetch_rendition_ladder(manifest_url, deadline=None):
+    """
+    Fetch a master playlist and return its variants, cached per URL
+
+    Variants are ordered by ascending bandwidth, which is the level order
+    hls.js uses, so list positions can be used as hls.js level indices.
+
+    Args:
+        manifest_url (str): Master playlist URL
+        deadline (Deadline): Request time budget; caps the fetch timeout
+
+    Returns:
+        list: Variant dicts (empty for media playlists or on failure)
+    """
+    now = time.time()
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(manifest_url)
+    if cached and now - cached[0] < MANIFEST_CACHE_TTL_SECONDS:
+        metrics.cache_event("hls_manifest", "hit")
+        return cached[1]
+    metrics.cache_event("hls_manifest", "miss")
+
+    variants = []
+    try:
+        timeout = ensure_deadline(deadline).timeout(MANIFEST_FETCH_TIMEOUT)
+        response = tracing.get(manifest_url, headers=MANIFEST_HEADERS, timeout=timeout, stream=True)
+        try:
+            if response.status_code == 200:
+                body = b''
+                for chunk in response.iter_content(16384):
+                    body += chunk
+                    if len(body) >= MANIFEST_MAX_BYTES:
+                        break
+                text = body.decode('utf-8', errors='ignore')
+                if text.lstrip().startswith('#EXTM3U'):
+                    variants = parse_playlist(text, response.url or manifest_url)["variants"]
+                    variants.sort(key=lambda v: v["bandwidth"] or 0)
+        finally:
+            response.close()
+    except Exception as e:
+        logger.debug(f"Rendition ladder fetch failed for {manifest_url}: {str(e)}")
+        return []
+
+    with _manifest_cache_lock:
+        if len(_manifest_cache) >= MANIFEST_CACHE_MAX_ENTRIES:
+            oldest = min(_manifest_cache, key=lambda k: _manifest_cache[k][0])
+            del _manifest_cache[oldest]
+            metrics.cache_event("hls_manifest", "eviction")
+        _manifest_cache[manifest_url] = (now, variants)
+    return variants
+
+
+def attach_variants(stream_data, deadline=None):
+    """Add the parsed rendition ladder to an HLS stream result in place"""
+    url = stream_data.get('stream_url') or stream_data.get('m3u8')
+    if not url or '.m3u8' not in url.lower() or 'variants' in stream_data:
+        return stream_data
+
+    variants = fetch_rendition_ladder(url, deadline)
+    if variants:
+        stream_data['variants'] = variants
+    return stream_data
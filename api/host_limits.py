@@ -0,0 +1,99 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .deadline import ensure_deadline
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Concurrent resolver requests allowed against one upstream host, per worker process
+HOST_MAX_CONCURRENCY = int(os.getenv("HOST_MAX_CONCURRENCY", "8"))
+# Requests per second allowed against one upstream host, per worker process (0 = unlimited)
+HOST_RATE_PER_SECOND = float(os.getenv("HOST_RATE_PER_SECOND", "0"))
+# Longest a request waits for a host slot, further capped by its deadline
+HOST_SLOT_WAIT_SECONDS = 2.0
+
+# { host: BoundedSemaphore }
+_host_semaphores = {}
+metrics.register_cache("host_limits", _host_semaphores)
+# { host: requests currently holding a slot }
+_host_active = {}
+# { host: monotonic time the next request may start } when rate limited
+_host_next_start = {}
+_lock = threading.Lock()
+
+
+class HostBusy(RuntimeError):
+    """Raised when an upstream host's concurrency cap or rate limit would make the caller wait too long."""
+
+
+def set_rate(requests_per_second):
+    """Change the per-host request rate, e.g. to split a budget across worker processes."""
+    global HOST_RATE_PER_SECOND
+    HOST_RATE_PER_SECOND = max(0.0, requests_per_second)
+
+
+def _reserve_start(host):
+    # Returns how long to sleep before this request may start
+    if not HOST_RATE_PER_SECOND:
+        return 0.0
+    now = time.monotonic()
+    with _lock:
+        start = max(now, _host_next_start.get(host, now))
+        _host_next_start[host] = start + 1.0 / HOST_RATE_PER_SECOND
+    return start - now
+
+
+def _semaphore(host):
+    with _lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(HOST_MAX_CONCURRENCY)
+        return semaphore
+
+
+@contextmanager
+def host_slot(url, deadline=None):
+    """
+    Hold one of the concurrency slots of the host of `url`
+
+    Args:
+        url (str): URL about to be requested
+        deadline (Deadline): Request time budget; bounds the wait for a slot
+
+    Raises:
+        HostBusy: if no slot frees up in time
+    """
+    host = urlparse(url).netloc.lower()
+    deadline = ensure_deadline(deadline)
+    semaphore = _semaphore(host)
+    with tracing.span("host_slot", host=host):
+        if not semaphore.acquire(timeout=min(HOST_SLOT_WAIT_SECONDS, deadline.remaining())):
+            raise HostBusy(f"{host} is at its limit of {HOST_MAX_CONCURRENCY} concurrent requests")
+        delay = _reserve_start(host)
+        if delay > deadline.remaining():
+            semaphore.release()
+            raise HostBusy(f"{host} is rate limited to {HOST_RATE_PER_SECOND}/s")
+        if delay:
+            time.sleep(delay)
+    with _lock:
+        _host_active[host] = _host_active.get(host, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _host_active[host] -= 1
+        semaphore.release()
+
+
+def get_host_stats():
+    with _lock:
+        return {
+            "max_per_host": HOST_MAX_CONCURRENCY,
+            "rate_per_host": HOST_RATE_PER_SECOND,
+            "active": {host: count for host, count in _host_active.items() if count}
+        }
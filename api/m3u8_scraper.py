@@ -3,9 +3,17 @@ import re
 import time
 from urllib.parse import urljoin, urlparse
 
+from .cdn_probe import STREAM_PROBE_ENABLED, rank_candidates
+from .deadline import ensure_deadline
+from . import tracing
+
+# A browser run is pointless with less budget than this: launch alone takes seconds
+PLAYWRIGHT_MIN_BUDGET_SECONDS = 12
+
 logger = logging.getLogger(__name__)
 
-def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
+@tracing.traced("playwright")
+def extract_m3u8_playwright(imdb_id, source='auto', timeout=30, deadline=None):
     """
     Extract M3U8 stream URL using Playwright for dynamic content
     
@@ -13,15 +21,30 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
         imdb_id (str): IMDb ID
         source (str): Preferred source
         timeout (int): Timeout in seconds
+        deadline (Deadline): Request time budget; the browser is skipped if too little is left
     
     Returns:
         dict: Result with success status and M3U8 URL or error
     """
+    deadline = ensure_deadline(deadline)
+    if not deadline.allows(PLAYWRIGHT_MIN_BUDGET_SECONDS):
+        logger.info(f"Skipping Playwright for {imdb_id}: only {deadline.remaining():.1f}s of budget left")
+        return {
+            "success": False,
+            "error": "Skipped browser extraction: insufficient time budget"
+        }
+    timeout = min(timeout, deadline.remaining())
+
+    # Browser waits are in milliseconds and capped by what is left of the budget
+    def budget_ms(cap_ms):
+        return max(1, int(min(cap_ms, deadline.remaining() * 1000)))
+
     logger.info(f"Extracting M3U8 using Playwright for IMDb ID: {imdb_id}")
     
     try:
         from playwright.sync_api import sync_playwright, TimeoutError
         
+        tracing.stage("launch")
         with sync_playwright() as p:
             browser = p.chromium.launch(
                 headless=True,
@@ -64,10 +87,11 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
             multiembed_url = f"https://multiembed.mov/movie/imdb/{imdb_id}"
             logger.info(f"Navigating to: {multiembed_url}")
             
-            page.goto(multiembed_url, wait_until="domcontentloaded", timeout=timeout * 1000)
+            tracing.stage("goto", url=multiembed_url)
+            page.goto(multiembed_url, wait_until="domcontentloaded", timeout=int(timeout * 1000))
             
             # Wait for initial content to load
-            page.wait_for_timeout(3000)
+            page.wait_for_timeout(budget_ms(3000))
             
             # Look for video iframes and interact with them
             iframe_selectors = [
@@ -87,6 +111,8 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                     iframes = page.query_selector_all(selector)
                     
                     for iframe in iframes:
+                        if deadline.expired():
+                            break
                         iframe_src = iframe.get_attribute('src')
                         if iframe_src and iframe_src not in processed_iframes:
                             processed_iframes.add(iframe_src)
@@ -98,16 +124,17 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                                 iframe_src = urljoin(multiembed_url, iframe_src)
                             
                             logger.info(f"Processing iframe: {iframe_src}")
+                            tracing.stage("iframe", url=iframe_src)
                             
                             # Open iframe in new page
                             iframe_page = context.new_page()
                             iframe_page.on("response", handle_response)
                             
                             try:
-                                iframe_page.goto(iframe_src, wait_until="domcontentloaded", timeout=20000)
+                                iframe_page.goto(iframe_src, wait_until="domcontentloaded", timeout=budget_ms(20000))
                                 
                                 # Wait for page to load
-                                iframe_page.wait_for_timeout(3000)
+                                iframe_page.wait_for_timeout(budget_ms(3000))
                                 
                                 # Try to find and interact with video elements
                                 video_selectors = [
@@ -147,7 +174,7 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                                 
                                 for play_selector in play_selectors:
                                     try:
-                                        play_button = iframe_page.wait_for_selector(play_selector, timeout=3000)
+                                        play_button = iframe_page.wait_for_selector(play_selector, timeout=budget_ms(3000))
                                         if play_button and play_button.is_visible():
                                             play_button.click()
                                             logger.info(f"Clicked play button: {play_selector}")
@@ -159,7 +186,7 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                                         continue
                                 
                                 # Wait for video to load and network requests
-                                iframe_page.wait_for_timeout(5000)
+                                iframe_page.wait_for_timeout(budget_ms(5000))
                                 
                                 # Check for any additional M3U8 URLs in page content
                                 content = iframe_page.content()
@@ -191,7 +218,8 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                     break
             
             # Additional wait for any delayed M3U8 requests
-            page.wait_for_timeout(2000)
+            tracing.stage("settle", found=len(m3u8_links))
+            page.wait_for_timeout(budget_ms(2000))
             
             # Filter and return the best M3U8 URL
             if m3u8_links:
@@ -204,11 +232,22 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
                 ))
                 
                 best_link = m3u8_links[0]
+                probe = None
+
+                # Optionally re-rank by measured delivery speed of each CDN
+                if STREAM_PROBE_ENABLED and len(m3u8_links) > 1:
+                    tracing.stage("probe", candidates=len(m3u8_links))
+                    ranked = rank_candidates([link['url'] for link in m3u8_links])
+                    if ranked and ranked[0][1] and ranked[0][1].get('ok'):
+                        best_url, probe = ranked[0]
+                        best_link = next(link for link in m3u8_links if link['url'] == best_url)
+
                 logger.info(f"Selected best M3U8 URL: {best_link['url']}")
                 
                 return {
                     "success": True,
                     "m3u8": best_link['url'],
+                    "probe": probe,
                     "stream_type": "hls",
                     "source": "playwright",
                     "quality": "HD",
@@ -235,25 +274,3 @@ def extract_m3u8_playwright(imdb_id, source='auto', timeout=30):
             "success": False,
             "error": f"Playwright extraction failed: {str(e)}"
         }
-
-def validate_m3u8_url(url):
-    """Validate if a URL is a working M3U8 stream"""
-    try:
-        import requests
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://multiembed.mov/'
-        }
-        
-        response = requests.head(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            content_type = response.headers.get('content-type', '').lower()
-            return any(ct in content_type for ct in ['mpegurl', 'x-mpegurl', 'vnd.apple.mpegurl'])
-        
-        return False
-        
-    except Exception as e:
-        logger.debug(f"M3U8 validation failed for {url}: {str(e)}")
-        return False
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+from urllib.parse import urlparse
+
+
+from .deadline import ensure_deadline
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_CACHE_TTL_SECONDS = int(os.getenv("M3U8_VALIDATION_TTL", "120"))
+# Failures are often transient (rate limits, cold CDN edges), so forget them sooner
+VALIDATION_NEGATIVE_TTL_SECONDS = int(os.getenv("M3U8_VALIDATION_NEGATIVE_TTL", "30"))
+VALIDATION_CACHE_MAX_ENTRIES = 2048
+VALIDATION_TIMEOUT = 8
+VALIDATION_MAX_WORKERS = 4
+# Enough for a BOM, the magic line and some slack
+VALIDATION_PROBE_BYTES = 1024
+
+VALIDATION_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://multiembed.mov/"
+}
+
+# Memoized outcomes per URL: { url: (timestamp, bool) }
+_validation_cache = {}
+_validation_cache_lock = threading.Lock()
+metrics.register_cache("m3u8_validation", _validation_cache)
+
+
+def _cached_result(url):
+    with _validation_cache_lock:
+        cached = _validation_cache.get(url)
+    if not cached:
+        metrics.cache_event("m3u8_validation", "miss")
+        return None
+    checked_at, valid = cached
+    ttl = VALIDATION_CACHE_TTL_SECONDS if valid else VALIDATION_NEGATIVE_TTL_SECONDS
+    if time.time() - checked_at < ttl:
+        metrics.cache_event("m3u8_validation", "hit")
+        return valid
+    metrics.cache_event("m3u8_validation", "miss")
+    return None
+
+
+def _store_result(url, valid):
+    with _validation_cache_lock:
+        if len(_validation_cache) >= VALIDATION_CACHE_MAX_ENTRIES:
+            oldest = min(_validation_cache, key=lambda k: _validation_cache[k][0])
+            del _validation_cache[oldest]
+            metrics.cache_event("m3u8_validation", "eviction")
+        _validation_cache[url] = (time.time(), valid)
+
+
+def _fetch_is_m3u8(url, timeout):
+    headers = dict(VALIDATION_HEADERS)
+    headers["Range"] = f"bytes=0-{VALIDATION_PROBE_BYTES - 1}"
+    response = tracing.get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        # 206 when the origin honours Range, 200 when it ignores it
+        if response.status_code not in (200, 206):
+            return False
+        sample = b''
+        for chunk in response.iter_content(VALIDATION_PROBE_BYTES):
+            sample += chunk
+            if len(sample) >= VALIDATION_PROBE_BYTES:
+                break
+        text = sample.decode('utf-8', errors='ignore').lstrip('\ufeff \t\r\n')
+        return text.startswith('#EXTM3U')
+    finally:
+        response.close()
+
+
+def validate_m3u8_url(url, timeout=VALIDATION_TIMEOUT, deadline=None):
+    """
+    Validate if a URL is a working M3U8 playlist
+
+    Sends a single small ranged GET and checks for the #EXTM3U magic.
+    Results are memoized per URL.
+
+    Args:
+        url (str): URL to validate
+        timeout (float): Request timeout in seconds
+        deadline (Deadline): Request time budget; caps `timeout`
+
+    Returns:
+        bool: True if valid M3U8 URL
+    """
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            return False
+        if not parsed.path.lower().endswith('.m3u8'):
+            return False
+    except Exception:
+        return False
+
+    cached = _cached_result(url)
+    if cached is not None:
+        return cached
+
+    deadline = ensure_deadline(deadline)
+    if deadline.expired():
+        # Out of time is not evidence against the URL, so don't memoize it
+        return False
+
+    with tracing.span("validate", url=url) as span:
+        try:
+            valid = _fetch_is_m3u8(url, deadline.timeout(timeout))
+        except Exception as e:
+            logger.debug(f"M3U8 validation failed for {url}: {str(e)}")
+            valid = False
+        span["valid"] = valid
+
+    _store_result(url, valid)
+    return valid
+
+
+def validate_first(urls, timeout=VALIDATION_TIMEOUT, max_workers=VALIDATION_MAX_WORKERS, deadline=None):
+    """
+    Validate candidate URLs concurrently and return the first one that passes
+
+    Remaining validations are cancelled as soon as one succeeds. Cached
+    results are consulted first, so a URL already known to be valid wins
+    without any network call.
+
+    Args:
+        urls (list): Candidate M3U8 URLs
+        timeout (float): Per-request timeout in seconds
+        deadline (Deadline): Request time budget; caps `timeout`
+
+    Returns:
+        str: First valid URL or None
+    """
+    candidates = list(dict.fromkeys(u for u in urls if u))
+    pending = []
+    for url in candidates:
+        cached = _cached_result(url)
+        if cached:
+            return url
+        if cached is None:
+            pending.append(url)
+
+    if not pending:
+        return None
+    if len(pending) == 1:
+        return pending[0] if validate_m3u8_url(pending[0], timeout, deadline) else None
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending)))
+    try:
+        validate = tracing.bind(validate_m3u8_url)
+        futures = {executor.submit(validate, url, timeout, deadline): url for url in pending}
+        wait_for = deadline.remaining() if deadline is not None else None
+        for future in concurrent.futures.as_completed(futures, timeout=wait_for):
+            if future.result():
+                return futures[future]
+        return None
+    except concurrent.futures.TimeoutError:
+        return None
+    finally:
+        # Don't wait on losers; queued ones are dropped, running ones finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
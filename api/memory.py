@@ -0,0 +1,339 @@
+"""
+Memory diagnostics for long-running workers
+
+Reports process memory, the size of every registered in-process cache,
+live Playwright objects and browser processes, and open upstream
+connections, plus tracemalloc top allocators and diffs between named
+snapshots. Everything here runs only when an admin asks for it; the
+object counts walk the heap with gc, which takes a moment on big heaps.
+
+All numbers are per worker process.
+"""
+
+import os
+import gc
+import sys
+import time
+import logging
+import threading
+import itertools
+import tracemalloc
+from collections import Counter, OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Start tracemalloc at import with this many frames per allocation (0 = only on request)
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "0"))
+# Named snapshots kept for diffs; the oldest is dropped first
+MAX_SNAPSHOTS = 5
+DEFAULT_TOP = 25
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Playwright classes whose live instances are reported
+PLAYWRIGHT_CLASSES = ("Playwright", "Browser", "BrowserContext", "Page")
+# Child process names that belong to a browser run
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "headless_shell", "node")
+
+# { label: tracemalloc.Snapshot } in the order taken
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+# Suffix of default snapshot labels, so snapshots taken in the same millisecond stay apart
+_snapshot_ids = itertools.count(1)
+
+# Allocations of the diagnostics themselves are left out of every report
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _statm_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            size, resident = f.read().split()[:2]
+        page = os.sysconf("SC_PAGE_SIZE")
+        return {"vms_bytes": int(size) * page, "rss_bytes": int(resident) * page}
+    except (OSError, ValueError):
+        return {"vms_bytes": None, "rss_bytes": None}
+
+
+def open_descriptors():
+    """Open file descriptors and, of those, sockets; None for both where /proc is missing"""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return {"open_fds": None, "open_sockets": None}
+    sockets = 0
+    for fd in fds:
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            continue
+    return {"open_fds": len(fds), "open_sockets": sockets}
+
+
+def process_memory():
+    """RSS, virtual size, open file descriptors and gc state of this process"""
+    report = _statm_bytes()
+    report.update(open_descriptors())
+    report.update({
+        "threads": threading.active_count(),
+        "gc_counts": gc.get_count(),
+        "gc_objects": len(gc.get_objects())
+    })
+    return report
+
+
+def _child_processes():
+    """Descendant processes of this worker by name, read from /proc"""
+    parents = {}
+    names = {}
+    try:
+        pids = [p for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The name is in parentheses and may contain spaces
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        parents[int(pid)] = int(stat[stat.rindex(")") + 2:].split()[1])
+        names[int(pid)] = name
+    descendants = Counter()
+    own = {os.getpid()}
+    # Walk down level by level; process trees here are shallow
+    while True:
+        level = {pid for pid, ppid in parents.items() if ppid in own and pid not in own}
+        if not level:
+            break
+        own |= level
+        descendants.update(names[pid] for pid in level)
+    return dict(descendants)
+
+
+def live_objects():
+    """
+    Live Playwright objects and open upstream responses, counted on the heap
+
+    An HTTP response whose body was never read to the end or closed keeps
+    its socket; they usually come from generators that were dropped.
+    """
+    playwright = Counter()
+    responses = {"requests_open": 0, "urllib3_open": 0}
+    for obj in gc.get_objects():
+        cls = type(obj)
+        module = cls.__module__
+        if not isinstance(module, str):
+            # Some extension metaclasses expose __module__ as a descriptor
+            continue
+        if module.startswith("playwright.") and cls.__name__ in PLAYWRIGHT_CLASSES:
+            if cls.__name__ == "Browser" and not _safe(lambda: obj.is_connected(), True):
+                continue
+            if cls.__name__ == "Page" and _safe(lambda: obj.is_closed(), False):
+                continue
+            playwright[cls.__name__] += 1
+        elif module == "urllib3.response" and cls.__name__ == "HTTPResponse":
+            if getattr(obj, "_fp", None) is not None and not _safe(lambda: obj.closed, True):
+                responses["urllib3_open"] += 1
+        elif module == "requests.models" and cls.__name__ == "Response":
+            raw = getattr(obj, "raw", None)
+            if raw is not None and not getattr(obj, "_content_consumed", True) \
+                    and not _safe(lambda: raw.closed, True):
+                responses["requests_open"] += 1
+    children = _child_processes()
+    return {
+        "playwright": {name: playwright.get(name, 0) for name in PLAYWRIGHT_CLASSES},
+        "browser_processes": {name: count for name, count in children.items()
+                              if any(part in name.lower() for part in BROWSER_PROCESS_NAMES)},
+        "child_processes": sum(children.values()),
+        "upstream_responses": responses
+    }
+
+
+def _safe(read, default):
+    try:
+        return read()
+    except Exception:
+        return default
+
+
+def _deep_size(obj, seen):
+    # Rough: follows dicts, lists, tuples, sets and plain object attributes
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+def cache_report(deep=False):
+    """
+    Entries per registered cache and, with `deep`, their approximate size in bytes
+
+    Caches register with metrics.register_cache; deep sizes walk every entry.
+    """
+    report = {}
+    for name, contents in sorted(metrics.registered_caches().items()):
+        row = {"entries": len(contents)}
+        if deep:
+            # Copied first; other threads keep writing while this walks
+            row["approx_bytes"] = _safe(lambda: _deep_size(contents.copy(), set()), None)
+        report[name] = row
+    return report
+
+
+# ---------- tracemalloc ----------
+
+def start_tracing(frames=10):
+    """Start tracemalloc with `frames` frames per allocation; a no-op if already tracing"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(max(1, min(int(frames), 100)))
+    logger.info(f"tracemalloc started with {tracemalloc.get_traceback_limit()} frames")
+    return True
+
+
+def stop_tracing():
+    """Stop tracemalloc and drop stored snapshots, which refer to its traces"""
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+    return True
+
+
+def tracing_status():
+    with _lock:
+        labels = list(_snapshots)
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "snapshots": labels}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "snapshots": labels
+    }
+
+
+def _stat_row(stat, group_by):
+    row = {"bytes": stat.size, "count": stat.count}
+    if group_by == "traceback":
+        row["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    else:
+        frame = stat.traceback[0]
+        row["where"] = frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+    return row
+
+
+def _diff_row(stat, group_by):
+    row = _stat_row(stat, group_by)
+    row.update({"bytes_diff": stat.size_diff, "count_diff": stat.count_diff})
+    return row
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def top_allocators(limit=DEFAULT_TOP, group_by="lineno"):
+    """
+    Biggest live allocation sites right now
+
+    Returns:
+        list: Rows with bytes, count and where (or traceback), or None if not tracing
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    group_by = group_by if group_by in GROUP_BY else "lineno"
+    return [_stat_row(stat, group_by) for stat in _snapshot().statistics(group_by)[:limit]]
+
+
+def take_snapshot(label=None):
+    """
+    Store a snapshot under `label` (default: a unique timestamp) for later diffs
+
+    Returns:
+        str: The label, or None if tracemalloc is not tracing
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = _snapshot()
+    with _lock:
+        if not label:
+            now = time.time()
+            label = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now % 1 * 1000):03d}-{next(_snapshot_ids)}"
+        _snapshots.pop(label, None)
+        _snapshots[label] = snapshot
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return label
+
+
+def diff_snapshots(older=None, newer=None, limit=DEFAULT_TOP, group_by="lineno"):
+    """
+    What grew between two stored snapshots
+
+    Args:
+        older (str): Label of the baseline; defaults to the second newest
+        newer (str): Label to compare; defaults to the newest, or a fresh
+                     snapshot when only one is stored
+
+    Returns:
+        dict: {'from', 'to', 'bytes_diff', 'top'}, or None if the snapshots are missing
+    """
+    group_by = group_by if group_by in GROUP_BY else "lineno"
+    with _lock:
+        labels = list(_snapshots)
+        snapshots = dict(_snapshots)
+    if newer is None and older is None and len(labels) == 1 and tracemalloc.is_tracing():
+        older, newer = labels[0], take_snapshot()
+        with _lock:
+            snapshots[newer] = _snapshots.get(newer)
+    newer = newer or (labels[-1] if labels else None)
+    if older is None:
+        earlier = [label for label in labels if label != newer]
+        older = earlier[-1] if earlier else None
+    if older == newer or snapshots.get(older) is None or snapshots.get(newer) is None:
+        return None
+    stats = snapshots[newer].compare_to(snapshots[older], group_by)
+    return {
+        "from": older,
+        "to": newer,
+        "bytes_diff": sum(stat.size_diff for stat in stats),
+        "top": [_diff_row(stat, group_by) for stat in stats[:limit]]
+    }
+
+
+def get_memory_report(deep=False, top=DEFAULT_TOP, group_by="lineno"):
+    """Everything above in one dict, for the admin endpoint"""
+    from .bandwidth import proxy_scheduler
+    return {
+        "pid": os.getpid(),
+        "process": process_memory(),
+        "caches": cache_report(deep),
+        "objects": live_objects(),
+        "proxy_streams": proxy_scheduler.get_stats()["global"]["active_streams"],
+        "tracemalloc": tracing_status(),
+        "top_allocators": top_allocators(top, group_by)
+    }
+
+
+if MEMORY_TRACEMALLOC_FRAMES > 0:
+    start_tracing(MEMORY_TRACEMALLOC_FRAMES)
@@ -0,0 +1,230 @@
+"""
+Process-wide metrics exposed in the Prometheus text format
+
+Counters, gauges and histograms are plain dicts behind a lock, so an
+update costs a lookup and an addition and the registry can stay on in
+production. Values that already live elsewhere (pool queue depth, proxy
+streams, cache sizes) are read by collectors at scrape time instead of
+being mirrored on every change.
+
+Every gunicorn worker keeps its own registry; scrape each worker or sum
+the series across them.
+"""
+
+import os
+import math
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to make every update a no-op; /metrics then only shows collectors
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Label combinations per metric; later ones are counted under the label value 'other'
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "500"))
+
+# Seconds; spans a cached hit up to a full resolution budget
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics = []
+# Callables returning [(name, type, help, [(labels, value), ...]), ...]
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        # Caller holds the lock
+        key = tuple(str(labels.get(name) or "") for name in self.labels)
+        if key not in self._series and len(self._series) >= METRICS_MAX_SERIES:
+            key = ("other",) * len(self.labels)
+        return key
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._series.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_labels_text(self.labels, key, extra)} {_number(value)}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Current value per label combination"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label combination, e.g. latencies in seconds"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (not cumulative) counts, an overflow slot, the sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self):
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        samples = []
+        for key, counts, total in series:
+            running = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                running += count
+                samples.append((f"{self.name}_bucket", key, ("le", _number(float(bound))), running))
+            samples.append((f"{self.name}_sum", key, None, round(total, 6)))
+            samples.append((f"{self.name}_count", key, None, running))
+        return samples
+
+
+def register_collector(collect):
+    """
+    Add a callable that reports values read at scrape time
+
+    Args:
+        collect (callable): Returns a list of (name, type, help, samples)
+                            with samples as [(labels dict, value), ...]
+    """
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+# Every in-process cache reports hits, misses and evictions through here
+CACHE_EVENTS = Counter("mushh_cache_events_total", "Cache lookups and evictions by cache and event",
+                       ("cache", "event"))
+# { cache name: the dict or set holding its entries }
+_caches = {}
+
+
+def cache_event(cache, event, amount=1):
+    """Count a 'hit', 'miss', 'stale' or 'eviction' for the named cache"""
+    CACHE_EVENTS.inc(amount, cache=cache, event=event)
+
+
+def register_cache(cache, contents):
+    """Report len(contents) as mushh_cache_entries{cache=...} at scrape time"""
+    with _registry_lock:
+        _caches[cache] = contents
+
+
+def registered_caches():
+    """{ cache name: container } for everything passed to register_cache"""
+    with _registry_lock:
+        return dict(_caches)
+
+
+def _collect_cache_sizes():
+    return [("mushh_cache_entries", "gauge", "Entries currently held per in-process cache",
+             [({"cache": name}, len(contents)) for name, contents in sorted(registered_caches().items())])]
+
+
+register_collector(_collect_cache_sizes)
+
+
+def render():
+    """Return every metric and collector in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            logger.warning(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {str(e)}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels_text(list(labels), list(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clear every metric's series (collectors are left registered)"""
+    with _registry_lock:
+        metrics = list(_metrics)
+    for metric in metrics:
+        metric.clear()
@@ -2,21 +2,28 @@ import re
 import requests
 import logging
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
+
+from .m3u8_validator import validate_m3u8_url, validate_first
+from .deadline import ensure_deadline
+from . import tracing
 
 logger = logging.getLogger(__name__)
 
-def extract_m3u8_from_mixdrop(url):
+@tracing.traced("mixdrop")
+def extract_m3u8_from_mixdrop(url, deadline=None):
     """
     Extract M3U8 stream URL from MixDrop with enhanced extraction methods
     
     Args:
         url (str): MixDrop URL
+        deadline (Deadline): Request time budget shared with the caller
     
     Returns:
         str: M3U8 URL or None if extraction fails
     """
     logger.info(f"Extracting M3U8 from MixDrop: {url}")
+    deadline = ensure_deadline(deadline)
     
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -33,15 +40,18 @@ def extract_m3u8_from_mixdrop(url):
     
     try:
         # Get MixDrop page
-        response = requests.get(url, headers=headers, timeout=15)
+        tracing.stage("page")
+        response = tracing.get(url, headers=headers, timeout=deadline.timeout(15))
         response.raise_for_status()
         
         logger.info(f"MixDrop page loaded successfully, status: {response.status_code}")
         
         # Parse HTML
+        tracing.stage("parse", bytes=len(response.text))
         soup = BeautifulSoup(response.text, 'html.parser')
         
         # Method 1: Look for direct video source in HTML
+        tracing.stage("method 1")
         video_tags = soup.find_all('video')
         for video in video_tags:
             src = video.get('src', '')
@@ -50,6 +60,7 @@ def extract_m3u8_from_mixdrop(url):
                 return make_absolute_url(src, url)
         
         # Method 2: Look for source tags
+        tracing.stage("method 2")
         source_tags = soup.find_all('source')
         for source in source_tags:
             src = source.get('src', '')
@@ -58,6 +69,7 @@ def extract_m3u8_from_mixdrop(url):
                 return make_absolute_url(src, url)
         
         # Method 3: Look for M3U8 URLs in script tags with enhanced patterns
+        tracing.stage("method 3")
         scripts = soup.find_all('script')
         for script in scripts:
             if script.string:
@@ -75,18 +87,22 @@ def extract_m3u8_from_mixdrop(url):
                     r'\.m3u8["\']?\s*:\s*["\']([^"\']*\.m3u8[^"\']*)["\']'
                 ]
                 
+                candidates = []
                 for pattern in patterns:
                     matches = re.findall(pattern, content, re.IGNORECASE)
                     for match in matches:
                         if match and '.m3u8' in match:
                             m3u8_url = make_absolute_url(match, url)
                             logger.info(f"Found M3U8 URL in script: {m3u8_url}")
-                            
-                            # Validate the URL
-                            if validate_m3u8_url(m3u8_url):
-                                return m3u8_url
+                            candidates.append(m3u8_url)
+                
+                # Validate every candidate from this script at once
+                m3u8_url = validate_first(candidates, deadline=deadline)
+                if m3u8_url:
+                    return m3u8_url
         
         # Method 4: Look for encoded/obfuscated URLs
+        tracing.stage("method 4")
         full_text = response.text
         
         # Look for base64 encoded URLs
@@ -99,21 +115,24 @@ def extract_m3u8_from_mixdrop(url):
                 decoded = base64.b64decode(encoded).decode('utf-8')
                 if '.m3u8' in decoded:
                     logger.info(f"Found M3U8 in base64: {decoded}")
-                    if validate_m3u8_url(decoded):
+                    if validate_m3u8_url(decoded, deadline=deadline):
                         return decoded
             except:
                 continue
         
         # Method 5: Look for any M3U8 URLs in the entire page
+        tracing.stage("method 5")
         m3u8_pattern = r'https?://[^"\s<>]+\.m3u8[^"\s<>]*'
         m3u8_matches = re.findall(m3u8_pattern, full_text, re.IGNORECASE)
         
         for m3u8_url in m3u8_matches:
             logger.info(f"Found potential M3U8 URL: {m3u8_url}")
-            if validate_m3u8_url(m3u8_url):
-                return m3u8_url
+        m3u8_url = validate_first(m3u8_matches, deadline=deadline)
+        if m3u8_url:
+            return m3u8_url
         
         # Method 6: Look for video.js or other player configurations
+        tracing.stage("method 6")
         player_patterns = [
             r'videojs\s*\([^)]*\)\.src\s*\(\s*["\']([^"\']*\.m3u8[^"\']*)["\']',
             r'jwplayer\([^)]*\)\.setup\([^)]*["\']([^"\']*\.m3u8[^"\']*)["\']',
@@ -121,14 +140,18 @@ def extract_m3u8_from_mixdrop(url):
             r'hls\.js.*?loadSource\s*\(\s*["\']([^"\']*\.m3u8[^"\']*)["\']'
         ]
         
+        player_matches = []
         for pattern in player_patterns:
             matches = re.findall(pattern, full_text, re.IGNORECASE)
             for m3u8_url in matches:
                 logger.info(f"Found M3U8 in player config: {m3u8_url}")
-                if validate_m3u8_url(m3u8_url):
-                    return m3u8_url
+                player_matches.append(m3u8_url)
+        m3u8_url = validate_first(player_matches, deadline=deadline)
+        if m3u8_url:
+            return m3u8_url
         
         # Method 7: Look for API endpoints that might return M3U8
+        tracing.stage("method 7")
         api_patterns = [
             r'["\']([^"\']*api[^"\']*playlist[^"\']*)["\']',
             r'["\']([^"\']*api[^"\']*stream[^"\']*)["\']',
@@ -143,7 +166,7 @@ def extract_m3u8_from_mixdrop(url):
                     logger.info(f"Trying API endpoint: {full_api_url}")
                     
                     try:
-                        api_response = requests.get(full_api_url, headers=headers, timeout=10)
+                        api_response = tracing.get(full_api_url, headers=headers, timeout=deadline.timeout(10))
                         if api_response.status_code == 200:
                             api_content = api_response.text
                             
@@ -175,63 +198,3 @@ def make_absolute_url(url, base_url):
         return url
     else:
         return urljoin(base_url, url)
-
-def validate_m3u8_url(url):
-    """
-    Validate if a URL is a valid M3U8 stream with enhanced validation
-    
-    Args:
-        url (str): URL to validate
-    
-    Returns:
-        bool: True if valid M3U8 URL
-    """
-    try:
-        # Basic URL validation
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return False
-        
-        # Check if it's actually an M3U8 file
-        if not url.lower().endswith('.m3u8'):
-            return False
-        
-        # Try to fetch the M3U8 file to validate it
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": "https://multiembed.mov/"
-        }
-        
-        try:
-            # Try HEAD request first
-            response = requests.head(url, headers=headers, timeout=8)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                return any(ct in content_type for ct in ['mpegurl', 'x-mpegurl', 'vnd.apple.mpegurl'])
-        except:
-            pass
-            
-        try:
-            # If HEAD fails, try GET request with limited content
-            response = requests.get(url, headers=headers, timeout=8, stream=True)
-            if response.status_code == 200:
-                # Read only first 1KB to check if it's M3U8
-                content_sample = b''
-                for chunk in response.iter_content(1024):
-                    content_sample += chunk
-                    break
-                
-                content_text = content_sample.decode('utf-8', errors='ignore')
-                
-                # Check for M3U8 markers
-                m3u8_markers = ['#EXTM3U', '#EXT-X-VERSION', '#EXT-X-TARGETDURATION', '#EXT-X-MEDIA-SEQUENCE']
-                return any(marker in content_text for marker in m3u8_markers)
-        except:
-            pass
-        
-        return False
-        
-    except Exception as e:
-        logger.debug(f"M3U8 validation failed for {url}: {str(e)}")
-        return False
@@ -1,9 +1,37 @@
 import os
+import re
+import time
+import threading
 import requests
 import logging
+import concurrent.futures
+
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# Movie details change rarely; stream resolution reads them from here
+DETAILS_CACHE_TTL_SECONDS = int(os.getenv("OMDB_DETAILS_CACHE_TTL", str(6 * 3600)))
+DETAILS_CACHE_MAX_ENTRIES = 2000
+# Background details fetches running at once; each may try every API key in turn
+OMDB_PREFETCH_WORKERS = int(os.getenv("OMDB_PREFETCH_WORKERS", "2"))
+# Fetches allowed to wait for a worker; more are dropped and retried on the next miss
+OMDB_PREFETCH_MAX_PENDING = int(os.getenv("OMDB_PREFETCH_MAX_PENDING", "32"))
+
+# { imdb_id: (timestamp, details) }
+_details_cache = {}
+_details_lock = threading.Lock()
+# { imdb_id: Future } for background fetches queued or running
+_details_pending = {}
+_prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=OMDB_PREFETCH_WORKERS, thread_name_prefix="omdb-details"
+)
+metrics.register_cache("omdb_details", _details_cache)
+
+_OMDB_CALLS = metrics.Counter("mushh_omdb_calls_total", "OMDb requests by API key slot, call and outcome",
+                              ("key", "call", "outcome"))
+_OMDB_SECONDS = metrics.Histogram("mushh_omdb_call_seconds", "OMDb request latency by call", ("call",))
+
 # Multiple API keys for redundancy
 OMDB_API_KEYS = [
     os.getenv("OMDB_API_KEY", "e6bc1ee7"), 
@@ -14,6 +42,43 @@ OMDB_API_KEYS = [
     "4c9f1b2a"
 ]
 
+# OMDb's error text for the outcomes worth telling apart on the key dashboard
+_OMDB_ERROR_OUTCOMES = (
+    (b"limit reached", "limit"),
+    (b"invalid api key", "invalid_key"),
+    (b"not found", "not_found"),
+)
+_OMDB_FALSE = re.compile(rb'"Response"\s*:\s*"False"')
+
+def _omdb_outcome(response):
+    if response.status_code != 200:
+        body = response.content[:200].lower()
+        return next((outcome for text, outcome in _OMDB_ERROR_OUTCOMES if text in body), "http_error")
+    body = response.content
+    # A pattern test is enough here and avoids parsing the body twice
+    if not _OMDB_FALSE.search(body):
+        return "ok"
+    body = body.lower()
+    return next((outcome for text, outcome in _OMDB_ERROR_OUTCOMES if text in body), "empty")
+
+def _omdb_get(url, api_key, call):
+    """
+    GET an OMDb URL, counting the call per key slot and outcome
+
+    Keys are labelled by their position in OMDB_API_KEYS, never by value.
+    """
+    key = f"key{OMDB_API_KEYS.index(api_key)}" if api_key in OMDB_API_KEYS else "other"
+    started = time.monotonic()
+    try:
+        response = requests.get(url, timeout=10)
+    except Exception:
+        _OMDB_CALLS.inc(key=key, call=call, outcome="error")
+        raise
+    finally:
+        _OMDB_SECONDS.observe(time.monotonic() - started, call=call)
+    _OMDB_CALLS.inc(key=key, call=call, outcome=_omdb_outcome(response))
+    return response
+
 def fetch_movie_by_title(title):
     """
     Fetch movie details from OMDb API by title
@@ -30,7 +95,7 @@ def fetch_movie_by_title(title):
     for api_key in OMDB_API_KEYS:
         try:
             url = f"http://www.omdbapi.com/?apikey={api_key}&t={title}&plot=full"
-            response = requests.get(url, timeout=10)
+            response = _omdb_get(url, api_key, "title")
             
             if response.status_code != 200:
                 continue  # Try next API key
@@ -71,7 +136,7 @@ def search_movies_by_keyword(keyword):
         try:
             # Search with the original keyword
             url = f"http://www.omdbapi.com/?apikey={api_key}&s={keyword}&type=movie"
-            response = requests.get(url, timeout=10)
+            response = _omdb_get(url, api_key, "search")
             
             if response.status_code != 200:
                 continue  # Try next API key
@@ -124,7 +189,7 @@ def search_movies_by_keyword(keyword):
                 for variation in variations:
                     try:
                         var_url = f"http://www.omdbapi.com/?apikey={api_key}&s={variation}&type=movie"
-                        var_response = requests.get(var_url, timeout=10)
+                        var_response = _omdb_get(var_url, api_key, "search")
                         
                         if var_response.status_code == 200:
                             var_data = var_response.json()
@@ -166,13 +231,17 @@ def get_movie_details(imdb_id):
     Returns:
         dict: Detailed movie information
     """
+    cached = get_cached_movie_details(imdb_id)
+    if cached is not None:
+        return cached
+
     logger.info(f"Getting movie details for IMDb ID: {imdb_id}")
     
     # Try multiple API keys
     for api_key in OMDB_API_KEYS:
         try:
             url = f"http://www.omdbapi.com/?apikey={api_key}&i={imdb_id}&plot=full"
-            response = requests.get(url, timeout=10)
+            response = _omdb_get(url, api_key, "details")
             
             if response.status_code != 200:
                 continue  # Try next API key
@@ -183,6 +252,7 @@ def get_movie_details(imdb_id):
                 continue  # Try next API key
             
             result = format_movie_data(data)
+            _cache_movie_details(imdb_id, result)
             
             logger.info(f"Successfully fetched detailed info for: {result['title']}")
             return result
@@ -194,6 +264,70 @@ def get_movie_details(imdb_id):
     # If all API keys failed
     raise Exception(f"Failed to fetch movie details for IMDb ID: {imdb_id}")
 
+def get_cached_movie_details(imdb_id):
+    """Return cached movie details without touching OMDb, or None"""
+    with _details_lock:
+        cached = _details_cache.get(imdb_id)
+    if cached and time.time() - cached[0] < DETAILS_CACHE_TTL_SECONDS:
+        metrics.cache_event("omdb_details", "hit")
+        return cached[1]
+    metrics.cache_event("omdb_details", "miss")
+    return None
+
+def _cache_movie_details(imdb_id, details):
+    with _details_lock:
+        if imdb_id not in _details_cache and len(_details_cache) >= DETAILS_CACHE_MAX_ENTRIES:
+            oldest = min(_details_cache, key=lambda k: _details_cache[k][0])
+            del _details_cache[oldest]
+            metrics.cache_event("omdb_details", "eviction")
+        _details_cache[imdb_id] = (time.time(), details)
+
+def _prefetch(imdb_id):
+    try:
+        get_movie_details(imdb_id)
+    except Exception as e:
+        logger.warning(f"Background details fetch failed for {imdb_id}: {str(e)}")
+    finally:
+        with _details_lock:
+            _details_pending.pop(imdb_id, None)
+
+def prefetch_movie_details(imdb_id):
+    """
+    Fill the details cache for `imdb_id` on the bounded background executor
+    
+    Returns:
+        bool: True if a fetch was queued, False if cached, already in flight
+              or OMDB_PREFETCH_MAX_PENDING fetches are waiting already
+    """
+    if get_cached_movie_details(imdb_id) is not None:
+        return False
+    with _details_lock:
+        if imdb_id in _details_pending or len(_details_pending) >= OMDB_PREFETCH_MAX_PENDING:
+            return False
+        _details_pending[imdb_id] = _prefetch_executor.submit(_prefetch, imdb_id)
+    return True
+
+def wait_for_prefetches(timeout=None):
+    """
+    Wait for queued background fetches, then cancel any that have not started
+
+    For tests and benchmarks only; the app never waits on prefetches. Lets
+    callers that swap out the HTTP transport (the bench fixtures) keep
+    these fetches inside the swapped-in transport.
+
+    Args:
+        timeout (float): Seconds to wait at most, None to wait for all
+
+    Returns:
+        int: Fetches still running when this returns
+    """
+    with _details_lock:
+        futures = list(_details_pending.values())
+    concurrent.futures.wait(futures, timeout=timeout)
+    for future in futures:
+        future.cancel()
+    return sum(1 for future in futures if not future.done())
+
 def format_movie_data(data):
     """Format movie data from OMDb API response"""
     return {
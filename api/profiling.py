@@ -0,0 +1,336 @@
+"""
+On-demand request profiles and an optional always-on stack sampler
+
+A single request is profiled in one of three modes:
+
+    wall      sample the request thread (and the resolver pool tasks it
+              submits) every PROFILE_REQUEST_INTERVAL, waits included
+    cpu       the same, but samples parked in a known wait (locks, queues,
+              socket reads) are dropped; time.sleep still counts
+    cprofile  deterministic cProfile of the request thread
+
+Sampled profiles are stored as collapsed stacks ("a;b;c 12" per line),
+which flamegraph.pl, speedscope and inferno read directly; cProfile runs
+are stored in pstats format. Files go to PROFILE_DIR.
+
+With PROFILE_SAMPLE_INTERVAL set, every worker also samples all of its
+busy threads at that interval and writes one collapsed-stack file per
+PROFILE_SAMPLE_WINDOW, for a low-overhead view of where CPU goes under
+real traffic.
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import logging
+import cProfile
+import functools
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Where request and periodic profiles are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Seconds between stack samples while one request is profiled
+PROFILE_REQUEST_INTERVAL = float(os.getenv("PROFILE_REQUEST_INTERVAL", "0.002"))
+# Seconds between stack samples in the always-on mode (0 = off)
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0"))
+# The always-on mode writes out and resets its samples this often
+PROFILE_SAMPLE_WINDOW = float(os.getenv("PROFILE_SAMPLE_WINDOW", "300"))
+# Profiles kept in PROFILE_DIR; the oldest are deleted first
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+MODES = ("wall", "cpu", "cprofile")
+MAX_STACK_DEPTH = 128
+PROFILE_NAME_PATTERN = re.compile(r"[A-Za-z0-9._-]+\.(folded|prof)")
+
+# Leaf frames of threads parked waiting: (file name, function)
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+# Per thread: .sampler while a `wall`/`cpu` profile of this request is running
+_local = threading.local()
+# cProfile allows one active profiler at a time
+_cprofile_lock = threading.Lock()
+_periodic = {"thread": None, "sampler": None}
+
+
+def _frame_name(code):
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+def fold(frame):
+    """Collapsed stack of `frame`, outermost call first"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples thread stacks from a background thread into collapsed-stack counts
+
+    Args:
+        interval (float): Seconds between samples
+        threads (set): Thread idents to sample, or None for every thread
+        include_idle (bool): Keep samples whose leaf frame is a known wait
+    """
+
+    def __init__(self, interval, threads=None, include_idle=True):
+        self.interval = interval
+        self.threads = threads
+        self.include_idle = include_idle
+        self.counts = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_thread(self, ident):
+        with self._lock:
+            self.threads.add(ident)
+
+    def remove_thread(self, ident):
+        with self._lock:
+            self.threads.discard(ident)
+
+    def sample(self):
+        own = threading.get_ident()
+        with self._lock:
+            wanted = set(self.threads) if self.threads is not None else None
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (wanted is not None and ident not in wanted):
+                continue
+            if not self.include_idle and _is_idle(frame):
+                continue
+            stack = fold(frame)
+            with self._lock:
+                self.counts[stack] += 1
+        with self._lock:
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug(f"Stack sample failed: {str(e)}")
+
+    def start(self, name="stack-sampler"):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def take(self):
+        """Return the collapsed stacks gathered so far and start over"""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+            self.samples = 0
+        return counts
+
+
+def render_folded(counts):
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _store(name, write):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, name)
+    write(path)
+    _prune()
+    return name
+
+
+def _prune():
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if PROFILE_NAME_PATTERN.fullmatch(n)]
+    except OSError:
+        return
+    if len(names) <= PROFILE_MAX_FILES:
+        return
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)))
+    for name in names[:len(names) - PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _profile_name(label, extension):
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")[:60] or "request"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{slug}-{uuid.uuid4().hex[:6]}.{extension}"
+
+
+class RequestProfile:
+    """A profile of the calling thread, from `start_request_profile` until `stop`"""
+
+    def __init__(self, mode, label):
+        self.mode = mode
+        self.label = label
+        self.started = time.perf_counter()
+        self._ident = threading.get_ident()
+        self._profiler = None
+        self._sampler = None
+        if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            try:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            except ValueError as e:
+                # Another profiling tool already holds the interpreter hook
+                logger.warning(f"cProfile unavailable, sampling instead: {str(e)}")
+                self._profiler = None
+                _cprofile_lock.release()
+        if self._profiler is None:
+            # A cprofile request while another one runs falls back to sampling
+            self.mode = "cpu" if mode == "cpu" else "wall"
+            self._sampler = StackSampler(PROFILE_REQUEST_INTERVAL, {self._ident},
+                                         include_idle=self.mode == "wall").start("request-profiler")
+            _local.sampler = self._sampler
+
+    def stop(self):
+        """
+        Stop profiling and store the result in PROFILE_DIR
+
+        Returns:
+            str: Stored profile file name, or None if nothing was recorded
+        """
+        try:
+            if self._profiler is not None:
+                self._profiler.disable()
+                return _store(_profile_name(self.label, "prof"), self._profiler.dump_stats)
+            _local.sampler = None
+            self._sampler.stop()
+            counts = self._sampler.take()
+            if not counts:
+                return None
+            text = render_folded(counts)
+
+            def write(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            return _store(_profile_name(self.label, "folded"), write)
+        except OSError as e:
+            logger.warning(f"Could not store profile for {self.label}: {str(e)}")
+            return None
+        finally:
+            if self._profiler is not None:
+                self._profiler = None
+                _cprofile_lock.release()
+
+
+def start_request_profile(mode, label):
+    """
+    Profile the calling thread until the returned RequestProfile is stopped
+
+    Args:
+        mode (str): 'wall', 'cpu' or 'cprofile'; anything else means 'wall'
+        label (str): Used in the stored file name, e.g. the request path
+    """
+    return RequestProfile(mode if mode in MODES else "wall", label)
+
+
+def bind(fn):
+    """Wrap `fn` so the request profile of this thread also samples the thread that runs it"""
+    sampler = getattr(_local, "sampler", None)
+    if sampler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        sampler.add_thread(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.remove_thread(ident)
+    return run
+
+
+def list_profiles():
+    """Stored profiles, newest first, as dicts with name, bytes and modified"""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if PROFILE_NAME_PATTERN.fullmatch(n)]
+    except OSError:
+        return []
+    profiles = []
+    for name in names:
+        stat = os.stat(os.path.join(PROFILE_DIR, name))
+        profiles.append({"name": name, "bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda p: p["modified"], reverse=True)
+
+
+def profile_path(name):
+    """Path of a stored profile, or None for unknown or malformed names"""
+    if not PROFILE_NAME_PATTERN.fullmatch(name or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ---------- always-on sampling ----------
+
+def _periodic_loop(sampler):
+    # An Event wait rather than time.sleep, so the sampler sees this thread as idle
+    window = threading.Event()
+    while True:
+        window.wait(PROFILE_SAMPLE_WINDOW)
+        counts = sampler.take()
+        if not counts:
+            continue
+        text = render_folded(counts)
+
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        try:
+            _store(_profile_name("periodic", "folded"), write)
+        except OSError as e:
+            logger.warning(f"Could not store periodic profile: {str(e)}")
+
+
+def start_periodic():
+    """Start the always-on sampler if PROFILE_SAMPLE_INTERVAL is set; safe to call more than once"""
+    if PROFILE_SAMPLE_INTERVAL <= 0 or _periodic["thread"] is not None:
+        return False
+    sampler = StackSampler(PROFILE_SAMPLE_INTERVAL, include_idle=False).start("periodic-profiler")
+    _periodic["sampler"] = sampler
+    _periodic["thread"] = threading.Thread(target=_periodic_loop, args=(sampler,), daemon=True,
+                                           name="periodic-profile-writer")
+    _periodic["thread"].start()
+    logger.info(f"Periodic profiling every {PROFILE_SAMPLE_INTERVAL * 1000:.0f}ms, "
+                f"written every {PROFILE_SAMPLE_WINDOW:.0f}s to {PROFILE_DIR}")
+    return True
+
+
+def get_periodic_profile():
+    """Collapsed stacks of the current always-on window (without resetting it), or None when off"""
+    sampler = _periodic["sampler"]
+    if sampler is None:
+        return None
+    with sampler._lock:
+        counts = Counter(sampler.counts)
+    return render_folded(counts)
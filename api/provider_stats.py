@@ -0,0 +1,166 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per provider and per host for percentiles
+MAX_SAMPLES = 1000
+
+# { provider: {'attempts': int, 'successes': int, 'samples': deque} }
+_providers = {}
+# { host: same shape }
+_hosts = {}
+metrics.register_cache("provider_stats_hosts", _hosts)
+_lock = threading.Lock()
+# Per-thread stack of `collect()` tables that also receive this thread's attempts
+_local = threading.local()
+
+_PROVIDER_ATTEMPTS = metrics.Counter("mushh_provider_attempts_total", "Resolution attempts by provider and outcome",
+                                     ("provider", "outcome"))
+_PROVIDER_SECONDS = metrics.Histogram("mushh_provider_attempt_seconds", "Resolution attempt latency by provider",
+                                      ("provider",))
+_HOST_ATTEMPTS = metrics.Counter("mushh_host_attempts_total", "Upstream attempts by host and outcome",
+                                 ("host", "outcome"))
+_HOST_SECONDS = metrics.Histogram("mushh_host_attempt_seconds", "Upstream attempt latency by host", ("host",))
+
+
+def _entry(table, name):
+    entry = table.get(name)
+    if entry is None:
+        entry = table[name] = {"attempts": 0, "successes": 0, "samples": deque(maxlen=MAX_SAMPLES)}
+    return entry
+
+
+def _add(entry, seconds, ok):
+    entry["attempts"] += 1
+    entry["successes"] += 1 if ok else 0
+    entry["samples"].append(seconds)
+
+
+def record_attempt(provider, seconds, ok, url=None):
+    """
+    Record one resolution attempt
+
+    Args:
+        provider (str): Provider or stage name, e.g. a registry name or 'multiembed'
+        seconds (float): Wall time of the attempt
+        ok (bool): Whether it produced a stream
+        url (str): URL that was requested, for the per-host view
+    """
+    host = urlparse(url).netloc.lower() if url else None
+    with _lock:
+        for table, name in ((_providers, provider), (_hosts, host)):
+            if not name:
+                continue
+            _add(_entry(table, name), seconds, ok)
+    for raw in getattr(_local, "collectors", ()):
+        for kind, name in (("providers", provider), ("hosts", host)):
+            if name:
+                _add(raw[kind].setdefault(name, {"attempts": 0, "successes": 0, "samples": []}), seconds, ok)
+    outcome = "ok" if ok else "failed"
+    if provider:
+        _PROVIDER_ATTEMPTS.inc(provider=provider, outcome=outcome)
+        _PROVIDER_SECONDS.observe(seconds, provider=provider)
+    if host:
+        _HOST_ATTEMPTS.inc(host=host, outcome=outcome)
+        _HOST_SECONDS.observe(seconds, host=host)
+
+
+@contextmanager
+def collect():
+    """
+    Also gather the attempts this thread records inside the block
+
+    Yields a dict in `snapshot()` form holding only those attempts, so one
+    resolution can be measured while other requests record their own.
+    """
+    raw = {"providers": {}, "hosts": {}}
+    collectors = getattr(_local, "collectors", ())
+    _local.collectors = collectors + (raw,)
+    try:
+        yield raw
+    finally:
+        _local.collectors = collectors
+
+
+@contextmanager
+def timed_attempt(provider, url=None):
+    """
+    Time the block and record it as one attempt
+
+    Yields a dict; set its 'ok' to True once the attempt produced a stream.
+    Exceptions count as failures and propagate.
+    """
+    attempt = {"ok": False}
+    started = time.perf_counter()
+    with tracing.span("attempt", provider=provider, url=url) as span:
+        try:
+            yield attempt
+        except BaseException:
+            attempt["ok"] = False
+            raise
+        finally:
+            span["ok"] = attempt["ok"]
+            record_attempt(provider, time.perf_counter() - started, attempt["ok"], url)
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an ascending list, or None if empty"""
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(attempts, successes, samples):
+    ordered = sorted(samples)
+    return {
+        "attempts": attempts,
+        "successes": successes,
+        "success_rate": round(successes / attempts, 3) if attempts else None,
+        "p50": percentile(ordered, 0.50),
+        "p90": percentile(ordered, 0.90),
+        "p99": percentile(ordered, 0.99)
+    }
+
+
+def snapshot():
+    """Raw counters and samples, e.g. to ship from a worker process and `merge` elsewhere"""
+    with _lock:
+        return {
+            kind: {name: {"attempts": e["attempts"], "successes": e["successes"], "samples": list(e["samples"])}
+                   for name, e in table.items()}
+            for kind, table in (("providers", _providers), ("hosts", _hosts))
+        }
+
+
+def merge(raw):
+    """Add a `snapshot()` taken elsewhere into this process's stats"""
+    with _lock:
+        for kind, table in (("providers", _providers), ("hosts", _hosts)):
+            for name, e in raw.get(kind, {}).items():
+                entry = _entry(table, name)
+                entry["attempts"] += e["attempts"]
+                entry["successes"] += e["successes"]
+                entry["samples"].extend(e["samples"])
+
+
+def reset():
+    with _lock:
+        _providers.clear()
+        _hosts.clear()
+
+
+def get_provider_stats():
+    raw = snapshot()
+    return {
+        kind: {name: summarize(e["attempts"], e["successes"], e["samples"]) for name, e in sorted(table.items())}
+        for kind, table in raw.items()
+    }
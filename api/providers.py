@@ -0,0 +1,155 @@
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Tuple, Any
+
+from .startup import timed_import
+
+logger = logging.getLogger(__name__)
+
+# Provider groups
+BEST_STREAM = 'best_stream'      # tried in order by get_best_stream
+DIRECT_EMBED = 'direct_embed'    # probed in order by get_m3u8_from_multiembed
+IFRAME = 'iframe'                # extractors for iframes found on the multiembed page
+
+
+@dataclass
+class Provider:
+    """
+    A streaming source and the metadata the resolver schedules it by
+
+    `resolver` and `extractor` are "module:function" paths (relative to the
+    api package) that are imported on first use, so registering a provider
+    never pulls in its scraper dependencies.
+    """
+    name: str
+    group: str
+    url_template: Optional[str] = None   # formatted with imdb_id
+    resolver: Optional[str] = None       # (imdb_id, title, year, deadline=) -> dict
+    extractor: Optional[str] = None      # (url, deadline) -> stream URL or None
+    match: Tuple[str, ...] = ()          # iframe URL keywords handled by `extractor`
+    stream_type: str = 'hls'             # type of what `extractor` returns
+    cost: float = 0.0                    # expected seconds to resolve
+    timeout: float = 10.0                # hard cap in seconds, within the request deadline
+    max_concurrency: int = 8             # concurrent resolutions per worker process
+    network: bool = True                 # False = pure string template, no I/O
+    priority: int = 100                  # lower runs first within its group
+    _semaphore: Any = field(default=None, init=False, repr=False)
+    _callables: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+
+    def _load(self, attribute):
+        if attribute not in self._callables:
+            module_name, func_name = getattr(self, attribute).split(':')
+            module = timed_import(f".{module_name}", __package__)
+            self._callables[attribute] = getattr(module, func_name)
+        return self._callables[attribute]
+
+    def build_url(self, imdb_id):
+        return self.url_template.format(imdb_id=imdb_id)
+
+    def resolve(self, imdb_id, title=None, year=None, deadline=None):
+        """Run the provider's resolver, or fill in its URL template."""
+        if self.resolver:
+            return self._load('resolver')(imdb_id, title, year, deadline=deadline)
+        return {"stream_url": self.build_url(imdb_id), "embed": True, "quality": "HD"}
+
+    def extract(self, url, deadline=None):
+        return self._load('extractor')(url, deadline)
+
+    def handles(self, url):
+        lowered = url.lower()
+        return any(keyword in lowered for keyword in self.match)
+
+    def affordable(self, deadline):
+        """Expensive providers are only started if the request can still pay for them."""
+        return deadline is None or deadline.allows(min(self.cost, self.timeout))
+
+    @contextmanager
+    def slot(self):
+        """Yield True if a concurrency slot was free (and hold it), False otherwise."""
+        acquired = self._semaphore.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._semaphore.release()
+
+
+_registry = {}
+
+
+def register(provider):
+    _registry[provider.name] = provider
+    return provider
+
+
+def get_provider(name):
+    return _registry.get(name)
+
+
+def providers_for(group):
+    """Providers in `group`, cheapest-first within equal priority."""
+    return sorted(
+        (p for p in _registry.values() if p.group == group),
+        key=lambda p: (p.priority, p.cost)
+    )
+
+
+def provider_for_url(url, group=IFRAME):
+    """First provider in `group` whose extractor handles `url`, or None."""
+    for provider in providers_for(group):
+        if provider.extractor and provider.handles(url):
+            return provider
+    return None
+
+
+# ---------- get_best_stream sources ----------
+
+register(Provider("VidSrc", BEST_STREAM, url_template="https://vidsrc.me/embed/{imdb_id}",
+                  resolver="vidsrc_api:get_stream_for_imdb", network=False, priority=10))
+register(Provider("MultiEmbed", BEST_STREAM, url_template="https://multiembed.to/embed/{imdb_id}",
+                  network=False, priority=20))
+register(Provider("FlixHQ", BEST_STREAM, url_template="https://flixhq.to/embed/{imdb_id}",
+                  network=False, priority=30))
+register(Provider("TPlayer", BEST_STREAM, url_template="https://tplayer.info/embed/{imdb_id}",
+                  network=False, priority=40))
+
+# ---------- Direct embed pages, tried in order ----------
+
+for _priority, _template in enumerate([
+    "https://multiembed.mov/directstream.php?video_id={imdb_id}&imdb=1",
+    "https://2embed.cc/embed/movie?imdb={imdb_id}",
+    "https://www.2embed.to/embed/imdb/movie?id={imdb_id}",
+    "https://embed.su/embed/movie/{imdb_id}",
+    "https://vidsrc.me/embed/movie?imdb={imdb_id}",
+    "https://moviesapi.club/movie/{imdb_id}",
+    "https://vidsrc.to/embed/movie/{imdb_id}",
+    "https://autoembed.cc/movie/imdb/{imdb_id}",
+    "https://streamm4u.ws/embed/movie/{imdb_id}",
+    "https://vidplay.online/embed/movie/{imdb_id}",
+    "https://vidbinge.com/embed/movie/{imdb_id}",
+    "https://www.filmxy.vip/embed/movie/{imdb_id}",
+    "https://vidbinge.dev/embed/movie/{imdb_id}",
+    "https://www.showboxmovies.net/embed/movie/{imdb_id}",
+    "https://vidsrc.xyz/embed/movie/{imdb_id}",
+    "https://embedsito.com/v/movie/{imdb_id}",
+    "https://www.2embed.org/embed/movie/{imdb_id}",
+    "https://movieshd.watch/embed/movie/{imdb_id}",
+]):
+    register(Provider(f"direct:{_template.split('/')[2]}", DIRECT_EMBED, url_template=_template,
+                      cost=2.0, timeout=10, priority=_priority))
+
+# ---------- Iframe extractors ----------
+
+register(Provider("mixdrop", IFRAME, extractor="mixdrop_scraper:extract_m3u8_from_mixdrop", match=("mixdrop",),
+                  cost=4.0, timeout=15, max_concurrency=4, priority=10))
+register(Provider("vidsrc", IFRAME, extractor="vidsrc_scraper:extract_from_vidsrc", match=("vidsrc",),
+                  cost=4.0, timeout=15, max_concurrency=4, priority=20))
+register(Provider("streamtape", IFRAME, extractor="streamtape_scraper:extract_m3u8_from_streamtape",
+                  match=("streamtape",), stream_type='mp4', cost=2.0, timeout=15, max_concurrency=4, priority=30))
+register(Provider("vidcloud", IFRAME, extractor="vidcloud_scraper:extract_m3u8_from_vidcloud", match=("vidcloud",),
+                  cost=2.0, timeout=15, max_concurrency=4, priority=40))
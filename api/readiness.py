@@ -0,0 +1,132 @@
+"""
+Readiness of this worker to take more traffic
+
+/health only says the process is up. /ready also answers whether a new
+request would be served promptly, so a load balancer can route around an
+instance whose resolver threads are all stuck in scraper timeouts or
+whose request threads are all held by proxy streams.
+"""
+
+import os
+import time
+import threading
+
+from . import stream_cache
+from .bandwidth import proxy_scheduler
+from .host_limits import get_host_stats
+from .memory import open_descriptors
+from .resolver_pool import resolver_pool, RESOLVER_RETRY_AFTER_SECONDS
+from .startup import get_startup_stats
+
+# Request threads per worker; same variable and default as gunicorn_config.py
+REQUEST_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+# Not ready once this fraction of the request threads, resolver pool task slots or in-flight resolution slots is taken
+READY_SATURATION_FRACTION = float(os.getenv("READY_SATURATION_FRACTION", "0.9"))
+# Not ready with this many open /api/proxy streams in this worker (0 = no limit); each holds a request thread,
+# so by default two threads are kept for pages and API calls
+READY_MAX_PROXY_STREAMS = int(os.getenv("READY_MAX_PROXY_STREAMS", str(max(1, REQUEST_THREADS - 2))))
+# Also report not ready while the shared cache backend is configured but unreachable
+READY_REQUIRE_CACHE_BACKEND = os.getenv("READY_REQUIRE_CACHE_BACKEND", "0") == "1"
+# Seconds a backend ping is reused, so frequent probes do not each wait on Redis
+BACKEND_CHECK_INTERVAL = 5.0
+
+_backend_check = {"at": None, "status": None}
+# Requests between their first before_request hook and the end of their (possibly streamed) response
+_requests = {"busy": 0, "peak": 0}
+_lock = threading.Lock()
+
+
+def request_started():
+    """Call from a before_request hook; pair with exactly one `request_finished()`."""
+    with _lock:
+        _requests["busy"] += 1
+        _requests["peak"] = max(_requests["peak"], _requests["busy"])
+
+
+def request_finished():
+    """Call once the response is closed, so streamed bodies count for as long as they hold the thread."""
+    with _lock:
+        _requests["busy"] -= 1
+
+
+def _cache_backend():
+    with _lock:
+        if _backend_check["at"] is not None and time.monotonic() - _backend_check["at"] < BACKEND_CHECK_INTERVAL:
+            return _backend_check["status"]
+    status = stream_cache.check_backend()
+    if status["configured"] and not status["connected"]:
+        # Never connected at boot; the startup stats say why
+        connection = get_startup_stats()["connections"].get("stream_cache", {})
+        status.update({"reachable": False, "error": connection.get("error") or connection.get("state")})
+    with _lock:
+        _backend_check.update({"at": time.monotonic(), "status": status})
+    return status
+
+
+def _usage(used, limit):
+    return round(used / limit, 3) if limit else 0.0
+
+
+def get_readiness():
+    """
+    Load on this worker and whether it should take more traffic
+
+    Returns:
+        dict: {'ready', 'reasons', 'retry_after', 'requests', 'resolver',
+               'proxy', 'connections', 'cache_backend'}; `reasons` lists
+               each limit that is reached
+    """
+    reasons = []
+
+    with _lock:
+        # The probe asking is not load
+        busy = max(0, _requests["busy"] - 1)
+        peak = _requests["peak"]
+    thread_usage = _usage(busy, REQUEST_THREADS)
+    if thread_usage >= READY_SATURATION_FRACTION:
+        reasons.append(f"request threads at {thread_usage:.0%} of capacity ({busy} of {REQUEST_THREADS} busy)")
+
+    pool = resolver_pool.stats()
+    task_usage = _usage(pool["pending"], pool["max_workers"] + pool["max_queue"])
+    inflight_usage = _usage(pool["inflight_resolutions"], pool["max_inflight"])
+    if task_usage >= READY_SATURATION_FRACTION:
+        reasons.append(f"resolver tasks at {task_usage:.0%} of capacity "
+                       f"({pool['running']} running, {pool['queued']} queued)")
+    if inflight_usage >= READY_SATURATION_FRACTION:
+        reasons.append(f"in-flight resolutions at {inflight_usage:.0%} of capacity")
+
+    streams = proxy_scheduler.get_stats()["global"]["active_streams"]
+    if READY_MAX_PROXY_STREAMS and streams >= READY_MAX_PROXY_STREAMS:
+        reasons.append(f"{streams} proxy streams open, limit {READY_MAX_PROXY_STREAMS}")
+
+    hosts = get_host_stats()
+    backend = _cache_backend()
+    if READY_REQUIRE_CACHE_BACKEND and backend["configured"] and not backend["reachable"]:
+        reasons.append(f"cache backend unreachable: {backend['error']}")
+
+    return {
+        "ready": not reasons,
+        "reasons": reasons,
+        "retry_after": RESOLVER_RETRY_AFTER_SECONDS,
+        "requests": {"busy": busy, "peak": peak, "threads": REQUEST_THREADS, "thread_usage": thread_usage},
+        "resolver": {
+            "running": pool["running"],
+            "queued": pool["queued"],
+            "max_workers": pool["max_workers"],
+            "max_queue": pool["max_queue"],
+            "inflight_resolutions": pool["inflight_resolutions"],
+            "max_inflight": pool["max_inflight"],
+            "task_usage": task_usage,
+            "inflight_usage": inflight_usage
+        },
+        "proxy": {"active_streams": streams, "max_streams": READY_MAX_PROXY_STREAMS or None},
+        "connections": {
+            # Upstream requests hold a per-host slot for as long as they are open
+            "upstream_active": sum(hosts["active"].values()),
+            "max_per_host": hosts["max_per_host"],
+            "hosts_at_limit": sorted(host for host, count in hosts["active"].items()
+                                     if count >= hosts["max_per_host"]),
+            **open_descriptors()
+        },
+        "cache_backend": backend
+    }
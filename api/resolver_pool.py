@@ -0,0 +1,198 @@
+import os
+import logging
+import threading
+import concurrent.futures
+from contextlib import contextmanager
+
+from . import metrics, tracing, profiling
+
+logger = logging.getLogger(__name__)
+
+# Threads shared by every provider task in the process
+RESOLVER_MAX_WORKERS = int(os.getenv("RESOLVER_MAX_WORKERS", "16"))
+# Provider tasks allowed to wait for a thread before new work is rejected
+RESOLVER_MAX_QUEUE = int(os.getenv("RESOLVER_MAX_QUEUE", "64"))
+# Request threads per worker; same variable and default as gunicorn_config.py
+REQUEST_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+# Cache-miss resolutions allowed to run at once across all request threads. Kept below the
+# thread count so a burst of clicks is actually shed (stale entry or 503) instead of never hitting the limit
+RESOLVER_MAX_INFLIGHT = int(os.getenv("RESOLVER_MAX_INFLIGHT", str(max(2, REQUEST_THREADS - 2))))
+# Background resolutions (bulk prefetch, speculation) allowed to run at once across all batches
+RESOLVER_BACKGROUND_MAX_INFLIGHT = int(os.getenv("RESOLVER_BACKGROUND_MAX_INFLIGHT", "4"))
+# In-flight slots background resolutions may never take, so clicks still get one
+RESOLVER_RESERVED_INFLIGHT = int(os.getenv("RESOLVER_RESERVED_INFLIGHT", str(max(1, RESOLVER_MAX_INFLIGHT // 3))))
+# Suggested client back-off when the resolver is saturated
+RESOLVER_RETRY_AFTER_SECONDS = int(os.getenv("RESOLVER_RETRY_AFTER", "5"))
+
+
+class ResolverSaturated(Exception):
+    """Raised instead of queueing more resolution work when the pool is full."""
+
+    def __init__(self, message="Stream resolver is saturated", retry_after=RESOLVER_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ResolverPool:
+    """
+    Process-wide bounded executor for provider tasks
+
+    `submit` never blocks: once `max_workers + max_queue` tasks are pending
+    it raises ResolverSaturated so callers can shed load. `admit` bounds the
+    number of whole resolutions running at once in the same way. Resolutions
+    admitted inside `background()` also share a small quota of their own and
+    never take the last `reserved_inflight` slots.
+    """
+
+    def __init__(self, max_workers, max_queue, max_inflight,
+                 max_background=RESOLVER_BACKGROUND_MAX_INFLIGHT, reserved_inflight=RESOLVER_RESERVED_INFLIGHT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight
+        self.max_background = max_background
+        self.reserved_inflight = reserved_inflight
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="resolver"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = 0
+        self._running = 0
+        self._resolutions = 0
+        self._background_resolutions = 0
+        self._counters = {"submitted": 0, "completed": 0, "cancelled": 0, "rejected": 0, "shed": 0, "deferred": 0}
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise ResolverSaturated()
+        # Tasks record into the submitting request's trace and profile, if it has them
+        fn = profiling.bind(tracing.bind(fn))
+
+        def run():
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._pending += 1
+            self._counters["submitted"] += 1
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._counters["cancelled" if future.cancelled() else "completed"] += 1
+        self._slots.release()
+
+    def cancel(self, futures):
+        """Cancel tasks that have not started; running ones are expected to watch their Deadline."""
+        for future in futures:
+            future.cancel()
+
+    @contextmanager
+    def background(self):
+        """Mark resolutions admitted by this thread as prefetch work rather than a click."""
+        previous = getattr(self._local, "background", False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    @contextmanager
+    def admit(self):
+        """Reserve one of the in-flight resolution slots or raise ResolverSaturated."""
+        background = getattr(self._local, "background", False)
+        if background:
+            with self._lock:
+                allowed = (self._background_resolutions < self.max_background
+                           and self.max_inflight - self._resolutions > self.reserved_inflight)
+                if allowed:
+                    self._background_resolutions += 1
+                else:
+                    self._counters["deferred"] += 1
+            if not allowed:
+                raise ResolverSaturated("Background resolution quota is used up")
+        if not self._inflight.acquire(blocking=False):
+            with self._lock:
+                if background:
+                    self._background_resolutions -= 1
+                self._counters["shed"] += 1
+            raise ResolverSaturated()
+        with self._lock:
+            self._resolutions += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._resolutions -= 1
+                if background:
+                    self._background_resolutions -= 1
+            self._inflight.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "max_inflight": self.max_inflight,
+                "max_background": self.max_background,
+                "reserved_inflight": self.reserved_inflight,
+                "running": self._running,
+                "queued": max(0, self._pending - self._running),
+                "pending": self._pending,
+                "inflight_resolutions": self._resolutions,
+                "background_resolutions": self._background_resolutions,
+                **self._counters
+            }
+
+    def is_saturated(self):
+        with self._lock:
+            return (
+                self._pending >= self.max_workers + self.max_queue
+                or self._resolutions >= self.max_inflight
+            )
+
+
+# Shared pool for the whole worker process
+resolver_pool = ResolverPool(RESOLVER_MAX_WORKERS, RESOLVER_MAX_QUEUE, RESOLVER_MAX_INFLIGHT)
+
+
+def _collect_metrics():
+    stats = resolver_pool.stats()
+    return [
+        ("mushh_resolver_tasks", "gauge", "Provider tasks in the resolver pool by state",
+         [({"state": state}, stats[state]) for state in ("running", "queued")]),
+        ("mushh_resolver_inflight_resolutions", "gauge", "Cache-miss resolutions running across request threads",
+         [({}, stats["inflight_resolutions"])]),
+        ("mushh_resolver_background_resolutions", "gauge", "Prefetch and speculative resolutions running",
+         [({}, stats["background_resolutions"])]),
+        ("mushh_resolver_capacity", "gauge", "Configured resolver pool limits",
+         [({"limit": limit}, stats[limit]) for limit in ("max_workers", "max_queue", "max_inflight",
+                                                           "max_background", "reserved_inflight")]),
+        ("mushh_resolver_tasks_total", "counter", "Provider tasks by what happened to them",
+         [({"event": event}, stats[event]) for event in ("submitted", "completed", "cancelled", "rejected", "shed",
+                                                        "deferred")]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
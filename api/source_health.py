@@ -0,0 +1,183 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+from .cdn_probe import get_host_measurement
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Older outcomes count half as much after this many seconds
+HEALTH_HALF_LIFE_SECONDS = float(os.getenv("SOURCE_HEALTH_HALF_LIFE", "1800"))
+HEALTH_MAX_HOSTS = 2000
+
+# Directly playable streams beat embed pages that may wrap ads or dead players
+TYPE_WEIGHTS = {'hls': 1.0, 'mp4': 0.9, 'iframe': 0.6}
+# Probe results adjust the score only when a measurement is already cached
+PROBE_OK_WEIGHT = 1.0
+PROBE_FAILED_WEIGHT = 0.5
+PROBE_UNKNOWN_WEIGHT = 0.9
+
+# Seconds a served URL may be reported broken by the client it was served to
+REPORT_WINDOW_SECONDS = float(os.getenv("SOURCE_REPORT_WINDOW", "3600"))
+# Broken-source reports accepted per client per hour
+REPORT_MAX_PER_HOUR = int(os.getenv("SOURCE_REPORT_MAX_PER_HOUR", "20"))
+REPORT_MAX_CLIENTS = 5000
+# Signs report tokens; the Flask session secret, so every worker accepts the others' tokens
+REPORT_SECRET = os.getenv("SESSION_SECRET", "netmirror-secret-key-2025").encode()
+
+# { host: [successes, failures, updated_at] } with exponentially decayed counts
+_host_stats = {}
+metrics.register_cache("source_health_hosts", _host_stats)
+_lock = threading.Lock()
+# { client: deque of report times in the last hour }, least recently reporting first
+_reports = OrderedDict()
+# { (client, url) } already counted, so one token counts once
+_reported = OrderedDict()
+
+
+def _host(url):
+    return urlparse(url or '').netloc.lower()
+
+
+def _decayed(entry, now):
+    factor = 0.5 ** ((now - entry[2]) / HEALTH_HALF_LIFE_SECONDS)
+    return entry[0] * factor, entry[1] * factor
+
+
+def _record(url, ok):
+    host = _host(url)
+    if not host:
+        return
+    now = time.time()
+    with _lock:
+        entry = _host_stats.get(host)
+        if entry is None:
+            if len(_host_stats) >= HEALTH_MAX_HOSTS:
+                del _host_stats[min(_host_stats, key=lambda h: _host_stats[h][2])]
+            entry = _host_stats[host] = [0.0, 0.0, now]
+        successes, failures = _decayed(entry, now)
+        entry[:] = [successes + (1 if ok else 0), failures + (0 if ok else 1), now]
+
+
+def record_success(url):
+    """A resolver produced a playable URL on this host."""
+    _record(url, True)
+
+
+def record_failure(url):
+    """This host failed to resolve, or a player reported it broken."""
+    _record(url, False)
+
+
+def _signature(client, url, issued):
+    message = f"{client}\n{url}\n{issued}".encode()
+    return hmac.new(REPORT_SECRET, message, hashlib.sha256).hexdigest()[:32]
+
+
+def report_token(client, url):
+    """Token that lets `client` report `url` broken for REPORT_WINDOW_SECONDS"""
+    issued = int(time.time())
+    return f"{issued}.{_signature(client, url, issued)}"
+
+
+def allow_report(client):
+    """Count a broken-source report against `client`'s hourly quota; False once it is used up"""
+    now = time.time()
+    with _lock:
+        times = _reports.pop(client, None) or deque()
+        while times and times[0] <= now - 3600:
+            times.popleft()
+        _reports[client] = times
+        while len(_reports) > REPORT_MAX_CLIENTS:
+            _reports.popitem(last=False)
+        if len(times) >= REPORT_MAX_PER_HOUR:
+            return False
+        times.append(now)
+        return True
+
+
+def record_report(client, url, token):
+    """
+    Lower the health of `url`'s host if this server recently served it to `client`
+
+    Args:
+        client (str): Client ID the report came from
+        url (str): Reported URL
+        token (str): The `report_token` served with the URL
+
+    Returns:
+        bool: Whether the report counted
+    """
+    try:
+        issued, signature = str(token or "").split(".", 1)
+        issued = int(issued)
+    except ValueError:
+        return False
+    if not 0 <= time.time() - issued <= REPORT_WINDOW_SECONDS:
+        return False
+    if not hmac.compare_digest(signature, _signature(client, url, issued)):
+        return False
+    with _lock:
+        if (client, url) in _reported:
+            return False
+        _reported[(client, url)] = issued
+        while len(_reported) > REPORT_MAX_CLIENTS:
+            _reported.popitem(last=False)
+    record_failure(url)
+    return True
+
+
+def host_health(url):
+    """Smoothed success ratio of the host of `url`; 0.5 when nothing is known."""
+    host = _host(url)
+    with _lock:
+        entry = _host_stats.get(host)
+        successes, failures = _decayed(entry, time.time()) if entry else (0.0, 0.0)
+    return (successes + 1) / (successes + failures + 2)
+
+
+def score_candidate(candidate):
+    """
+    Health score in [0, 1] for a stream candidate
+
+    Combines the decayed success ratio of its host, its stream type and,
+    if one is cached, the host's last CDN probe. Never does I/O.
+    """
+    url = candidate.get("url")
+    measurement = get_host_measurement(url) if url else None
+    if measurement is None:
+        probe_weight = PROBE_UNKNOWN_WEIGHT
+    else:
+        probe_weight = PROBE_OK_WEIGHT if measurement.get("ok") else PROBE_FAILED_WEIGHT
+    type_weight = TYPE_WEIGHTS.get(candidate.get("type"), TYPE_WEIGHTS['iframe'])
+    return round(host_health(url) * type_weight * probe_weight, 3)
+
+
+def rank_by_health(candidates):
+    """
+    Copies of `candidates` with a fresh `score`, best first
+
+    Discovery order breaks ties, so earlier (faster) candidates win.
+    """
+    scored = [dict(candidate, score=score_candidate(candidate)) for candidate in candidates]
+    return [c for _, c in sorted(enumerate(scored), key=lambda item: (-item[1]["score"], item[0]))]
+
+
+def get_health_stats():
+    now = time.time()
+    with _lock:
+        snapshot = {host: _decayed(entry, now) for host, entry in _host_stats.items()}
+    return {
+        host: {
+            "successes": round(successes, 2),
+            "failures": round(failures, 2),
+            "health": round((successes + 1) / (successes + failures + 2), 3)
+        }
+        for host, (successes, failures) in snapshot.items()
+    }
@@ -0,0 +1,172 @@
+import os
+import time
+import logging
+import threading
+
+from . import stream_cache, metrics
+from . import bulk_resolver
+from .deadline import request_deadline
+from .resolver_pool import resolver_pool, ResolverSaturated
+from .stream_fetcher import get_m3u8_from_multiembed
+
+logger = logging.getLogger(__name__)
+
+# Resolve streams in the background when a title is likely to be played next
+SPECULATIVE_RESOLVE_ENABLED = os.getenv("SPECULATIVE_RESOLVE", "1") == "1"
+# Speculative resolutions running at once per worker; more are dropped, never queued
+SPECULATIVE_MAX_CONCURRENCY = int(os.getenv("SPECULATIVE_MAX_CONCURRENCY", "2"))
+# Only the top search results are worth resolving ahead of a click
+SPECULATIVE_SEARCH_TOP = int(os.getenv("SPECULATIVE_SEARCH_TOP", "3"))
+SPECULATIVE_SOURCE = 'auto'
+# Speculated entries not requested within this long are counted as wasted work
+SPECULATIVE_TRACK_SECONDS = 1800
+# Tracked entries are pruned at most this often, or sooner once there are more than SPECULATIVE_MAX_TRACKED
+PRUNE_INTERVAL_SECONDS = 60
+SPECULATIVE_MAX_TRACKED = 2000
+
+_slots = threading.BoundedSemaphore(SPECULATIVE_MAX_CONCURRENCY)
+# { imdb_id: time its speculative result leaves the cache } until the player asks or it goes to waste
+_speculated = {}
+metrics.register_cache("speculative", _speculated)
+# { imdb_id: whether the player asked for it already } while its speculative resolution runs
+_running = {}
+_lock = threading.Lock()
+_state = {"pruned_at": 0.0}
+_counters = {
+    "requested": 0,     # speculate() calls for a valid, uncached title
+    "started": 0,
+    "deduplicated": 0,  # already cached or being resolved
+    "dropped": 0,       # concurrency cap or resolver saturated
+    "resolved": 0,
+    "failed": 0,
+    "hits": 0,          # player asked for a title resolved speculatively
+    "wasted": 0         # speculated, never asked for before expiry
+}
+
+
+def _count(name, delta=1):
+    with _lock:
+        _counters[name] += delta
+
+
+def _resolve(imdb_id):
+    try:
+        with resolver_pool.background():
+            result = get_m3u8_from_multiembed(imdb_id, SPECULATIVE_SOURCE, deadline=request_deadline())
+        if stream_cache.is_success(result):
+            _count("resolved")
+            ttl = min(stream_cache.ttl_for_result(result), SPECULATIVE_TRACK_SECONDS)
+            with _lock:
+                # A request that joined the running resolution was counted as a hit already
+                if not _running.get(imdb_id):
+                    _speculated[imdb_id] = time.time() + ttl
+        else:
+            _count("failed")
+    except ResolverSaturated:
+        _count("dropped")
+    except Exception as e:
+        logger.info(f"Speculative resolution failed for {imdb_id}: {str(e)}")
+        _count("failed")
+    finally:
+        with _lock:
+            _running.pop(imdb_id, None)
+        bulk_resolver.release(imdb_id)
+        _slots.release()
+
+
+def speculate(imdb_id):
+    """
+    Start resolving `imdb_id` in the background if there is spare capacity
+
+    Deduplicated against cached titles and resolutions already running
+    (including bulk prefetches). Never blocks and never queues.
+
+    Returns:
+        bool: True if a resolution was started
+    """
+    if not SPECULATIVE_RESOLVE_ENABLED:
+        return False
+    statuses, todo = bulk_resolver.claim([imdb_id], SPECULATIVE_SOURCE)
+    if statuses.get(imdb_id) == 'invalid':
+        return False
+    _count("requested")
+    if not todo:
+        _count("deduplicated")
+        return False
+    if not _slots.acquire(blocking=False):
+        bulk_resolver.release(imdb_id)
+        _count("dropped")
+        return False
+    with _lock:
+        _running[imdb_id] = False
+    try:
+        resolver_pool.submit(_resolve, imdb_id)
+    except ResolverSaturated:
+        with _lock:
+            _running.pop(imdb_id, None)
+        bulk_resolver.release(imdb_id)
+        _slots.release()
+        _count("dropped")
+        return False
+    _count("started")
+    return True
+
+
+def speculate_many(imdb_ids, limit=SPECULATIVE_SEARCH_TOP):
+    """Speculate on the first `limit` IDs, e.g. the top search results"""
+    return sum(1 for imdb_id in imdb_ids[:limit] if imdb_id and speculate(imdb_id))
+
+
+def note_request(imdb_id):
+    """
+    Call when the player asks for a stream, to count speculative hits
+
+    A request arriving while the speculative resolution still runs counts
+    too: stream_cache.get_or_resolve makes it wait for that result rather
+    than resolving the title a second time.
+    """
+    now = time.time()
+    with _lock:
+        if _running.get(imdb_id) is False:
+            _running[imdb_id] = True
+            hit = True
+        else:
+            expires_at = _speculated.pop(imdb_id, None)
+            hit = expires_at is not None and expires_at > now
+            if expires_at is not None and not hit:
+                _counters["wasted"] += 1
+        if hit:
+            _counters["hits"] += 1
+    _prune()
+    return hit
+
+
+def _prune(force=False):
+    """Count entries whose cached result expired unrequested as wasted; cheap unless due"""
+    now = time.time()
+    with _lock:
+        if not force and len(_speculated) <= SPECULATIVE_MAX_TRACKED \
+                and now - _state["pruned_at"] < PRUNE_INTERVAL_SECONDS:
+            return
+        _state["pruned_at"] = now
+        expired = [imdb_id for imdb_id, expires_at in _speculated.items() if expires_at <= now]
+        for imdb_id in expired:
+            del _speculated[imdb_id]
+        # Still over the cap: drop the entries closest to expiry
+        excess = len(_speculated) - SPECULATIVE_MAX_TRACKED
+        if excess > 0:
+            expired += sorted(_speculated, key=_speculated.get)[:excess]
+            for imdb_id in expired[-excess:]:
+                del _speculated[imdb_id]
+        _counters["wasted"] += len(expired)
+
+
+def get_speculative_stats():
+    _prune(force=True)
+    with _lock:
+        stats = dict(_counters)
+        stats["pending_hits"] = len(_speculated)
+    settled = stats["hits"] + stats["wasted"]
+    stats["hit_rate"] = round(stats["hits"] / settled, 3) if settled else None
+    stats["enabled"] = SPECULATIVE_RESOLVE_ENABLED
+    return stats
@@ -0,0 +1,77 @@
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Taken when the api package is first imported, i.e. early in worker boot
+BOOT_STARTED = time.perf_counter()
+
+# { module_name: seconds spent importing it }
+_import_times = {}
+# { name: {'state': 'connecting'|'connected'|'failed', 'seconds': float, 'error': str} }
+_connections = {}
+_boot_seconds = None
+_lock = threading.Lock()
+
+
+def timed_import(module_name, package=None):
+    """Import a module and record how long the first import took."""
+    started = time.perf_counter()
+    module = importlib.import_module(module_name, package)
+    name = module.__name__
+    with _lock:
+        if name not in _import_times:
+            _import_times[name] = time.perf_counter() - started
+            logger.debug(f"Imported {name} in {_import_times[name] * 1000:.1f}ms")
+    return module
+
+
+def connect_in_background(name, connect):
+    """
+    Run `connect()` in a daemon thread instead of blocking worker boot
+
+    Args:
+        name (str): Connection name for the startup stats
+        connect (callable): Opens and checks the connection; raises on failure
+
+    Returns:
+        threading.Thread: The started connector thread
+    """
+    with _lock:
+        _connections[name] = {"state": "connecting", "seconds": None, "error": None}
+
+    def run():
+        started = time.perf_counter()
+        try:
+            connect()
+            state, error = "connected", None
+        except Exception as e:
+            state, error = "failed", str(e)
+            logger.warning(f"Background connection {name} failed: {error}")
+        with _lock:
+            _connections[name] = {"state": state, "seconds": time.perf_counter() - started, "error": error}
+
+    thread = threading.Thread(target=run, daemon=True, name=f"connect-{name}")
+    thread.start()
+    return thread
+
+
+def mark_booted(started=None):
+    """Record the time from `started` (default: api import) to the app being ready to serve."""
+    global _boot_seconds
+    with _lock:
+        if _boot_seconds is None:
+            _boot_seconds = time.perf_counter() - (started if started is not None else BOOT_STARTED)
+    logger.info(f"Worker booted in {_boot_seconds * 1000:.1f}ms")
+    return _boot_seconds
+
+
+def get_startup_stats():
+    with _lock:
+        return {
+            "boot_seconds": _boot_seconds,
+            "imports": dict(sorted(_import_times.items(), key=lambda item: -item[1])),
+            "connections": {name: dict(info) for name, info in _connections.items()}
+        }
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from .url_expiry import parse_url_expiry
+from .deadline import ensure_deadline, STREAM_REQUEST_BUDGET_SECONDS
+from .resolver_pool import resolver_pool, ResolverSaturated
+from .startup import connect_in_background
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# TTL for streams whose URL carries no expiry (e.g. plain embed pages)
+CACHE_TTL_SECONDS = int(os.getenv("STREAM_CACHE_TTL", "300"))
+# TTL for failed resolutions, so a flaky provider is retried soon
+FAILURE_TTL_SECONDS = int(os.getenv("STREAM_CACHE_FAILURE_TTL", "60"))
+# Signed URLs are dropped this long before the CDN would reject them
+EXPIRY_SAFETY_MARGIN_SECONDS = int(os.getenv("STREAM_EXPIRY_MARGIN", "60"))
+# Never keep an entry longer than this, even if its token is valid for days
+MAX_TTL_SECONDS = int(os.getenv("STREAM_CACHE_MAX_TTL", str(6 * 3600)))
+# Start a background refresh once less than this fraction of the TTL is left
+REFRESH_AHEAD_FRACTION = 0.2
+MAX_ENTRIES = int(os.getenv("STREAM_CACHE_MAX_ENTRIES", "5000"))
+# Expired entries are kept this long to be served when the resolver is saturated
+STALE_GRACE_SECONDS = int(os.getenv("STREAM_CACHE_STALE_GRACE", "600"))
+
+# Optional Redis shared by all workers and the warm_cache.py CLI (empty = per-process only)
+STREAM_CACHE_REDIS_URL = os.getenv("STREAM_CACHE_REDIS_URL", "")
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+BACKEND_KEY_PREFIX = "stream_cache:"
+
+# { key: (stored_at, expires_at, result_dict) }
+_stream_cache = {}
+_cache_lock = threading.Lock()
+# Keys with a background refresh in flight
+_refreshing = set()
+# { key: Event set once the resolution running for it has stored its result }
+_resolving = {}
+metrics.register_cache("stream", _stream_cache)
+
+
+# Redis client once connected, else None
+_backend = None
+
+
+def connect_backend():
+    """Connect the shared Redis backend now; raises if it is unreachable."""
+    global _backend
+    import redis
+    client = redis.Redis.from_url(
+        STREAM_CACHE_REDIS_URL,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT
+    )
+    client.ping()
+    _backend = client
+
+
+def check_backend():
+    """
+    Ping the shared backend now
+
+    Returns:
+        dict: configured, connected, reachable, ping_ms, error and the
+              usage of the client's connection pool
+    """
+    status = {"configured": bool(STREAM_CACHE_REDIS_URL), "connected": _backend is not None,
+              "reachable": None, "ping_ms": None, "error": None}
+    client = _backend
+    if client is None:
+        return status
+    started = time.perf_counter()
+    try:
+        client.ping()
+        status["reachable"] = True
+        status["ping_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    except Exception as e:
+        status["reachable"], status["error"] = False, str(e)
+    pool = client.connection_pool
+    status["pool"] = {
+        "in_use": len(getattr(pool, "_in_use_connections", ())),
+        "idle": len(getattr(pool, "_available_connections", ())),
+        "max": getattr(pool, "max_connections", None)
+    }
+    return status
+
+
+def _backend_get(key):
+    if _backend is None:
+        return None
+    try:
+        raw = _backend.get(BACKEND_KEY_PREFIX + key)
+        if raw is None:
+            return None
+        stored_at, expires_at, result = json.loads(raw)
+        return stored_at, expires_at, result
+    except Exception as e:
+        logger.debug(f"Shared cache read failed for {key}: {str(e)}")
+        return None
+
+
+def _backend_put(key, entry):
+    if _backend is None:
+        return
+    try:
+        # Redis keeps it through the stale grace period too
+        lifetime = int(entry[1] - time.time() + STALE_GRACE_SECONDS) + 1
+        _backend.setex(BACKEND_KEY_PREFIX + key, lifetime, json.dumps(entry))
+    except Exception as e:
+        logger.debug(f"Shared cache write failed for {key}: {str(e)}")
+
+
+def _lookup(key):
+    # Fresh local entry, else whichever of it and the shared backend's entry is newer;
+    # another process may have refreshed a key whose local copy only lingers for stale serving
+    with _cache_lock:
+        entry = _stream_cache.get(key)
+    if _backend is None or (entry is not None and entry[1] > time.time()):
+        return entry
+    shared = _backend_get(key)
+    metrics.cache_event("stream_redis", "hit" if shared is not None else "miss")
+    if shared is not None and (entry is None or shared[1] > entry[1]):
+        with _cache_lock:
+            current = _stream_cache.get(key)
+            if current is None or shared[1] > current[1]:
+                _stream_cache[key] = shared
+        entry = shared
+    return entry
+
+
+def result_url(result):
+    """The playable URL of a resolver result, whichever key the resolver used."""
+    if not result:
+        return None
+    return result.get("stream_url") or result.get("m3u8")
+
+
+def is_success(result):
+    return bool(result) and bool(result_url(result)) and result.get("success", True) is not False
+
+
+def ttl_for_result(result, now=None):
+    """
+    How long a resolver result may be served from cache
+
+    Signed URLs live until their encoded expiry minus a safety margin,
+    everything else gets the default TTL. Failures and fallbacks handed
+    out because time ran out are kept only FAILURE_TTL_SECONDS, so the
+    next request tries for a real stream again.
+    """
+    if not is_success(result) or result.get("fallback"):
+        return FAILURE_TTL_SECONDS
+
+    now = now if now is not None else time.time()
+    expiry = parse_url_expiry(result_url(result))
+    if expiry is None:
+        return CACHE_TTL_SECONDS
+    return max(0, min(MAX_TTL_SECONDS, expiry - EXPIRY_SAFETY_MARGIN_SECONDS - now))
+
+
+def get_entry(key):
+    """Return (result, seconds_left, ttl) for a fresh entry, or None."""
+    now = time.time()
+    entry = _lookup(key)
+    if not entry:
+        metrics.cache_event("stream", "miss")
+        return None
+    stored_at, expires_at, result = entry
+    if now >= expires_at:
+        metrics.cache_event("stream", "miss")
+        if now >= expires_at + STALE_GRACE_SECONDS:
+            with _cache_lock:
+                _stream_cache.pop(key, None)
+        return None
+    metrics.cache_event("stream", "hit")
+    return result, expires_at - now, expires_at - stored_at
+
+
+def get_stale(key):
+    """
+    Return an expired but still plausibly playable result, or None
+
+    Only successful results within the stale grace period qualify, and
+    never once a signed URL's own expiry has passed.
+    """
+    now = time.time()
+    entry = _lookup(key)
+    if not entry:
+        return None
+    _, expires_at, result = entry
+    if not is_success(result) or now >= expires_at + STALE_GRACE_SECONDS:
+        return None
+    url_expiry = parse_url_expiry(result_url(result))
+    if url_expiry is not None and now >= url_expiry:
+        return None
+    metrics.cache_event("stream", "stale")
+    return dict(result, stale=True)
+
+
+def get(key):
+    entry = get_entry(key)
+    return entry[0] if entry else None
+
+
+def put(key, result):
+    """Cache `result` under `key` with an expiry-aware TTL. Returns the TTL used."""
+    now = time.time()
+    ttl = ttl_for_result(result, now)
+    if ttl <= 0:
+        return 0
+    entry = (now, now + ttl, result)
+    with _cache_lock:
+        if key not in _stream_cache and len(_stream_cache) >= MAX_ENTRIES:
+            _evict(now)
+        _stream_cache[key] = entry
+    _backend_put(key, entry)
+    return ttl
+
+
+def _evict(now):
+    # Caller holds the lock. Drop expired entries, then the soonest to expire.
+    expired = [k for k, (_, expires_at, _) in _stream_cache.items() if expires_at <= now - STALE_GRACE_SECONDS]
+    for key in expired:
+        del _stream_cache[key]
+    evicted = len(expired)
+    if len(_stream_cache) >= MAX_ENTRIES:
+        del _stream_cache[min(_stream_cache, key=lambda k: _stream_cache[k][1])]
+        evicted += 1
+    if evicted:
+        metrics.cache_event("stream", "eviction", evicted)
+
+
+def invalidate(key):
+    with _cache_lock:
+        _stream_cache.pop(key, None)
+    if _backend is not None:
+        try:
+            _backend.delete(BACKEND_KEY_PREFIX + key)
+        except Exception as e:
+            logger.debug(f"Shared cache delete failed for {key}: {str(e)}")
+
+
+def _refresh(key, resolver):
+    try:
+        with resolver_pool.admit():
+            result = resolver()
+        # Don't replace a still-working entry with a failure
+        if is_success(result) or get(key) is None:
+            put(key, result)
+    except ResolverSaturated:
+        logger.info(f"Skipped background refresh for {key}: resolver saturated")
+    except Exception as e:
+        logger.warning(f"Background refresh failed for {key}: {str(e)}")
+    finally:
+        with _cache_lock:
+            _refreshing.discard(key)
+
+
+def schedule_refresh(key, resolver):
+    """Re-resolve `key` in a background thread unless a refresh is already running."""
+    with _cache_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(key, resolver), daemon=True, name=f"stream-refresh-{key}").start()
+    return True
+
+
+def get_or_resolve(key, resolver, refresher=None, deadline=None):
+    """
+    Serve `key` from cache, resolving it with `resolver()` on a miss
+
+    Entries in the last part of their lifetime are still served, but a
+    background refresh is started (with `refresher`, defaulting to
+    `resolver`) so the next caller gets a fresh URL.
+
+    A miss while another thread already resolves `key` (a speculative
+    resolution, a prefetch, another player) waits for that result instead,
+    for as long as `deadline` allows. Other misses take an in-flight slot
+    from the shared resolver pool. When none is free a stale entry is
+    served if there is one, otherwise ResolverSaturated propagates so the
+    caller can answer 503.
+    """
+    entry = get_entry(key)
+    if entry:
+        result, seconds_left, ttl = entry
+        tracing.annotate(cache="hit")
+        if is_success(result) and seconds_left < ttl * REFRESH_AHEAD_FRACTION:
+            schedule_refresh(key, refresher or resolver)
+        return result
+
+    with _cache_lock:
+        running = _resolving.get(key)
+        done = None if running is not None else _resolving.setdefault(key, threading.Event())
+    if running is not None:
+        tracing.annotate(cache="joined")
+        wait = min(ensure_deadline(deadline).remaining(), STREAM_REQUEST_BUDGET_SECONDS)
+        with tracing.span("join", key=key):
+            running.wait(wait)
+        joined = get(key)
+        if joined is not None:
+            return joined
+        # It failed without a result or is still going; resolve on our own
+
+    tracing.annotate(cache="miss")
+    try:
+        try:
+            with resolver_pool.admit(), tracing.span("resolve", key=key):
+                result = resolver()
+        except ResolverSaturated:
+            stale = get_stale(key)
+            if stale is not None:
+                logger.info(f"Resolver saturated, serving stale entry for {key}")
+                tracing.annotate(cache="stale")
+                return stale
+            raise
+        put(key, result)
+        return result
+    finally:
+        if done is not None:
+            with _cache_lock:
+                _resolving.pop(key, None)
+            done.set()
+
+
+def get_cache_stats():
+    now = time.time()
+    with _cache_lock:
+        return {
+            "entries": len(_stream_cache),
+            "refreshing": len(_refreshing),
+            "stale": sum(1 for _, expires_at, _ in _stream_cache.values() if expires_at <= now),
+            "shared_backend": _backend is not None,
+        }
+
+
+if STREAM_CACHE_REDIS_URL:
+    connect_in_background("stream_cache", connect_backend)
@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import queue
+import logging
+
+from . import stream_cache, tracing
+from .providers import BEST_STREAM, DIRECT_EMBED, providers_for
+from .deadline import ensure_deadline, request_deadline
+from .resolver_pool import resolver_pool, ResolverSaturated
+from .hls_manifest import attach_variants
+from .stream_fetcher import check_direct_embed, iter_multiembed_results, stream_cache_key
+from .source_health import record_success, record_failure, rank_by_health, report_token
+from .cdn_probe import STREAM_PROBE_ENABLED, PROBE_TIMEOUT_SECONDS, rank_candidates
+
+logger = logging.getLogger(__name__)
+
+# Comment line sent while waiting, so proxies keep the connection open
+HEARTBEAT_SECONDS = 2
+
+# After the first candidate, keep gathering this long for the ranked /api/stream list
+CANDIDATE_GATHER_WINDOW_SECONDS = float(os.getenv("STREAM_CANDIDATE_WINDOW", "2"))
+# How often the gatherer checks its window while waiting for results
+GATHER_TICK_SECONDS = 0.25
+# Direct embed checks running at once per stream; the next one starts as one finishes
+DIRECT_EMBED_WAVE = int(os.getenv("STREAM_DIRECT_EMBED_WAVE", "3"))
+
+# Marks a finished producer task on the result queue
+_DONE = object()
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def to_candidate(result):
+    """Turn a resolver result into the candidate shape pushed to the player"""
+    url = stream_cache.result_url(result)
+    stream_type = result.get("type")
+    if not stream_type:
+        lowered = url.lower()
+        stream_type = 'hls' if '.m3u8' in lowered else 'mp4' if '.mp4' in lowered else 'iframe'
+    if result.get("embed"):
+        stream_type = 'iframe'
+
+    variants = result.get("variants") or []
+    quality = result.get("quality")
+    if variants and variants[-1].get("label"):
+        quality = variants[-1]["label"]
+
+    candidate = {
+        "url": url,
+        "type": stream_type,
+        "source": result.get("source"),
+        "quality": quality
+    }
+    if variants:
+        candidate["variants"] = variants
+    if result.get("fallback"):
+        candidate["fallback"] = True
+    return candidate
+
+
+class CandidateStream:
+    """
+    Resolve streams for one title and yield SSE text as candidates appear
+
+    A cached result is the only candidate and costs no upstream work.
+    Otherwise the multiembed iframe stage and DIRECT_EMBED_WAVE direct embed
+    checks run on the shared resolver pool, the next direct embed starting
+    as one finishes. Template-only providers are pushed last as fallbacks.
+    Events are `candidate` (one per playable URL) and a final `done` with
+    the candidate count; the event stream ends at the first HLS candidate.
+
+    The first tasks are queued in the constructor, so saturation surfaces
+    as ResolverSaturated before any response is started. `close()` (called
+    by the WSGI server, also when the client goes away) stops the remaining
+    tasks and frees the in-flight slot.
+    """
+
+    def __init__(self, imdb_id, source='auto', deadline=None, admit=True, client=None):
+        self.imdb_id = imdb_id
+        self.client = client
+        self.cache_key = stream_cache_key(imdb_id, source)
+        self.deadline = ensure_deadline(deadline)
+        self.task_deadline = self.deadline.child()
+        self._results = queue.Queue()
+        self._futures = []
+        self._closed = False
+        self._complete = False
+        self._admission = None
+        self._waiting = iter(())
+
+        cached = stream_cache.get(self.cache_key)
+        self._cached = to_candidate(cached) if stream_cache.is_success(cached) else None
+        if self._cached is not None and _playable(self._cached):
+            return
+        self._cached = None
+
+        # Callers already holding an in-flight slot (e.g. via the stream cache) pass admit=False
+        self._admission = resolver_pool.admit() if admit else None
+        if self._admission is not None:
+            self._admission.__enter__()
+        try:
+            self._submit(self._run, iter_multiembed_results, imdb_id, source, self.task_deadline)
+        except ResolverSaturated:
+            self.close()
+            raise
+        self._waiting = iter(providers_for(DIRECT_EMBED))
+        for _ in range(DIRECT_EMBED_WAVE):
+            self._submit_next()
+
+    def _submit(self, fn, *args):
+        self._futures.append(resolver_pool.submit(fn, *args))
+
+    def _submit_next(self):
+        """Start the next direct embed check, if any is left; returns how many were started"""
+        provider = next(self._waiting, None)
+        if provider is None or self._closed:
+            return 0
+        try:
+            self._submit(self._run, self._direct_embed, provider)
+        except ResolverSaturated:
+            # Leave the rest; the tasks already running carry on
+            logger.info(f"Resolver saturated, no further direct embeds for {self.imdb_id}")
+            self._waiting = iter(())
+            return 0
+        return 1
+
+    def _run(self, producer, *args):
+        try:
+            for result in producer(*args):
+                if result and result.get("success", True) is not False:
+                    if result.get("type", "hls") == 'hls':
+                        attach_variants(result, self.task_deadline)
+                    record_success(stream_cache.result_url(result))
+                    self._results.put(result)
+        except Exception as e:
+            logger.warning(f"Candidate task failed for {self.imdb_id}: {str(e)}")
+        finally:
+            self._results.put(_DONE)
+
+    def _direct_embed(self, provider):
+        with provider.slot() as acquired:
+            if acquired:
+                result = check_direct_embed(provider, self.imdb_id, self.task_deadline.sub(provider.timeout))
+                if result:
+                    yield result
+                elif not self.task_deadline.is_cancelled():
+                    record_failure(provider.url_template)
+
+    def __iter__(self):
+        return self._events()
+
+    def iter_candidates(self, heartbeat=HEARTBEAT_SECONDS, until_hls=False):
+        """
+        Yield candidate dicts as providers produce them
+
+        None is yielded every `heartbeat` seconds without a result, so the
+        consumer can send keepalives or check its own clock. With `until_hls`
+        iteration stops after the first HLS candidate. Template fallbacks
+        are not included, see `fallback_candidates`.
+        """
+        if self._cached is not None:
+            self._complete = True
+            yield self._cached
+            return
+
+        sent = set()
+        first = None
+        pending = len(self._futures)
+
+        while pending and not self.deadline.expired():
+            try:
+                result = self._results.get(timeout=min(heartbeat, self.deadline.remaining()))
+            except queue.Empty:
+                yield None
+                continue
+            if result is _DONE:
+                # Keep DIRECT_EMBED_WAVE checks going until the list runs out
+                pending += self._submit_next() - 1
+                continue
+            # Direct manifests beat embed pages as the entry kept for /api/stream
+            if first is None or (first.get("type") == 'iframe' and result.get("type") != 'iframe'):
+                first = result
+            candidate = to_candidate(result)
+            if _playable(candidate) and candidate["url"] not in sent:
+                sent.add(candidate["url"])
+                yield candidate
+                if until_hls and candidate["type"] == 'hls':
+                    break
+
+        self._complete = pending == 0
+        if first is not None and stream_cache.get(self.cache_key) is None:
+            stream_cache.put(self.cache_key, first)
+
+    def fallback_candidates(self):
+        """Candidates from template-only providers; no I/O, only worth offering as a last resort"""
+        candidates = []
+        for provider in providers_for(BEST_STREAM):
+            if provider.network:
+                continue
+            try:
+                result = provider.resolve(self.imdb_id, deadline=self.task_deadline)
+            except Exception as e:
+                logger.warning(f"{provider.name} template failed: {str(e)}")
+                continue
+            if result and result.get("stream_url"):
+                candidate = to_candidate(dict(result, source=provider.name))
+                # Never verified to play; a list of only these is cached briefly, see stream_cache.ttl_for_result
+                candidate["fallback"] = True
+                if _playable(candidate):
+                    candidates.append(candidate)
+        return candidates
+
+    def _event(self, candidate):
+        if self.client is not None:
+            # Lets the client report this URL broken later, see source_health.record_report
+            candidate = dict(candidate, report_token=report_token(self.client, candidate["url"]))
+        return format_event("candidate", candidate)
+
+    def _events(self):
+        sent = set()
+        try:
+            for candidate in self.iter_candidates(until_hls=True):
+                if candidate is None:
+                    yield ": keepalive\n\n"
+                    continue
+                sent.add(candidate["url"])
+                yield self._event(candidate)
+
+            for candidate in self.fallback_candidates():
+                if candidate["url"] not in sent:
+                    sent.add(candidate["url"])
+                    yield self._event(candidate)
+
+            yield format_event("done", {"count": len(sent), "complete": self._complete})
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.task_deadline.cancel()
+        resolver_pool.cancel(self._futures)
+        if self._admission is not None:
+            self._admission.__exit__(None, None, None)
+
+
+def _playable(candidate):
+    return (candidate["url"] or '').startswith(('http://', 'https://'))
+
+
+def gather_candidates(imdb_id, source='auto', deadline=None, window=CANDIDATE_GATHER_WINDOW_SECONDS, admit=True):
+    """
+    Collect candidates until `window` seconds after the first one, ranked by health
+
+    Args:
+        imdb_id (str): IMDb ID
+        source (str): Preferred source, see `prioritize_iframes`
+        deadline (Deadline): Request time budget; gathering never outlasts it
+        window (float): Extra seconds to wait for alternatives after the first candidate
+
+    Returns:
+        list: Candidate dicts with a `score`, best first
+    """
+    stream = CandidateStream(imdb_id, source, deadline, admit=admit)
+    candidates = []
+    first_at = None
+    try:
+        for candidate in stream.iter_candidates(heartbeat=GATHER_TICK_SECONDS):
+            if candidate is not None:
+                candidates.append(candidate)
+                first_at = first_at or time.monotonic()
+            if first_at is not None and time.monotonic() - first_at >= window:
+                break
+        seen = {c["url"] for c in candidates}
+        candidates.extend(c for c in stream.fallback_candidates() if c["url"] not in seen)
+    finally:
+        stream.close()
+    _probe(candidates, stream.deadline)
+    return rank_by_health(candidates)
+
+
+def _probe(candidates, deadline):
+    """Measure the CDNs of direct candidates, so rank_by_health weighs delivery speed too"""
+    urls = [c["url"] for c in candidates if c["type"] != 'iframe']
+    # A playlist probe is up to three requests (master, variant, segment), all within the deadline
+    timeout = min(PROBE_TIMEOUT_SECONDS, deadline.remaining() / 3)
+    if not STREAM_PROBE_ENABLED or len(urls) < 2 or timeout < PROBE_TIMEOUT_SECONDS / 5:
+        return
+    with tracing.span("probe", candidates=len(urls)):
+        rank_candidates(urls, timeout=timeout)
+
+
+def get_stream_candidates(imdb_id, source='auto', deadline=None):
+    """
+    Ranked candidate list for /api/stream, cached like single results
+
+    The list is cached under the same key as single results, whose shape
+    it extends, so a title warmed by prefetch, speculation or warm_cache.py
+    is served from cache here too, as a one-candidate list. The best
+    candidate is also returned in the usual single-stream fields, so
+    callers that ignore `candidates` keep working. Scores are recomputed on
+    every call, so cached lists follow the latest health data.
+
+    Returns:
+        dict: {'success': bool, 'm3u8': str, 'type': str, 'source': str, 'candidates': list}
+    """
+    result = stream_cache.get_or_resolve(
+        stream_cache_key(imdb_id, source),
+        lambda: _candidates_result(gather_candidates(imdb_id, source, deadline, admit=False)),
+        # Background refreshes outlive the request, so they get a budget of their own
+        refresher=lambda: _candidates_result(gather_candidates(imdb_id, source, request_deadline(), admit=False)),
+        deadline=deadline
+    )
+    candidates = result.get("candidates")
+    if not candidates and stream_cache.is_success(result):
+        candidate = to_candidate(result)
+        candidates = [candidate] if _playable(candidate) else []
+    if not candidates:
+        return result
+    return _candidates_result(rank_by_health(candidates), stale=result.get("stale"))
+
+
+def _candidates_result(candidates, stale=None):
+    if not candidates:
+        return {"success": False, "error": "No working stream found", "candidates": []}
+    best = candidates[0]
+    result = {
+        "success": True,
+        "m3u8": best["url"],
+        "type": best["type"],
+        "source": best["source"],
+        "quality": best["quality"],
+        "candidates": candidates
+    }
+    if best.get("variants"):
+        result["variants"] = best["variants"]
+    if all(candidate.get("fallback") for candidate in candidates):
+        result["fallback"] = True
+    if stale:
+        result["stale"] = True
+    return result
@@ -1,109 +1,174 @@
 import os
 import time
 import logging
-import requests
 from urllib.parse import urlparse, urljoin
 import re
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from . import stream_cache
+from .deadline import ensure_deadline, request_deadline
+from .providers import DIRECT_EMBED, providers_for, provider_for_url
+from .host_limits import host_slot
+from .provider_stats import timed_attempt
+from . import tracing
+
 logger = logging.getLogger(__name__)
 
-def get_m3u8_from_multiembed(imdb_id, source='auto'):
+# Budget kept back from the direct embed loop so the multiembed stage can still run
+MULTIEMBED_RESERVE_SECONDS = 5
+
+def stream_cache_key(imdb_id, source='auto'):
+    """
+    Stream cache key of a title
+
+    Every path shares it: /api/stream with or without candidates, its event
+    stream, bulk prefetch, speculation and warm_cache.py.
+    """
+    return f"multiembed:{imdb_id}:{source}"
+
+def get_m3u8_from_multiembed(imdb_id, source='auto', deadline=None):
     """
     Extract M3U8 stream URL from multiple streaming sources with enhanced reliability
     
+    Results are cached per IMDb ID and source, honouring the expiry of signed URLs.
+    
     Args:
         imdb_id (str): IMDb ID (e.g., 'tt1234567')
         source (str): Preferred source ('mixdrop', 'vidsrc', 'streamwish', 'doodstream', 'auto')
+        deadline (Deadline): Request time budget; every outbound call is capped by it
     
     Returns:
         dict: {'success': bool, 'm3u8': str, 'error': str}
     """
+    return stream_cache.get_or_resolve(
+        stream_cache_key(imdb_id, source),
+        lambda: _resolve_multiembed(imdb_id, source, deadline),
+        # Background refreshes outlive the request, so they get a budget of their own
+        refresher=lambda: _resolve_multiembed(imdb_id, source, request_deadline()),
+        deadline=deadline
+    )
+
+EMBED_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1"
+}
+
+def _resolve_multiembed(imdb_id, source='auto', deadline=None):
     logger.info(f"Fetching stream for IMDb ID: {imdb_id} with source: {source}")
+    deadline = ensure_deadline(deadline)
     
-    # Enhanced direct embed URLs with better working sources
-    direct_embed_urls = [
-        f"https://multiembed.mov/directstream.php?video_id={imdb_id}&imdb=1",
-        f"https://2embed.cc/embed/movie?imdb={imdb_id}",
-        f"https://www.2embed.to/embed/imdb/movie?id={imdb_id}",
-        f"https://embed.su/embed/movie/{imdb_id}",
-        f"https://vidsrc.me/embed/movie?imdb={imdb_id}",
-        f"https://moviesapi.club/movie/{imdb_id}",
-        f"https://vidsrc.to/embed/movie/{imdb_id}",
-        f"https://autoembed.cc/movie/imdb/{imdb_id}",
-        f"https://streamm4u.ws/embed/movie/{imdb_id}",
-        f"https://vidplay.online/embed/movie/{imdb_id}",
-        f"https://vidbinge.com/embed/movie/{imdb_id}",
-        f"https://www.filmxy.vip/embed/movie/{imdb_id}",
-        f"https://vidbinge.dev/embed/movie/{imdb_id}",
-        f"https://www.showboxmovies.net/embed/movie/{imdb_id}",
-        f"https://vidsrc.xyz/embed/movie/{imdb_id}",
-        f"https://embedsito.com/v/movie/{imdb_id}",
-        f"https://www.2embed.org/embed/movie/{imdb_id}",
-        f"https://movieshd.watch/embed/movie/{imdb_id}"
-    ]
+    # Try direct embed URLs first, in registry order
+    for provider in providers_for(DIRECT_EMBED):
+        if not deadline.allows(MULTIEMBED_RESERVE_SECONDS + provider.cost):
+            logger.info(f"Time budget low ({deadline.remaining():.1f}s left), skipping remaining direct embeds")
+            break
+        result = check_direct_embed(provider, imdb_id, deadline)
+        if result:
+            return result
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1"
-    }
+    # If direct embeds don't work, try multiembed with iframe extraction
+    for result in iter_multiembed_results(imdb_id, source, deadline):
+        return result
+    return {"success": False, "error": "Multiembed extraction failed"}
+
+def check_direct_embed(provider, imdb_id, deadline=None):
+    """
+    Fetch one direct embed page and turn it into a stream result
     
-    # Try direct embed URLs first
-    for embed_url in direct_embed_urls:
-        try:
-            logger.info(f"Trying direct embed: {embed_url}")
-            
-            # Quick test to see if the URL is accessible
-            response = requests.get(embed_url, headers=headers, timeout=10)
+    Args:
+        provider (Provider): DIRECT_EMBED registry entry
+        imdb_id (str): IMDb ID
+        deadline (Deadline): Request time budget
+    
+    Returns:
+        dict: Stream result, or None if the page is unusable
+    """
+    embed_url = provider.build_url(imdb_id)
+    with timed_attempt(provider.name, embed_url) as attempt:
+        result = _fetch_direct_embed(embed_url, provider, ensure_deadline(deadline))
+        attempt["ok"] = result is not None
+    return result
+
+def _fetch_direct_embed(embed_url, provider, deadline):
+    try:
+        logger.info(f"Trying direct embed: {embed_url}")
+        
+        # Quick test to see if the URL is accessible
+        with host_slot(embed_url, deadline):
+            response = tracing.get(embed_url, headers=EMBED_HEADERS, timeout=deadline.timeout(provider.timeout))
+        
+        if response.status_code == 200:
+            content = response.text.lower()
             
-            if response.status_code == 200:
-                content = response.text.lower()
+            # Check if it contains video player elements
+            video_indicators = ['video', 'player', 'stream', 'embed', 'iframe', 'source', 'jwplayer', 'videojs']
+            if any(indicator in content for indicator in video_indicators):
+                logger.info(f"Found working embed URL: {embed_url}")
                 
-                # Check if it contains video player elements
-                video_indicators = ['video', 'player', 'stream', 'embed', 'iframe', 'source', 'jwplayer', 'videojs']
-                if any(indicator in content for indicator in video_indicators):
-                    logger.info(f"Found working embed URL: {embed_url}")
-                    
-                    # Try to extract direct M3U8 URLs from the content
+                # Try to extract direct M3U8 URLs from the content
+                with tracing.span("extract", method="m3u8_from_content", bytes=len(response.text)):
                     m3u8_urls = extract_m3u8_from_content(response.text)
-                    if m3u8_urls:
-                        # Validate the M3U8 URL
-                        for m3u8_url in m3u8_urls:
-                            if validate_stream_url(m3u8_url):
-                                logger.info(f"Found valid direct M3U8 URL: {m3u8_url}")
-                                return {
-                                    "success": True,
-                                    "m3u8": m3u8_url,
-                                    "source": "direct_m3u8",
-                                    "type": "hls"
-                                }
-                    
-                    # If no direct M3U8, return embed URL for iframe
-                    return {
-                        "success": True,
-                        "m3u8": embed_url,
-                        "source": "embed",
-                        "type": "iframe"
-                    }
-        except Exception as e:
-            logger.warning(f"Direct embed failed {embed_url}: {str(e)}")
-            continue
+                if m3u8_urls:
+                    # Validate the M3U8 URL
+                    for m3u8_url in m3u8_urls:
+                        if validate_stream_url(m3u8_url):
+                            logger.info(f"Found valid direct M3U8 URL: {m3u8_url}")
+                            return {
+                                "success": True,
+                                "m3u8": m3u8_url,
+                                "source": "direct_m3u8",
+                                "type": "hls"
+                            }
+                
+                # If no direct M3U8, return embed URL for iframe
+                return {
+                    "success": True,
+                    "m3u8": embed_url,
+                    "source": "embed",
+                    "type": "iframe"
+                }
+    except Exception as e:
+        logger.warning(f"Direct embed failed {embed_url}: {str(e)}")
+    return None
+
+def iter_multiembed_results(imdb_id, source='auto', deadline=None):
+    """
+    Yield stream results from the multiembed aggregator page as they are extracted
     
-    # If direct embeds don't work, try multiembed with iframe extraction
+    Every iframe on the page is tried in preference order; the aggregator
+    page itself is only yielded when nothing else was found.
+    
+    Args:
+        imdb_id (str): IMDb ID
+        source (str): Preferred source, see `prioritize_iframes`
+        deadline (Deadline): Request time budget
+    
+    Yields:
+        dict: {'success': True, 'm3u8': str, 'source': str, 'type': str}
+    """
+    deadline = ensure_deadline(deadline)
+    multiembed_url = f"https://multiembed.mov/movie/imdb/{imdb_id}"
+    found = False
     try:
-        multiembed_url = f"https://multiembed.mov/movie/imdb/{imdb_id}"
+        if deadline.expired():
+            # Out of time: hand the player the aggregator page itself, marked so it is only cached briefly
+            logger.warning(f"Time budget exhausted for {imdb_id}, returning multiembed page")
+            yield {"success": True, "m3u8": multiembed_url, "source": "multiembed", "type": "iframe", "fallback": True}
+            return
         logger.info(f"Trying multiembed: {multiembed_url}")
         
-        response = requests.get(multiembed_url, headers=headers, timeout=15)
+        with timed_attempt("multiembed", multiembed_url) as attempt, host_slot(multiembed_url, deadline):
+            response = tracing.get(multiembed_url, headers=EMBED_HEADERS, timeout=deadline.timeout(15))
+            attempt["ok"] = response.status_code == 200
         
         if response.status_code == 200:
             # Look for iframe URLs in the response
-            iframe_urls = extract_iframe_urls(response.text, multiembed_url)
+            with tracing.span("extract", method="iframe_urls", bytes=len(response.text)) as span:
+                iframe_urls = extract_iframe_urls(response.text, multiembed_url)
+                span["found"] = len(iframe_urls)
             
             # Prioritize iframes based on source preference
             prioritized_iframes = prioritize_iframes(iframe_urls, source)
@@ -111,27 +176,37 @@ def get_m3u8_from_multiembed(imdb_id, source='auto'):
             for iframe_url in prioritized_iframes:
                 logger.info(f"Found streaming iframe: {iframe_url}")
                 
-                # Try to extract M3U8 from this iframe
-                if 'mixdrop' in iframe_url.lower():
-                    from .mixdrop_scraper import extract_m3u8_from_mixdrop
-                    m3u8_url = extract_m3u8_from_mixdrop(iframe_url)
-                    if m3u8_url:
-                        return {"success": True, "m3u8": m3u8_url, "source": "mixdrop", "type": "hls"}
-                
-                elif 'vidsrc' in iframe_url.lower():
-                    from .vidsrc_scraper import extract_from_vidsrc
-                    m3u8_url = extract_from_vidsrc(iframe_url)
+                # Try to extract M3U8 from this iframe with its registered extractor
+                provider = provider_for_url(iframe_url)
+                if provider:
+                    if not provider.affordable(deadline):
+                        logger.info(f"Not enough time left for {provider.name} extraction, skipping")
+                        continue
+                    with provider.slot() as acquired:
+                        if not acquired:
+                            logger.info(f"{provider.name} extractor at its concurrency cap, skipping")
+                            continue
+                        with timed_attempt(provider.name, iframe_url) as attempt:
+                            m3u8_url = provider.extract(iframe_url, deadline.sub(provider.timeout))
+                            attempt["ok"] = bool(m3u8_url)
                     if m3u8_url:
-                        return {"success": True, "m3u8": m3u8_url, "source": "vidsrc", "type": "hls"}
+                        found = True
+                        yield {"success": True, "m3u8": m3u8_url, "source": provider.name, "type": provider.stream_type}
                 
                 else:
                     # For other sources, try generic extraction
-                    m3u8_url = extract_m3u8_from_generic_iframe(iframe_url)
+                    with timed_attempt("generic", iframe_url) as attempt:
+                        m3u8_url = extract_m3u8_from_generic_iframe(iframe_url, deadline)
+                        attempt["ok"] = bool(m3u8_url)
+                    found = True
                     if m3u8_url:
-                        return {"success": True, "m3u8": m3u8_url, "source": "generic", "type": "hls"}
-                    
-                    # If no M3U8 found, return iframe URL directly
-                    return {"success": True, "m3u8": iframe_url, "source": "iframe", "type": "iframe"}
+                        yield {"success": True, "m3u8": m3u8_url, "source": "generic", "type": "hls"}
+                    else:
+                        # If no M3U8 found, hand out the iframe URL directly
+                        yield {"success": True, "m3u8": iframe_url, "source": "iframe", "type": "iframe"}
+        
+        if found:
+            return
         
         # If no specific iframes found, try to extract any streaming URLs
         stream_urls = extract_streaming_urls(response.text)
@@ -140,14 +215,16 @@ def get_m3u8_from_multiembed(imdb_id, source='auto'):
             if validate_stream_url(stream_url):
                 logger.info(f"Found stream URL: {stream_url}")
                 stream_type = determine_stream_type(stream_url)
-                return {"success": True, "m3u8": stream_url, "source": "extracted", "type": stream_type}
+                yield {"success": True, "m3u8": stream_url, "source": "extracted", "type": stream_type}
+                return
         
         # If no streams found, return the multiembed URL as fallback
-        return {"success": True, "m3u8": multiembed_url, "source": "multiembed", "type": "iframe"}
+        yield {"success": True, "m3u8": multiembed_url, "source": "multiembed", "type": "iframe"}
         
     except Exception as e:
         logger.error(f"Multiembed extraction failed: {str(e)}")
-        return {"success": False, "error": f"Multiembed extraction failed: {str(e)}"}
+        if not found:
+            yield {"success": False, "error": f"Multiembed extraction failed: {str(e)}"}
 
 def extract_iframe_urls(html_content, base_url):
     """Extract iframe URLs from HTML content"""
@@ -230,18 +307,20 @@ def extract_streaming_urls(content):
     
     return list(set(urls))
 
-def extract_m3u8_from_generic_iframe(iframe_url):
+def extract_m3u8_from_generic_iframe(iframe_url, deadline=None):
     """Extract M3U8 from generic iframe"""
+    deadline = ensure_deadline(deadline)
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Referer': 'https://multiembed.mov/'
         }
         
-        response = requests.get(iframe_url, headers=headers, timeout=15)
+        response = tracing.get(iframe_url, headers=headers, timeout=deadline.timeout(15))
         
         if response.status_code == 200:
-            m3u8_urls = extract_m3u8_from_content(response.text)
+            with tracing.span("extract", method="m3u8_from_content", bytes=len(response.text)):
+                m3u8_urls = extract_m3u8_from_content(response.text)
             
             for m3u8_url in m3u8_urls:
                 if validate_stream_url(m3u8_url):
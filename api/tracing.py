@@ -0,0 +1,301 @@
+"""
+Stage-level traces of stream resolution
+
+A trace is started per request with `start_trace`. Code on the resolution
+path then opens spans with `span(...)` (or `stage(...)` inside a function
+decorated with `traced`), and its outbound calls go through `get` here (a
+TracedSession), which gives each one a span of its own while a trace is
+active. Nothing outside the resolvers is patched or wrapped. Work handed
+to other threads keeps the trace when the callable is wrapped with `bind`;
+the resolver pool does that for every task.
+
+With no trace active, spans cost one thread-local lookup, so the
+instrumentation stays in place outside traced requests.
+
+Finished traces of at least TRACE_LOG_MIN_SECONDS are appended to
+TRACE_LOG as JSON lines, rotated at TRACE_LOG_MAX_BYTES, and any trace can
+be returned in the /api/stream `debug` payload with ?trace=1. URLs are
+recorded without their query string, which often carries signed tokens.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to stop starting traces; spans then cost nothing
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+# JSON lines file finished traces are appended to (empty = only returned on request)
+TRACE_LOG = os.getenv("TRACE_LOG", "traces.jsonl")
+# Only traces at least this long are written to TRACE_LOG, so normal traffic writes nothing
+TRACE_LOG_MIN_SECONDS = float(os.getenv("TRACE_LOG_MIN_SECONDS", "5"))
+# TRACE_LOG is moved to TRACE_LOG.1 (replacing it) once it grows past this
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+# Spans kept per trace, so a runaway loop cannot grow one without bound
+MAX_SPANS = 500
+# Leaf spans listed under 'slowest' in a finished trace
+SLOWEST_SPANS = 5
+# Caller-supplied trace IDs are only accepted in this shape
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Per thread: .trace (Trace), .span_id (innermost open span) and .stages (see `traced`)
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Spans recorded for one request, possibly from several threads
+
+    Args:
+        name (str): What is being traced, e.g. 'api.stream'
+        trace_id (str): ID to use, e.g. from an incoming X-Trace-Id header
+        attrs: Extra fields stored with the trace
+    """
+
+    def __init__(self, name, trace_id=None, **attrs):
+        if not trace_id or not TRACE_ID_PATTERN.fullmatch(trace_id):
+            trace_id = uuid.uuid4().hex[:16]
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.duration = None
+        self._t0 = time.perf_counter()
+        self._spans = []
+        self._dropped = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def _add(self, span):
+        with self._lock:
+            if len(self._spans) < MAX_SPANS:
+                self._spans.append(span)
+            else:
+                self._dropped += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._t0
+
+    def to_dict(self):
+        """The trace with spans in start order and the slowest leaf spans up front"""
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: s["start_ms"])
+            dropped = self._dropped
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._t0
+        parents = {s["parent"] for s in spans}
+        leaves = sorted((s for s in spans if s["id"] not in parents), key=lambda s: s["duration_ms"], reverse=True)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 1),
+            "attrs": self.attrs,
+            "slowest": [{"name": s["name"], "duration_ms": s["duration_ms"], **s["attrs"]}
+                        for s in leaves[:SLOWEST_SPANS]],
+            "spans": spans,
+            "dropped_spans": dropped
+        }
+
+
+def redact_url(url):
+    """`url` without query string and fragment, where signed URLs keep their tokens"""
+    try:
+        parts = urlsplit(str(url))
+    except ValueError:
+        return None
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))[:300]
+
+
+def current():
+    """The trace active on this thread, or None"""
+    return getattr(_local, "trace", None)
+
+
+def annotate(**attrs):
+    """Add fields to the active trace, if any"""
+    trace = current()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def _write(trace):
+    if not TRACE_LOG or trace.duration < TRACE_LOG_MIN_SECONDS:
+        return
+    try:
+        line = json.dumps(trace.to_dict(), default=str)
+        with _log_lock:
+            if os.path.exists(TRACE_LOG) and os.path.getsize(TRACE_LOG) >= TRACE_LOG_MAX_BYTES:
+                os.replace(TRACE_LOG, TRACE_LOG + ".1")
+            with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"Could not append trace to {TRACE_LOG}: {str(e)}")
+
+
+@contextmanager
+def start_trace(name, trace_id=None, **attrs):
+    """
+    Trace everything this thread does inside the block
+
+    Yields the Trace, or None when tracing is disabled or a trace is
+    already active (the outer one keeps collecting). The trace is written
+    to TRACE_LOG when the block ends.
+    """
+    if not TRACING_ENABLED or current() is not None:
+        yield None
+        return
+    trace = Trace(name, trace_id, **attrs)
+    _local.trace, _local.span_id = trace, None
+    try:
+        yield trace
+    finally:
+        _local.trace, _local.span_id = None, None
+        trace.finish()
+        _write(trace)
+
+
+def _open(trace, name, attrs):
+    opened = (trace._next_id(), getattr(_local, "span_id", None), name, time.perf_counter(), attrs)
+    _local.span_id = opened[0]
+    return opened
+
+
+def _close(trace, opened):
+    span_id, parent, name, started, attrs = opened
+    _local.span_id = parent
+    ended = time.perf_counter()
+    trace._add({
+        "id": span_id,
+        "parent": parent,
+        "name": name,
+        "start_ms": round((started - trace._t0) * 1000, 1),
+        "duration_ms": round((ended - started) * 1000, 1),
+        "thread": threading.current_thread().name,
+        "attrs": attrs
+    })
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Record the block as a span of the active trace
+
+    Yields the span's attribute dict, so results can be added to it
+    (e.g. `s["ok"] = True`). Does nothing but yield when no trace is active.
+    A `url` attribute is stored without its query string.
+    """
+    trace = current()
+    if trace is None:
+        yield attrs
+        return
+    if attrs.get("url"):
+        attrs["url"] = redact_url(attrs["url"])
+    opened = _open(trace, name, attrs)
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        _close(trace, opened)
+
+
+def traced(name):
+    """
+    Decorator: record each call as a span that `stage()` calls split up
+
+    Inside the function, `stage("method 1")` ends the previous stage and
+    starts the next, so a long sequence of attempts can be timed one line
+    per step. The last stage ends when the function returns.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return fn(*args, **kwargs)
+            stages = getattr(_local, "stages", None)
+            if stages is None:
+                stages = _local.stages = []
+            with span(name):
+                stages.append(None)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    _end_stage(stages)
+                    stages.pop()
+        return wrapper
+    return decorate
+
+
+def _end_stage(stages):
+    if stages and stages[-1] is not None:
+        _close(current(), stages[-1])
+        stages[-1] = None
+
+
+def stage(name, **attrs):
+    """Start the next stage of the innermost `traced` call, ending the previous one"""
+    trace = current()
+    stages = getattr(_local, "stages", None)
+    if trace is None or not stages:
+        return
+    _end_stage(stages)
+    stages[-1] = _open(trace, name, attrs)
+
+
+def bind(fn):
+    """Wrap `fn` so it records into this thread's trace and span when run on another thread"""
+    trace = current()
+    if trace is None:
+        return fn
+    parent = getattr(_local, "span_id", None)
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        saved = (current(), getattr(_local, "span_id", None), getattr(_local, "stages", None))
+        _local.trace, _local.span_id, _local.stages = trace, parent, []
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace, _local.span_id, _local.stages = saved
+    return run
+
+
+# ---------- fetch spans ----------
+
+class TracedSession(requests.Session):
+    """Session that records a fetch span for every request (and redirect hop) sent while a trace is active"""
+
+    def send(self, request, **kwargs):
+        if current() is None:
+            return super().send(request, **kwargs)
+        parts = urlsplit(request.url)
+        with span("fetch", method=request.method, host=parts.netloc, path=parts.path[:120]) as attrs:
+            response = super().send(request, **kwargs)
+            attrs["status"] = response.status_code
+            # Time to response headers, DNS and connect included; for stream=True the body is read later
+            attrs["headers_ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+            return response
+
+
+def get(url, **kwargs):
+    """`requests.get` for the resolvers' outbound calls, with a fetch span when traced"""
+    # A session per call, as requests.get does, so no cookies carry over between calls
+    with TracedSession() as session:
+        return session.get(url, **kwargs)
@@ -0,0 +1,103 @@
+import re
+import json
+import time
+import base64
+import logging
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qsl, unquote
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry an absolute expiry timestamp
+EXPIRY_PARAMS = ('expires', 'expire', 'expiry', 'expiration', 'exp', 'e', 'deadline', 'validto', 'valid_to')
+
+# Anything before 2001 or after 2100 is not an expiry timestamp
+_MIN_EPOCH = 1_000_000_000
+_MAX_EPOCH = 4_102_444_800
+
+_JWT_PATTERN = re.compile(r'eyJ[\w-]+\.eyJ[\w-]+\.[\w-]*')
+# Akamai style tokens: hdnts=st=...~exp=...~acl=...~hmac=...
+_TOKEN_EXP_PATTERN = re.compile(r'(?:^|[~&])exp=(\d{9,13})')
+
+
+def _as_epoch(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number > _MAX_EPOCH * 10:
+        number /= 1000.0  # milliseconds
+    if _MIN_EPOCH <= number <= _MAX_EPOCH:
+        return number
+    return None
+
+
+def _jwt_expiry(token):
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return _as_epoch(claims.get('exp'))
+    except Exception:
+        return None
+
+
+def _amz_expiry(params):
+    # AWS SigV4: X-Amz-Date=20250101T000000Z&X-Amz-Expires=3600
+    try:
+        signed = datetime.strptime(params['x-amz-date'], '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+        return signed.timestamp() + int(params['x-amz-expires'])
+    except (KeyError, ValueError):
+        return None
+
+
+def parse_url_expiry(url):
+    """
+    Find the expiry time encoded in a signed stream URL
+
+    Understands plain expiry query parameters (expires=, e=, exp=, ... in
+    seconds or milliseconds), AWS SigV4 X-Amz-Date/X-Amz-Expires, Akamai
+    style exp= tokens and JWTs in the query string or path.
+
+    Args:
+        url (str): Stream URL
+
+    Returns:
+        float: Expiry as a UNIX timestamp, or None if the URL carries none
+    """
+    if not url:
+        return None
+
+    try:
+        parsed = urlparse(url)
+        params = {k.lower(): v for k, v in parse_qsl(parsed.query, keep_blank_values=True)}
+    except Exception:
+        return None
+
+    candidates = []
+
+    for name in EXPIRY_PARAMS:
+        if name in params:
+            candidates.append(_as_epoch(params[name]))
+
+    if 'x-amz-date' in params and 'x-amz-expires' in params:
+        candidates.append(_amz_expiry(params))
+
+    for value in params.values():
+        for match in _TOKEN_EXP_PATTERN.finditer(unquote(value)):
+            candidates.append(_as_epoch(match.group(1)))
+
+    for token in _JWT_PATTERN.findall(unquote(parsed.path) + '?' + unquote(parsed.query)):
+        candidates.append(_jwt_expiry(token))
+
+    candidates = [c for c in candidates if c]
+    # If several encodings disagree, trust the earliest
+    return min(candidates) if candidates else None
+
+
+def seconds_until_expiry(url, now=None):
+    """Seconds left before `url` expires, or None if it has no known expiry."""
+    expiry = parse_url_expiry(url)
+    if expiry is None:
+        return None
+    return expiry - (now if now is not None else time.time())
@@ -1,14 +1,17 @@
 import re
-import requests
 from bs4 import BeautifulSoup, Tag
 
-def extract_m3u8_from_vidcloud(url):
+from .deadline import ensure_deadline
+from . import tracing
+
+def extract_m3u8_from_vidcloud(url, deadline=None):
+    deadline = ensure_deadline(deadline)
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         "Referer": "https://multiembed.mov/"
     }
     try:
-        response = requests.get(url, headers=headers, timeout=15)
+        response = tracing.get(url, headers=headers, timeout=deadline.timeout(15))
         response.raise_for_status()
         soup = BeautifulSoup(response.text, 'html.parser')
         for video in soup.find_all('video'):
@@ -1,35 +1,28 @@
 # backend/api/vidsrc_api.py
 
-import requests
-
-# Your actual OMDb API key, as provided
-OMDB_API_KEY = "cd575855"
+from .omdb_fetcher import get_cached_movie_details, prefetch_movie_details
 
 def get_omdb_metadata(imdb_id):
-    """Fetch basic movie metadata for enriching streams."""
-    if not OMDB_API_KEY:
-        print("[vidsrc_api] Warning: OMDb API key not set.")
-        return {}
+    """
+    Movie metadata for enriching streams, from the shared details cache.
 
-    url = "http://www.omdbapi.com/"
-    params = {
-        "apikey": OMDB_API_KEY,
-        "i": imdb_id,
-        "plot": "short",
-    }
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            if data.get("Response") == "True":
-                return data
-    except Exception as e:
-        print(f"[vidsrc_api] OMDb metadata fetch error: {e}")
-    return {}
+    Never waits on OMDb, so it takes no deadline: on a miss the cache is
+    filled in the background and an empty dict is returned. The metadata
+    has the `format_movie_data` keys served by /movie/<id> ("title",
+    "year", "plot", ...), not OMDb's raw "Title"/"Year" keys.
+    """
+    metadata = get_cached_movie_details(imdb_id)
+    if metadata is None:
+        prefetch_movie_details(imdb_id)
+        return {}
+    return metadata
 
-def get_stream_for_imdb(imdb_id, title=None, year=None):
+def get_stream_for_imdb(imdb_id, title=None, year=None, deadline=None):
     """
     Return the VidSrc embed URL for the given IMDb ID along with enriched metadata.
+    The URL is a plain template, so this returns at once; metadata is attached
+    when already cached and marked pending otherwise. `deadline` is accepted
+    for the provider interface and unused, as no I/O happens here.
     """
     try:
         stream_url = f"https://vidsrc.me/embed/{imdb_id}"
@@ -38,7 +31,8 @@ def get_stream_for_imdb(imdb_id, title=None, year=None):
             "stream_url": stream_url,
             "embed": True,
             "quality": "HD",
-            "metadata": metadata
+            "metadata": metadata,
+            "metadata_pending": not metadata
         }
     except Exception as e:
         print(f"[vidsrc_api] get_stream_for_imdb error: {e}")
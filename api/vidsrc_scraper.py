@@ -2,21 +2,28 @@ import re
 import requests
 import logging
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
+
+from .m3u8_validator import validate_first
+from .deadline import ensure_deadline
+from . import tracing
 
 logger = logging.getLogger(__name__)
 
-def extract_from_vidsrc(url):
+@tracing.traced("vidsrc")
+def extract_from_vidsrc(url, deadline=None):
     """
     Extract M3U8 stream URL from VidSrc with enhanced extraction methods
     
     Args:
         url (str): VidSrc URL
+        deadline (Deadline): Request time budget shared with the caller
     
     Returns:
         str: M3U8 URL or None if extraction fails
     """
     logger.info(f"Extracting M3U8 from VidSrc: {url}")
+    deadline = ensure_deadline(deadline)
     
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -32,15 +39,18 @@ def extract_from_vidsrc(url):
     
     try:
         # Get VidSrc page
-        response = requests.get(url, headers=headers, timeout=15)
+        tracing.stage("page")
+        response = tracing.get(url, headers=headers, timeout=deadline.timeout(15))
         response.raise_for_status()
         
         logger.info(f"VidSrc page loaded successfully, status: {response.status_code}")
         
         # Parse HTML
+        tracing.stage("parse", bytes=len(response.text))
         soup = BeautifulSoup(response.text, 'html.parser')
         
         # Method 1: Look for direct video sources
+        tracing.stage("method 1")
         video_tags = soup.find_all('video')
         for video in video_tags:
             src = video.get('src', '')
@@ -49,6 +59,7 @@ def extract_from_vidsrc(url):
                 return make_absolute_url(src, url)
         
         # Method 2: Look for source tags within video elements
+        tracing.stage("method 2")
         source_tags = soup.find_all('source')
         for source in source_tags:
             src = source.get('src', '')
@@ -57,6 +68,7 @@ def extract_from_vidsrc(url):
                 return make_absolute_url(src, url)
         
         # Method 3: Look for M3U8 URLs in script tags with enhanced patterns
+        tracing.stage("method 3")
         scripts = soup.find_all('script')
         for script in scripts:
             if script.string:
@@ -74,17 +86,22 @@ def extract_from_vidsrc(url):
                     r'\.m3u8["\']?\s*:\s*["\']([^"\']*\.m3u8[^"\']*)["\']'
                 ]
                 
+                candidates = []
                 for pattern in patterns:
                     matches = re.findall(pattern, content, re.IGNORECASE)
                     for match in matches:
                         if match and '.m3u8' in match:
                             m3u8_url = make_absolute_url(match, url)
                             logger.info(f"Found M3U8 URL in script: {m3u8_url}")
-                            
-                            if validate_m3u8_url(m3u8_url):
-                                return m3u8_url
+                            candidates.append(m3u8_url)
+                
+                # Validate every candidate from this script at once
+                m3u8_url = validate_first(candidates, deadline=deadline)
+                if m3u8_url:
+                    return m3u8_url
         
         # Method 4: Look for iframe redirects
+        tracing.stage("method 4")
         iframes = soup.find_all('iframe')
         for iframe in iframes:
             iframe_src = iframe.get('src', '')
@@ -94,7 +111,7 @@ def extract_from_vidsrc(url):
                 
                 # For VidSrc iframes, try to extract from them recursively
                 if 'vidsrc' in iframe_url.lower():
-                    result = extract_from_vidsrc(iframe_url)
+                    result = extract_from_vidsrc(iframe_url, deadline)
                     if result:
                         return result
                 
@@ -102,6 +119,7 @@ def extract_from_vidsrc(url):
                 return iframe_url
         
         # Method 5: Look for API endpoints
+        tracing.stage("method 5")
         api_patterns = [
             r'["\']([^"\']*api[^"\']*)["\']',
             r'["\']([^"\']*stream[^"\']*)["\']',
@@ -117,7 +135,7 @@ def extract_from_vidsrc(url):
                     logger.info(f"Trying API endpoint: {api_url}")
                     
                     try:
-                        api_response = requests.get(api_url, headers=headers, timeout=10)
+                        api_response = tracing.get(api_url, headers=headers, timeout=deadline.timeout(10))
                         if api_response.status_code == 200:
                             api_data = api_response.text
                             
@@ -130,15 +148,18 @@ def extract_from_vidsrc(url):
                         continue
         
         # Method 6: Look for any M3U8 URLs in entire page content
+        tracing.stage("method 6")
         m3u8_pattern = r'https?://[^"\s<>]+\.m3u8[^"\s<>]*'
         m3u8_matches = re.findall(m3u8_pattern, response.text, re.IGNORECASE)
         
         for m3u8_url in m3u8_matches:
             logger.info(f"Found potential M3U8 URL: {m3u8_url}")
-            if validate_m3u8_url(m3u8_url):
-                return m3u8_url
+        m3u8_url = validate_first(m3u8_matches, deadline=deadline)
+        if m3u8_url:
+            return m3u8_url
         
         # Method 7: Look for encrypted or obfuscated sources
+        tracing.stage("method 7")
         encrypted_patterns = [
             r'atob\s*\(\s*["\']([^"\']+)["\']\s*\)',  # Base64 encoded
             r'decodeURIComponent\s*\(\s*["\']([^"\']+)["\']\s*\)',  # URI encoded
@@ -169,6 +190,7 @@ def extract_from_vidsrc(url):
                     continue
         
         # Method 8: Return the original URL if it looks like a working embed
+        tracing.stage("method 8")
         if any(keyword in url.lower() for keyword in ['embed', 'player', 'stream']):
             logger.info(f"Returning original URL as potential embed: {url}")
             return url
@@ -203,69 +225,10 @@ def make_absolute_url(url, base_url):
     else:
         return urljoin(base_url, url)
 
-def validate_m3u8_url(url):
-    """
-    Validate if a URL is a valid M3U8 stream with enhanced validation
-    
-    Args:
-        url (str): URL to validate
-    
-    Returns:
-        bool: True if valid M3U8 URL
-    """
-    try:
-        # Basic URL validation
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return False
-        
-        # Check if it's actually an M3U8 file
-        if not url.lower().endswith('.m3u8'):
-            return False
-        
-        # Try to fetch the M3U8 file to validate it
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": "https://multiembed.mov/"
-        }
-        
-        try:
-            # Try HEAD request first
-            response = requests.head(url, headers=headers, timeout=8)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                return any(ct in content_type for ct in ['mpegurl', 'x-mpegurl', 'vnd.apple.mpegurl'])
-        except:
-            pass
-            
-        try:
-            # If HEAD fails, try GET request with limited content
-            response = requests.get(url, headers=headers, timeout=8, stream=True)
-            if response.status_code == 200:
-                # Read only first 1KB to check if it's M3U8
-                content_sample = b''
-                for chunk in response.iter_content(1024):
-                    content_sample += chunk
-                    break
-                
-                content_text = content_sample.decode('utf-8', errors='ignore')
-                
-                # Check for M3U8 markers
-                m3u8_markers = ['#EXTM3U', '#EXT-X-VERSION', '#EXT-X-TARGETDURATION', '#EXT-X-MEDIA-SEQUENCE']
-                return any(marker in content_text for marker in m3u8_markers)
-        except:
-            pass
-        
-        return False
-        
-    except Exception as e:
-        logger.debug(f"M3U8 validation failed for {url}: {str(e)}")
-        return False
-
-def extract_vidsrc_sources(url):
+def extract_vidsrc_sources(url, deadline=None):
     """Extract all possible sources from VidSrc page"""
     sources = []
+    deadline = ensure_deadline(deadline)
     
     try:
         headers = {
@@ -273,7 +236,7 @@ def extract_vidsrc_sources(url):
             "Referer": "https://multiembed.mov/"
         }
         
-        response = requests.get(url, headers=headers, timeout=15)
+        response = tracing.get(url, headers=headers, timeout=deadline.timeout(15))
         
         if response.status_code == 200:
             # Extract all potential streaming URLs
@@ -1,9 +1,15 @@
 import os
+import time
+
+# Worker boot is timed from here to the end of this module
+BOOT_STARTED = time.perf_counter()
+
 import logging
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, make_response, g, send_file
 import requests
 import json
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,17 +18,31 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "netmirror-secret-key-2025")
 
+# Reverse proxies in front of the app; request.remote_addr is the address the outermost one saw.
+# Hops beyond this are client-supplied X-Forwarded-For entries and are ignored
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 # Enable CORS for all domains with necessary headers and methods
 CORS(app,
      origins=["*"],
      methods=["GET", "POST", "OPTIONS", "HEAD"],
      allow_headers=["Content-Type", "Authorization", "X-Requested-With", "Range", "If-Range"],
-     expose_headers=["Content-Length", "Content-Range", "Accept-Ranges"])
+     expose_headers=["Content-Length", "Content-Range", "Accept-Ranges", "X-Trace-Id", "X-Profile"])
 
 # ---------- Corrected Imports from your api folder ------------
 
 from api.omdb_fetcher import search_movies_by_keyword, get_movie_details
 from api.stream_fetcher import get_m3u8_from_multiembed as get_stream_sources
+from api.bandwidth import proxy_scheduler, get_client_id
+from api.hls_manifest import attach_variants
+from api.deadline import request_deadline
+from api.resolver_pool import ResolverSaturated
+from api.startup import mark_booted, get_startup_stats
+from api.stream_events import CandidateStream, get_stream_candidates
+from api.source_health import allow_report, record_report, report_token, get_health_stats
+from api import bulk_resolver, speculative, health_benchmark, metrics, tracing, profiling, admin, memory, readiness
 
 @app.route('/')
 def index():
@@ -37,6 +57,8 @@ def search():
         return jsonify({'movies': []})
     try:
         movies = search_movies_by_keyword(query)
+        # A click on one of the top hits is likely, so start resolving them now
+        speculative.speculate_many([movie.get('imdbID') for movie in movies])
         return jsonify({'movies': movies})
     except Exception as e:
         logger.error(f"Search error: {e}")
@@ -45,6 +67,8 @@ def search():
 @app.route('/movie/<imdb_id>')
 def movie_details(imdb_id):
     """Get movie details by IMDb ID"""
+    # The watch page asks for the stream right after this, so resolution runs alongside the OMDb call
+    speculative.speculate(imdb_id)
     try:
         movie = get_movie_details(imdb_id)
         if movie:
@@ -58,6 +82,7 @@ def movie_details(imdb_id):
 @app.route('/watch/<imdb_id>')
 def watch(imdb_id):
     """Video player page"""
+    speculative.speculate(imdb_id)
     return render_template('watch.html', imdb_id=imdb_id)
 
 @app.route('/api/stream/<imdb_id>')
@@ -65,20 +90,60 @@ def get_stream(imdb_id):
     """
     Get streaming URL for movie with enhanced error handling and CORS headers.
     Uses your improved, concurrent, cached backend.
+
+    Every call is traced stage by stage; the trace ID is returned in
+    X-Trace-Id and ?trace=1 adds the whole trace to the debug payload.
     """
+    with tracing.start_trace('api.stream', trace_id=request.headers.get('X-Trace-Id'),
+                             imdb_id=imdb_id, source=request.args.get('source', 'auto')) as trace:
+        response = make_response(_get_stream(imdb_id, trace))
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+def _trace_debug(trace, debug=None):
+    """The debug payload, with the request's trace added when ?trace=1 asked for it"""
+    if trace is None or request.args.get('trace') not in ('1', 'true'):
+        return debug
+    return dict(debug or {}, trace=trace.to_dict())
+
+def _get_stream(imdb_id, trace):
     try:
         source = request.args.get('source', 'auto')
         logger.info(f"Getting stream for {imdb_id} with source: {source}")
+        speculative.note_request(imdb_id)
+
+        # One time budget for the whole resolution chain, so per-call timeouts can't stack
+        deadline = request_deadline()
 
-        # Call the main fallback streaming aggregator
-        stream_data = get_stream_sources(imdb_id, source)
+        if request.args.get('candidates') in ('1', 'true'):
+            # Ranked list of every candidate found, so the player can fail over without calling back
+            stream_data = get_stream_candidates(imdb_id, source, deadline=deadline)
+        else:
+            # Call the main fallback streaming aggregator
+            stream_data = get_stream_sources(imdb_id, source, deadline=deadline)
 
         logger.debug(f"Stream fetch result: {stream_data}")
 
         # Check if a valid stream_url or success key is present
         success = stream_data.get('stream_url') or stream_data.get('success', False)
         if success:
-            response = jsonify({'success': True, **stream_data})
+            # The player reads stream_url; resolvers differ in which key they fill
+            if not stream_data.get('stream_url') and stream_data.get('m3u8'):
+                stream_data['stream_url'] = stream_data['m3u8']
+            # Ship the rendition ladder so the player can pick a start level before hls.js parses it
+            attach_variants(stream_data, deadline)
+            payload = {'success': True, **stream_data}
+            # Lets this client, and only it, report the URLs broken later
+            client = get_client_id(request)
+            payload['report_token'] = report_token(client, stream_data['stream_url'])
+            if stream_data.get('candidates'):
+                payload['candidates'] = [dict(c, report_token=report_token(client, c['url']))
+                                         for c in stream_data['candidates']]
+            debug = _trace_debug(trace)
+            if debug:
+                payload['debug'] = debug
+            response = jsonify(payload)
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,Range,If-Range'
             response.headers['Access-Control-Allow-Methods'] = 'GET,POST,OPTIONS,HEAD'
@@ -95,17 +160,80 @@ def get_stream(imdb_id):
                 'error': error_msg,
                 'imdb_id': imdb_id,
                 'source': source,
-                'debug': stream_data
+                'debug': _trace_debug(trace, stream_data)
             }), 404
 
+    except ResolverSaturated as e:
+        # Shed load fast instead of piling more threads onto a saturated resolver
+        logger.warning(f"Resolver saturated, rejecting stream request for {imdb_id}")
+        response = jsonify({
+            'success': False,
+            'error': 'Stream resolver is busy, please retry shortly',
+            'imdb_id': imdb_id
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
     except Exception as e:
         logger.exception(f"Stream API error for {imdb_id}: {e}")
         return jsonify({
             'success': False,
             'error': f'Stream fetch failed: {str(e)}',
-            'imdb_id': imdb_id
+            'imdb_id': imdb_id,
+            'debug': _trace_debug(trace)
         }), 500
 
+@app.route('/api/stream/<imdb_id>/events')
+def stream_events(imdb_id):
+    """
+    Server-Sent Events: push each playable candidate as soon as it resolves.
+    The player starts on the first one and keeps the rest for failover.
+    """
+    source = request.args.get('source', 'auto')
+    speculative.note_request(imdb_id)
+    try:
+        events = CandidateStream(imdb_id, source, deadline=request_deadline(), client=get_client_id(request))
+    except ResolverSaturated as e:
+        response = jsonify({
+            'success': False,
+            'error': 'Stream resolver is busy, please retry shortly',
+            'imdb_id': imdb_id
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the event stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+@app.route('/api/stream/prefetch', methods=['POST'])
+def prefetch_streams():
+    """
+    Warm the stream cache for a row of titles.
+    Accepts POST JSON: { "imdb_ids": [...], "source": "auto", "wait": false }
+    Returns immediately with per-title status unless "wait" is set.
+    """
+    data = request.get_json(silent=True) or {}
+    imdb_ids = data.get('imdb_ids')
+    if not isinstance(imdb_ids, list) or not imdb_ids:
+        return jsonify({'success': False, 'error': 'imdb_ids must be a non-empty list'}), 400
+    source = data.get('source', 'auto')
+
+    if data.get('wait'):
+        statuses = bulk_resolver.resolve_many(imdb_ids, source)
+    else:
+        statuses = bulk_resolver.prefetch(imdb_ids, source)
+    return jsonify({
+        'success': True,
+        'statuses': statuses,
+        'truncated': len(imdb_ids) > bulk_resolver.BULK_RESOLVE_MAX_IDS
+    }), 200 if data.get('wait') else 202
+
 # If you have get_m3u8_from_multiembed implemented:
 # @app.route('/api/multiembed/<imdb_id>')
 # def get_multiembed_stream(imdb_id):
@@ -129,32 +257,40 @@ def get_stream(imdb_id):
 
 @app.route('/api/test-stream')
 def test_stream():
-    """Test streaming on well-known movies"""
-    test_movies = [
-        {"imdb_id": "tt0111161", "title": "The Shawshank Redemption"},
-        {"imdb_id": "tt0068646", "title": "The Godfather"},
-        {"imdb_id": "tt0468569", "title": "The Dark Knight"},
-        {"imdb_id": "tt0108052", "title": "Schindler's List"},
-        {"imdb_id": "tt0167260", "title": "The Lord of the Rings: The Return of the King"}
+    """
+    Concurrent source health benchmark on a set of titles (admin only)
+
+    Checks every direct embed provider and the multiembed stage on
+    HEALTH_BENCHMARK_TITLES (or ?ids=tt1,tt2) past the stream cache and records
+    per-provider and per-host latency, success rate and stream type.
+    Runs in the background (202, see /api/test-stream/summary); ?wait=1 blocks
+    for a run cut to HEALTH_BENCHMARK_SYNC_BUDGET seconds.
+    """
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    imdb_ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()] or None
+    if request.args.get('wait') != '1':
+        started = health_benchmark.start_benchmark(imdb_ids)
+        return jsonify({"started": started, "summary_url": url_for('test_stream_summary')}), 202 if started else 409
+
+    run = health_benchmark.run_benchmark(imdb_ids, budget=health_benchmark.HEALTH_BENCHMARK_SYNC_BUDGET_SECONDS)
+    if run is None:
+        return jsonify({"error": "A health benchmark run is already in progress"}), 409
+    run = health_benchmark.public_run(run)
+    # test_results keeps the shape this endpoint always had
+    run["test_results"] = [
+        {"movie": title.get("movie", title["imdb_id"]), "imdb_id": title["imdb_id"],
+         "result": title.get("result") or {"success": False, "error": title.get("error")}}
+        for title in run["titles"]
     ]
+    return jsonify(run)
 
-    results = []
-    for movie in test_movies:
-        try:
-            result = get_stream_sources(movie["imdb_id"], 'auto') # Assuming 'auto' for testing
-            results.append({
-                "movie": movie["title"],
-                "imdb_id": movie["imdb_id"],
-                "result": result
-            })
-        except Exception as e:
-            results.append({
-                "movie": movie["title"],
-                "imdb_id": movie["imdb_id"],
-                "result": {"success": False, "error": str(e)}
-            })
-
-    return jsonify({"test_results": results})
+@app.route('/api/test-stream/summary')
+def test_stream_summary():
+    """Health benchmark history: success rate, latency percentiles and recent trend per provider and host (admin only)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(health_benchmark.get_benchmark_summary(request.args.get('runs', type=int)))
 
 @app.route('/api/proxy')
 def proxy_stream():
@@ -196,9 +332,15 @@ def proxy_stream():
             timeout=15,  # Conservative timeout
             allow_redirects=True
         )
+        # Pace the body through the fair-share scheduler so one client can't starve the rest
+        stream = proxy_scheduler.open_stream(get_client_id(request), url)
+
         def generate():
-            for chunk in upstream.iter_content(chunk_size=8192):
-                yield chunk
+            try:
+                for chunk in proxy_scheduler.iter_throttled(stream, upstream.iter_content(chunk_size=8192)):
+                    yield chunk
+            finally:
+                upstream.close()
 
         # Build the response with relevant headers
         resp = Response(
@@ -211,6 +353,10 @@ def proxy_stream():
             if h in upstream.headers:
                 resp.headers[h] = upstream.headers[h]
 
+        # Release the scheduler slot and upstream socket even if the body is never iterated
+        resp.call_on_close(lambda: proxy_scheduler.close_stream(stream))
+        resp.call_on_close(upstream.close)
+
         # CORS for every stream chunk
         resp.headers['Access-Control-Allow-Origin'] = '*'
         resp.headers['Access-Control-Allow-Headers'] = 'Content-Type,Range,Origin,Authorization,If-Range'
@@ -230,30 +376,62 @@ def proxy_stream():
         logger.error(f"[Proxy] Fatal proxy error: {e!r}")
         return jsonify({'error': f'Proxy failed: {str(e)}'}), 500
 
+@app.route('/api/proxy/stats')
+def proxy_stats():
+    """Current proxy egress per client and per stream (admin only: lists client IPs and stream URLs)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(proxy_scheduler.get_stats())
+
+@app.route('/api/source-health')
+def source_health():
+    """Decayed success/failure counts and health score per stream host"""
+    return jsonify(get_health_stats())
+
+@app.route('/api/speculative-stats')
+def speculative_stats():
+    """Speculative pre-resolution counters: started, dropped, hits, wasted work and hit rate"""
+    return jsonify(speculative.get_speculative_stats())
+
+@app.route('/api/startup-stats')
+def startup_stats():
+    """Worker boot time, lazy import times and background connection states"""
+    return jsonify(get_startup_stats())
+
 @app.route('/api/report-broken-source', methods=['POST'])
 def report_broken_source():
     """
     Accepts POST JSON:
-    { "imdb_id": "...", "source": "...", "client_ip": "...", "user_agent": "...", "note": "..." }
-    Appends info to a log file for later analysis/deprioritization.
+    { "imdb_id": "...", "source": "...", "url": "...", "report_token": "...", "note": "..." }
+    Appends info to a log file for later analysis. The health score of the
+    reported URL's host is only lowered when `report_token` shows this
+    server served the URL to this client recently. Reports are rate
+    limited per client.
     """
     import json
     from datetime import datetime
 
-    data = request.get_json(force=True)
+    client_ip = get_client_id(request)
+    if not allow_report(client_ip):
+        return jsonify({"success": False, "error": "Too many reports, please try again later."}), 429
+
+    data = request.get_json(force=True, silent=True) or {}
     imdb_id = data.get('imdb_id')
     source = data.get('source')
-    note = data.get('note', '')
-    client_ip = request.remote_addr
+    url = data.get('url')
+    note = str(data.get('note', ''))[:500]
     user_agent = request.headers.get('User-Agent', '')
+    counted = bool(url) and record_report(client_ip, url, data.get('report_token'))
 
     report_entry = {
         "timestamp": datetime.utcnow().isoformat(),
         "imdb_id": imdb_id,
         "source": source,
+        "url": url,
         "client_ip": client_ip,
         "user_agent": user_agent,
-        "note": note
+        "note": note,
+        "counted": counted
     }
 
     # Append to a simple log for now
@@ -267,9 +445,115 @@ def report_broken_source():
 
 @app.route('/health')
 def health_check():
-    """Basic health check"""
+    """Liveness: the process is up. Load balancers should route on /ready"""
     return jsonify({'status': 'ok'})
 
+@app.route('/ready')
+def readiness_check():
+    """
+    Readiness: resolver queue depth, in-flight resolutions, proxy streams,
+    upstream connections and cache backend reachability of this worker.
+    Returns 503 with Retry-After while any limit is reached.
+    """
+    report = readiness.get_readiness()
+    response = jsonify({'status': 'ready' if report['ready'] else 'saturated', **report})
+    if not report['ready']:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(report['retry_after'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Resolver, cache, OMDb and proxy metrics in the Prometheus text format (per worker)"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/admin/profiles')
+def list_profiles():
+    """Stored request and periodic profiles, newest first (admin only)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'profiles': profiling.list_profiles(), 'periodic': profiling.PROFILE_SAMPLE_INTERVAL > 0})
+
+@app.route('/api/admin/profiles/periodic')
+def periodic_profile():
+    """Collapsed stacks of the current always-on sampling window (admin only)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    folded = profiling.get_periodic_profile()
+    if folded is None:
+        return jsonify({'error': 'Periodic profiling is off, set PROFILE_SAMPLE_INTERVAL'}), 404
+    return Response(folded, mimetype='text/plain')
+
+@app.route('/api/admin/profiles/<name>')
+def download_profile(name):
+    """One stored profile: collapsed stacks as text, cProfile runs in pstats format (admin only)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    path = profiling.profile_path(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    mimetype = 'text/plain' if name.endswith('.folded') else 'application/octet-stream'
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=name.endswith('.prof'), download_name=name)
+
+@app.route('/api/admin/memory')
+def memory_report():
+    """
+    Memory of this worker: RSS, cache sizes, live browsers and upstream
+    connections, and tracemalloc top allocators when tracing (admin only).
+    Query: ?deep=1 to size cache contents, ?top=N, ?group=lineno|filename|traceback
+    """
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    top = request.args.get('top', memory.DEFAULT_TOP, type=int)
+    return jsonify(memory.get_memory_report(deep=request.args.get('deep') == '1',
+                                            top=max(1, min(top, 500)),
+                                            group_by=request.args.get('group', 'lineno')))
+
+@app.route('/api/admin/memory/tracemalloc', methods=['POST'])
+def memory_tracemalloc():
+    """
+    Start or stop tracemalloc in this worker (admin only).
+    Accepts POST JSON: { "action": "start" | "stop", "frames": 10 }
+    """
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action == 'start':
+        changed = memory.start_tracing(data.get('frames', 10))
+    elif action == 'stop':
+        changed = memory.stop_tracing()
+    else:
+        return jsonify({'error': 'action must be "start" or "stop"'}), 400
+    return jsonify({'changed': changed, **memory.tracing_status()})
+
+@app.route('/api/admin/memory/snapshot', methods=['POST'])
+def memory_snapshot():
+    """
+    Store a tracemalloc snapshot and diff it against the previous one (admin only).
+    Accepts POST JSON: { "label": "before-load" } (optional)
+    """
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    data = request.get_json(silent=True) or {}
+    label = memory.take_snapshot(data.get('label'))
+    if label is None:
+        return jsonify({'error': 'tracemalloc is not tracing, start it first'}), 409
+    return jsonify({'label': label, 'diff': memory.diff_snapshots(newer=label)})
+
+@app.route('/api/admin/memory/diff')
+def memory_diff():
+    """What grew between two stored snapshots: ?from=&to= labels, newest two by default (admin only)"""
+    if not admin.is_authorized(request):
+        return jsonify({'error': 'Unauthorized'}), 403
+    top = request.args.get('top', memory.DEFAULT_TOP, type=int)
+    diff = memory.diff_snapshots(request.args.get('from'), request.args.get('to'),
+                                 limit=max(1, min(top, 500)), group_by=request.args.get('group', 'lineno'))
+    if diff is None:
+        return jsonify({'error': 'Snapshots not found', **memory.tracing_status()}), 404
+    return jsonify(diff)
+
 # Custom error handlers
 
 @app.errorhandler(404)
@@ -296,6 +580,51 @@ def handle_preflight():
         response.headers['Access-Control-Max-Age'] = '86400'
         return response
 
+# Busy request threads for /ready; streamed responses stay counted until they are closed
+@app.before_request
+def count_busy_request():
+    readiness.request_started()
+    g.busy_counted = True
+
+@app.after_request
+def release_busy_request(response):
+    if g.pop('busy_counted', False):
+        response.call_on_close(readiness.request_finished)
+    return response
+
+@app.teardown_request
+def release_failed_request(error=None):
+    # after_request is skipped for unhandled errors
+    if g.pop('busy_counted', False):
+        readiness.request_finished()
+
+# Profile one request on demand: X-Profile: wall|cpu|cprofile (or ?profile=) plus the admin token
+@app.before_request
+def start_request_profile():
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if mode and admin.is_authorized(request):
+        g.profile = profiling.start_request_profile(mode, f"{request.method} {request.path}")
+
+@app.after_request
+def finish_request_profile(response):
+    session = g.pop('profile', None)
+    if session is not None:
+        # Streamed bodies (proxy, SSE) are produced after this point and not covered
+        name = session.stop()
+        if name:
+            response.headers['X-Profile'] = name
+    return response
+
+@app.teardown_request
+def abandon_request_profile(error=None):
+    session = g.pop('profile', None)
+    if session is not None:
+        session.stop()
+
+health_benchmark.schedule()
+profiling.start_periodic()
+mark_booted(BOOT_STARTED)
+
 if __name__ == '__main__':
     # Use environment variables for production
     import os
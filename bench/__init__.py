@@ -0,0 +1,21 @@
+"""
+Offline benchmarks for Mushh's Galaxy App
+
+fixtures      - record/replay corpus of upstream responses (embed pages, iframes, manifests)
+                `python -m bench.fixtures record|synth|list`
+standin       - local HTTP server replaying a corpus with injected latency and failures
+                `python -m bench.standin`
+resolvers     - latency and throughput of the stream resolvers against the stand-in
+                `python -m bench.resolvers`
+extractors    - ns/byte and peak memory of the page extractors on large and adversarial pages
+                `python -m bench.extractors`
+loadtest      - end-to-end capacity of one gunicorn instance under a mixed request load
+                `python -m bench.loadtest`
+proxy         - /api/proxy throughput, time to first byte and cost per player
+                `python -m bench.proxy`
+upstreams     - fake OMDb, embed and CDN hosts for loadtest and proxy; a library, no entry point
+gunicorn_conf - production gunicorn settings pointed at the fake upstreams, with saturation sampling
+                `gunicorn -c bench/gunicorn_conf.py main:app`
+
+Run the modules from the repository root, e.g. `python -m bench.resolvers --help`.
+"""
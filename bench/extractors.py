@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Extractor microbenchmarks over synthetic and recorded pages
+
+Times the regex and BeautifulSoup extractors on pages from 10 KB to 5 MB:
+ordinary embed markup, minified player JS, and adversarial input built to
+make their patterns backtrack. Page fetches are answered from memory, so
+only parsing is measured. Reports ns/byte and peak allocation per
+extractor and page, and exits non-zero when any extractor exceeds its
+latency budget.
+
+Every measurement runs in a child process that is killed once it is far
+over budget, so a catastrophic backtrack shows up as a failure instead of
+hanging the run.
+
+Usage:
+    python -m bench.extractors
+    python -m bench.extractors --sizes 10k,1m --kinds adversarial --json
+    python -m bench.extractors --corpus bench/corpus --budget mixdrop=8000
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+import multiprocessing
+
+from .fixtures import Corpus, serving
+
+PAGE_URL = "https://bench.invalid/e/tt0111161"
+STREAM_URL = "https://cdn.bench.invalid/hls/tt0111161/master.m3u8"
+KINDS = ("html", "minified", "adversarial")
+DEFAULT_SIZES = "10k,100k,1m,5m"
+# Repeats per measurement stop once this much time was spent
+MEASURE_SECONDS = 0.5
+MAX_REPEATS = 20
+# A measurement is killed once it runs this many times over its budget
+KILL_FACTOR = 5
+
+# Latency budget per extractor: fixed milliseconds plus nanoseconds per input byte
+BUDGETS = {
+    "m3u8_from_content": (5.0, 400.0),
+    "iframe_urls": (5.0, 100.0),
+    "vidsrc": (20.0, 4000.0),
+    "mixdrop": (20.0, 4000.0),
+    "streamtape": (20.0, 4000.0)
+}
+
+
+def _extractors():
+    # Imported lazily so child processes pay for the imports outside the timing
+    from api.stream_fetcher import extract_m3u8_from_content, extract_iframe_urls
+    from api.vidsrc_scraper import extract_from_vidsrc
+    from api.mixdrop_scraper import extract_m3u8_from_mixdrop
+    from api.streamtape_scraper import extract_m3u8_from_streamtape
+    from api.deadline import Deadline
+
+    def fetched(extract):
+        return lambda page: extract(PAGE_URL, Deadline(600))
+
+    return {
+        "m3u8_from_content": extract_m3u8_from_content,
+        "iframe_urls": lambda page: extract_iframe_urls(page, PAGE_URL),
+        "vidsrc": fetched(extract_from_vidsrc),
+        "mixdrop": fetched(extract_m3u8_from_mixdrop),
+        "streamtape": fetched(extract_m3u8_from_streamtape)
+    }
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    units = {"k": 1000, "m": 1000 * 1000}
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _fill(blocks, size, tail=""):
+    # Repeat `blocks` in seeded random order until the page reaches `size` characters
+    rng = random.Random(size)
+    parts, length = [], len(tail)
+    while length < size:
+        block = rng.choice(blocks)
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)[:max(0, size - len(tail))] + tail
+
+
+def _player_markup():
+    return (f"<iframe src=\"https://mixdrop.bench.invalid/e/abc\" allowfullscreen></iframe>"
+            f"<video id=\"player\"><source src=\"{STREAM_URL}\" type=\"application/x-mpegURL\"></video>"
+            f"<div id=\"robotlink\"></div><script>document.getElementById('robotlink').innerHTML = "
+            f"'//streamtape.bench.invalid/get_video?id=abc&token=xyz';"
+            f"jwplayer('player').setup({{file: \"{STREAM_URL}\", autostart: false}});</script>")
+
+
+def make_page(kind, size):
+    """
+    Build a deterministic page of about `size` characters
+
+    html        - embed page markup with the player near the end
+    minified    - one long line of minified JS with the player config at the end
+    adversarial - one line of near-misses for every extractor pattern and no match,
+                  so each pattern has to give up at every position
+    """
+    if kind == "html":
+        blocks = [
+            "<div class=\"card\"><a href=\"/movie/tt{0}\"><img src=\"https://img.bench.invalid/{0}.jpg\" "
+            "alt=\"Poster\"></a><p class=\"title\">Movie {0}</p></div>\n".format(n) for n in range(50)
+        ] + [
+            "<script type=\"application/ld+json\">{\"@type\": \"Movie\", \"url\": \"https://bench.invalid/m/1\"}"
+            "</script>\n",
+            "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>\n"
+        ]
+        body = _fill(blocks, size, tail=_player_markup() + "</body></html>")
+        return "<html><head><title>Player</title></head><body>" + body
+    if kind == "minified":
+        blocks = [
+            "var a{0}=function(b,c){{return b.src?c(b.src):void 0}};".format(n) for n in range(20)
+        ] + [
+            "window.cfg={url:'/api/v1',file:'poster.jpg',tracks:[]};",
+            "if(e&&e.player){e.player.on('ready',function(){t.play()})}",
+            "videojs.options.html5={};",
+        ]
+        return "<html><body><script>" + _fill(blocks, size, tail=_player_markup()) + "</script></body></html>"
+    if kind == "adversarial":
+        blocks = [
+            "http://",                       # scheme runs with no space and no .m3u8 after them
+            "videojs",                       # lazy .*? scans to the end of the line for src
+            "<iframe data-x",                # iframe tags never closed and never given a src
+            "url'",                          # a quote opened and never closed
+            "file:",
+            "jwplayer(",                     # setup( never follows
+            "a.m3u",                         # almost an extension
+            "player.src(",
+        ]
+        return _fill(blocks, size)
+    raise ValueError(f"Unknown page kind: {kind}")
+
+
+def budget_ms(extractor, size, budgets=BUDGETS):
+    fixed_ms, ns_per_byte = budgets[extractor]
+    return fixed_ms + ns_per_byte * size / 1e6
+
+
+def _measure(extractor, page, result):
+    """Child process: time one extractor on one page, then measure its peak allocation"""
+    extract = _extractors()[extractor]
+    pages = {PAGE_URL: ("text/html; charset=utf-8", page.encode("utf-8"))}
+    with serving(pages):
+        samples = []
+        spent = 0.0
+        while len(samples) < MAX_REPEATS and (not samples or spent < MEASURE_SECONDS):
+            started = time.perf_counter()
+            found = extract(page)
+            elapsed = time.perf_counter() - started
+            samples.append(elapsed)
+            spent += elapsed
+            result["seconds"] = statistics.median(samples)
+            result["repeats"] = len(samples)
+            result["found"] = bool(found)
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        extract(page)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+
+def run_case(manager, extractor, kind, page, budgets=BUDGETS):
+    """
+    Measure one extractor on one page in a child process
+
+    Returns:
+        dict: seconds (median), ns_per_byte, peak_bytes, found, budget_ms and
+              status 'ok', 'over_budget' or 'killed'
+    """
+    limit_ms = budget_ms(extractor, len(page), budgets)
+    result = manager.dict()
+    process = multiprocessing.Process(target=_measure, args=(extractor, page, result))
+    process.start()
+    process.join(timeout=max(10.0, limit_ms * KILL_FACTOR / 1000))
+    killed = process.is_alive()
+    if killed:
+        process.kill()
+        process.join()
+    outcome = dict(result)
+
+    seconds = outcome.get("seconds")
+    row = {
+        "extractor": extractor,
+        "kind": kind,
+        "size": len(page),
+        "seconds": seconds,
+        "ns_per_byte": round(seconds * 1e9 / len(page), 1) if seconds is not None else None,
+        "peak_bytes": outcome.get("peak_bytes"),
+        "peak_bytes_per_byte": round(outcome["peak_bytes"] / len(page), 2) if outcome.get("peak_bytes") else None,
+        "repeats": outcome.get("repeats", 0),
+        "found": outcome.get("found"),
+        "budget_ms": round(limit_ms, 1)
+    }
+    if seconds is None:
+        row["status"] = "killed"
+    else:
+        # A child killed during the allocation pass still has a valid timing
+        row["status"] = "ok" if seconds * 1000 <= limit_ms else "over_budget"
+    return row
+
+
+def recorded_pages(corpus_path, limit=20):
+    """HTML bodies from a fixture corpus, largest first"""
+    corpus = Corpus(corpus_path)
+    entries = [e for e in corpus.responses.values()
+               if e["status"] == 200 and "html" in e["headers"].get("content-type", "") and e["size"]]
+    entries.sort(key=lambda e: e["size"], reverse=True)
+    return [corpus.body(e).decode("utf-8", "replace") for e in entries[:limit]]
+
+
+def print_report(rows):
+    def fmt_ms(seconds):
+        return "killed" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+    print(f"\n  {'extractor':18} {'page':12} {'size':>9} {'time':>10} {'ns/B':>9} {'peak':>10} "
+          f"{'budget':>10}  status")
+    for row in rows:
+        peak = "-" if row["peak_bytes"] is None else f"{row['peak_bytes'] / 1024:.0f}KiB"
+        ns = "-" if row["ns_per_byte"] is None else f"{row['ns_per_byte']:.0f}"
+        mark = "✅" if row["status"] == "ok" else "❌"
+        print(f"  {row['extractor']:18} {row['kind']:12} {row['size']:>9} {fmt_ms(row['seconds']):>10} "
+              f"{ns:>9} {peak:>10} {row['budget_ms']:>8.0f}ms  {mark} {row['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the stream extractors on large pages")
+    parser.add_argument("--extractors", default=",".join(BUDGETS), help="Comma-separated extractors to run")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"Comma-separated page kinds: {','.join(KINDS)}")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated page sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--corpus", help="Also run on the HTML pages of this fixture corpus")
+    parser.add_argument("--budget", action="append", default=[],
+                        help="Override a budget as extractor=ns_per_byte, may be repeated")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every budget, e.g. on slow machines")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for override in args.budget:
+        name, _, value = override.partition("=")
+        if name not in budgets or not value:
+            parser.error(f"Bad --budget {override!r}; expected one of {','.join(BUDGETS)}=<ns per byte>")
+        budgets[name] = (budgets[name][0], float(value))
+    budgets = {name: (fixed * args.budget_scale, per_byte * args.budget_scale)
+               for name, (fixed, per_byte) in budgets.items()}
+
+    extractors = [e.strip() for e in args.extractors.split(",") if e.strip() in budgets]
+    pages = [(kind, make_page(kind, parse_size(size)))
+             for kind in args.kinds.split(",") if kind in KINDS
+             for size in args.sizes.split(",")]
+    if args.corpus:
+        pages += [("recorded", page) for page in recorded_pages(args.corpus)]
+
+    rows = []
+    with multiprocessing.Manager() as manager:
+        for kind, page in pages:
+            for extractor in extractors:
+                row = run_case(manager, extractor, kind, page, budgets)
+                rows.append(row)
+                if not args.json:
+                    print(f"{extractor} on {kind} {len(page)}B: {row['status']}", file=sys.stderr)
+
+    failures = [row for row in rows if row["status"] != "ok"]
+    if args.json:
+        print(json.dumps({"results": rows, "failures": len(failures)}, indent=2))
+    else:
+        print_report(rows)
+        print(f"\n{'❌' if failures else '✅'} {len(failures)} of {len(rows)} measurements over budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Fixture corpus of recorded upstream responses
+
+A corpus is a directory with an index.json, mapping "METHOD URL" to the
+recorded status, headers and timing, and a bodies/ directory holding each
+response body once by content hash. `recording()` captures every request
+the resolvers make through `requests` into a corpus; `replaying()` sends
+them to a stand-in server (see bench.standin) instead of the real hosts.
+
+Usage:
+    python -m bench.fixtures record ids.txt --corpus bench/corpus
+    python -m bench.fixtures synth --corpus bench/corpus --titles 20
+    python -m bench.fixtures list --corpus bench/corpus
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+# Larger bodies (video segments, MP4s) are recorded without their content
+MAX_BODY_BYTES = 2 * 1024 * 1024
+# Response headers worth replaying; length and encoding are recomputed by the stand-in
+KEPT_HEADERS = ("content-type", "location", "cache-control", "accept-ranges", "last-modified", "etag")
+MEDIA_TYPES = ("video/", "audio/", "application/octet-stream")
+
+
+def request_key(method, url):
+    return f"{method.upper()} {url}"
+
+
+def _path_key(method, url):
+    # Same request ignoring the query string, for URLs carrying tokens or timestamps
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}"
+
+
+class Corpus:
+    """Recorded responses on disk, looked up by request; an empty corpus when `path` is None"""
+
+    def __init__(self, path=DEFAULT_CORPUS):
+        self.path = path
+        self.titles = []
+        self.responses = {}
+        self._by_path = {}
+        self._lock = threading.Lock()
+        index = os.path.join(path, "index.json") if path else None
+        if index and os.path.exists(index):
+            with open(index, encoding='utf-8') as f:
+                data = json.load(f)
+            self.titles = data.get("titles", [])
+            self.responses = data.get("responses", {})
+            for key in self.responses:
+                self._index_path(key)
+
+    def __len__(self):
+        return len(self.responses)
+
+    def add(self, method, url, status, headers, body, elapsed=None, truncated=False):
+        """Store one response; the body is kept once per distinct content"""
+        digest = hashlib.sha1(body).hexdigest()
+        body_path = os.path.join("bodies", digest[:2], digest)
+        full_path = os.path.join(self.path, body_path)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(body)
+        key = request_key(method, url)
+        with self._lock:
+            self.responses[key] = {
+                "status": status,
+                "headers": {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+                "body": body_path,
+                "size": len(body),
+                "elapsed": round(elapsed, 4) if elapsed is not None else None,
+                "truncated": truncated,
+                "recorded_at": time.time()
+            }
+            self._index_path(key)
+
+    def _index_path(self, key):
+        # A path recorded under several query strings (e.g. ?video_id=) has no single fallback
+        method, url = key.split(" ", 1)
+        path_key = _path_key(method, url)
+        if self._by_path.get(path_key, key) != key:
+            key = None
+        self._by_path[path_key] = key
+
+    def add_title(self, imdb_id):
+        with self._lock:
+            if imdb_id not in self.titles:
+                self.titles.append(imdb_id)
+
+    def lookup(self, method, url):
+        """
+        Find the recorded response for a request
+
+        Falls back to a recording of the same URL with another query string,
+        e.g. a fresh signing token, if that path was recorded only once.
+
+        Returns:
+            dict: The entry, or None if nothing matches
+        """
+        entry = self.responses.get(request_key(method, url))
+        if entry is None:
+            key = self._by_path.get(_path_key(method, url))
+            entry = self.responses.get(key) if key else None
+        return entry
+
+    def body(self, entry):
+        with open(os.path.join(self.path, entry["body"]), "rb") as f:
+            return f.read()
+
+    def urls(self, method="GET"):
+        prefix = f"{method.upper()} "
+        return [key[len(prefix):] for key in self.responses if key.startswith(prefix)]
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            data = {"version": 1, "titles": self.titles,
+                    "responses": dict(sorted(self.responses.items()))}
+        with open(os.path.join(self.path, "index.json"), "w", encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests to the real hosts and records every response into a corpus"""
+
+    def __init__(self, corpus, **kwargs):
+        super().__init__(**kwargs)
+        self.corpus = corpus
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=stream, **kwargs)
+        content_type = response.headers.get("content-type", "").lower()
+        length = int(response.headers.get("content-length") or 0)
+        # Reading a streamed body here would download whole videos; keep only their headers
+        truncated = stream and (length > MAX_BODY_BYTES or content_type.startswith(MEDIA_TYPES))
+        body = b"" if truncated else response.content[:MAX_BODY_BYTES]
+        self.corpus.add(request.method, request.url, response.status_code, response.headers, body,
+                        elapsed=response.elapsed.total_seconds(), truncated=truncated)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Sends every request to a stand-in server, which answers from the corpus"""
+
+    def __init__(self, server_url, **kwargs):
+        super().__init__(**kwargs)
+        self.server_url = server_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        parts = urlsplit(original_url)
+        request = request.copy()
+        request.url = (f"{self.server_url}/{parts.scheme}/{parts.netloc}{quote(parts.path, safe='/%')}"
+                       + (f"?{parts.query}" if parts.query else ""))
+        response = super().send(request, **kwargs)
+        # Callers resolve relative links against the URL they asked for
+        response.url = original_url
+        response.request.url = original_url
+        return response
+
+
+class StaticAdapter(HTTPAdapter):
+    """Answers from an in-memory { url: (content_type, body) } map without any socket I/O"""
+
+    def __init__(self, pages, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = pages
+
+    def send(self, request, **kwargs):
+        page = self.pages.get(request.url)
+        response = requests.Response()
+        response.status_code = 200 if page else 404
+        content_type, body = page or ("text/plain", b"not found")
+        response.headers = CaseInsensitiveDict({"content-type": content_type, "content-length": str(len(body))})
+        response._content = body
+        response._content_consumed = True
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+# Seconds to let background OMDb fetches finish through the adapter before it is removed
+BACKGROUND_DRAIN_SECONDS = 30
+
+
+@contextmanager
+def _adapter_for_all_sessions(adapter):
+    # requests.get() builds a fresh Session per call, so the adapter is swapped in at the class
+    from api import omdb_fetcher
+
+    original = requests.Session.get_adapter
+    requests.Session.get_adapter = lambda session, url: adapter
+    try:
+        yield adapter
+    finally:
+        # Fetches started in the block must not reach the real hosts once it ends
+        running = omdb_fetcher.wait_for_prefetches(BACKGROUND_DRAIN_SECONDS)
+        if running:
+            print(f"⚠️ {running} background OMDb fetches still running after the fixture block", file=sys.stderr)
+        requests.Session.get_adapter = original
+
+
+@contextmanager
+def recording(corpus):
+    """Record every `requests` call made inside the block into `corpus`"""
+    with _adapter_for_all_sessions(RecordingAdapter(corpus, pool_maxsize=32)):
+        yield corpus
+
+
+@contextmanager
+def replaying(server_url):
+    """Send every `requests` call made inside the block to the stand-in at `server_url`"""
+    with _adapter_for_all_sessions(ReplayAdapter(server_url, pool_maxsize=64)) as adapter:
+        try:
+            yield adapter
+        finally:
+            adapter.close()
+
+
+@contextmanager
+def serving(pages):
+    """Answer every `requests` call made inside the block from `pages` in memory, e.g. to time parsing alone"""
+    with _adapter_for_all_sessions(StaticAdapter(pages)) as adapter:
+        yield adapter
+
+
+def record(corpus, imdb_ids, source='auto'):
+    """Resolve each title against the live hosts and record everything they serve"""
+    from api import stream_cache
+    from api.deadline import request_deadline
+    from api.stream_fetcher import get_m3u8_from_multiembed, stream_cache_key
+
+    with recording(corpus):
+        for done, imdb_id in enumerate(imdb_ids, 1):
+            stream_cache.invalidate(stream_cache_key(imdb_id, source))
+            started = time.perf_counter()
+            result = get_m3u8_from_multiembed(imdb_id, source, deadline=request_deadline())
+            corpus.add_title(imdb_id)
+            corpus.save()
+            print(f"[{done}/{len(imdb_ids)}] {imdb_id}: {'ok' if result.get('success') else 'failed'} "
+                  f"({time.perf_counter() - started:.1f}s, {len(corpus)} responses)", file=sys.stderr)
+
+
+def synthesize(corpus, count=10):
+    """
+    Fill a corpus with made-up pages shaped like the real hosts'
+
+    Even titles have a direct embed page with an HLS manifest; odd titles
+    only resolve through the multiembed page and its MixDrop/Streamtape
+    iframes, so both resolver paths get exercised without recordings.
+    """
+    from api.providers import DIRECT_EMBED, providers_for
+
+    html = {"content-type": "text/html; charset=utf-8"}
+    hls = {"content-type": "application/vnd.apple.mpegurl"}
+    first_embed = providers_for(DIRECT_EMBED)[0]
+    for n in range(count):
+        imdb_id = f"tt{9000000 + n:07d}"
+        manifest = f"https://cdn.bench.invalid/{imdb_id}/master.m3u8"
+        master = ("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720\n720p.m3u8\n"
+                  "#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n360p.m3u8\n")
+        corpus.add("GET", manifest, 200, hls, master.encode())
+        filler = "<div class='related'>" + "<a href='/movie/x'>More movies</a>" * 200 + "</div>"
+        if n % 2 == 0:
+            page = (f"<html><head><title>Player</title></head><body>{filler}<div id='player'></div>"
+                    f"<script>jwplayer('player').setup({{file: \"{manifest}\", autostart: false}});</script>"
+                    f"</body></html>")
+            corpus.add("GET", first_embed.build_url(imdb_id), 200, html, page.encode())
+        else:
+            mixdrop = f"https://mixdrop.bench.invalid/e/{imdb_id}"
+            streamtape = f"https://streamtape.bench.invalid/e/{imdb_id}"
+            page = (f"<html><body>{filler}<iframe src=\"{mixdrop}\"></iframe>"
+                    f"<iframe src=\"{streamtape}\"></iframe></body></html>")
+            corpus.add("GET", f"https://multiembed.mov/movie/imdb/{imdb_id}", 200, html, page.encode())
+            corpus.add("GET", mixdrop, 200, html,
+                       f"<html><body>{filler}<video><source src=\"{manifest}\"></video></body></html>".encode())
+            corpus.add("GET", streamtape, 200, html,
+                       (f"<html><body>{filler}<div id='robotlink'></div><script>"
+                        f"document.getElementById('robotlink').innerHTML = "
+                        f"'//streamtape.bench.invalid/get_video?id={imdb_id}&token=abc';</script>"
+                        f"</body></html>").encode())
+        corpus.add_title(imdb_id)
+    corpus.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or synthesize a fixture corpus of upstream responses")
+    parser.add_argument("command", choices=["record", "synth", "list"])
+    parser.add_argument("ids_file", nargs="?", help="record: file with one IMDb ID per line, or - for stdin")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=f"Corpus directory (default: {DEFAULT_CORPUS})")
+    parser.add_argument("--source", default="auto", help="Preferred source while recording (default: auto)")
+    parser.add_argument("--titles", type=int, default=10, help="synth: number of made-up titles")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus)
+    if args.command == "record":
+        from warm_cache import read_ids
+        if not args.ids_file:
+            parser.error("record needs an ids_file")
+        ids = read_ids(args.ids_file)
+        if not ids:
+            print("❌ No valid IMDb IDs to record")
+            return 1
+        record(corpus, ids, args.source)
+        print(f"✅ Recorded {len(corpus)} responses for {len(corpus.titles)} titles into {args.corpus}")
+    elif args.command == "synth":
+        synthesize(corpus, args.titles)
+        print(f"✅ Corpus {args.corpus} now has {len(corpus)} responses for {len(corpus.titles)} titles")
+    else:
+        for key, entry in sorted(corpus.responses.items(), key=lambda item: item[0].split(" ", 1)[1]):
+            print(f"{entry['status']:>4} {entry['size']:>9} {key}")
+        print(f"\n📁 {len(corpus)} responses, {len(corpus.titles)} titles")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
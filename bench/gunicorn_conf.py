@@ -0,0 +1,91 @@
+"""
+Gunicorn config used by bench.loadtest and bench.proxy
+
+Starts from the production settings in gunicorn_config.py; only
+$BENCH_WORKERS and $BENCH_THREADS override them. Each worker sends its upstream traffic to the fake upstreams at
+$BENCH_UPSTREAM_URL and, if $BENCH_STATS_DIR is set, appends a sample of
+its saturation (requests in flight, CPU time, memory, resolver pool and
+proxy streams) to worker-<pid>.jsonl there every $BENCH_SAMPLE_SECONDS.
+
+    BENCH_UPSTREAM_URL=http://127.0.0.1:8765 gunicorn -c bench/gunicorn_conf.py main:app
+"""
+
+import os
+import json
+import time
+import threading
+
+import gunicorn_config
+
+bind = os.getenv("BENCH_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("BENCH_WORKERS", str(gunicorn_config.workers)))
+threads = int(os.getenv("BENCH_THREADS", str(gunicorn_config.threads)))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = gunicorn_config.timeout
+accesslog = None
+loglevel = "warning"
+
+_requests = {"inflight": 0, "peak": 0, "total": 0}
+_lock = threading.Lock()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _sample_forever(path, interval):
+    # Imported here: the app is only loaded after post_fork
+    while True:
+        time.sleep(interval)
+        try:
+            from api.resolver_pool import resolver_pool
+            from api.bandwidth import proxy_scheduler
+            times = os.times()
+            with _lock:
+                counts = dict(_requests)
+                _requests["peak"] = _requests["inflight"]
+            sample = {
+                "t": time.time(),
+                "cpu_seconds": times.user + times.system,
+                "rss_bytes": _rss_bytes(),
+                "threads": threading.active_count(),
+                "inflight": counts["inflight"],
+                "peak_inflight": counts["peak"],
+                "requests": counts["total"],
+                "resolver": resolver_pool.stats(),
+                "proxy_streams": proxy_scheduler.get_stats()["global"]["active_streams"]
+            }
+            with open(path, "a") as f:
+                f.write(json.dumps(sample) + "\n")
+        except Exception as e:
+            print(f"[bench] worker sampler error: {e}")
+
+
+def post_fork(server, worker):
+    upstream = os.getenv("BENCH_UPSTREAM_URL")
+    if upstream:
+        from bench.fixtures import replaying
+        # Kept open for the life of the worker
+        worker.bench_replay = replaying(upstream)
+        worker.bench_replay.__enter__()
+    stats_dir = os.getenv("BENCH_STATS_DIR")
+    if stats_dir:
+        path = os.path.join(stats_dir, f"worker-{os.getpid()}.jsonl")
+        interval = float(os.getenv("BENCH_SAMPLE_SECONDS", "0.5"))
+        threading.Thread(target=_sample_forever, args=(path, interval), daemon=True, name="bench-sampler").start()
+
+
+def pre_request(worker, req):
+    with _lock:
+        _requests["inflight"] += 1
+        _requests["total"] += 1
+        _requests["peak"] = max(_requests["peak"], _requests["inflight"])
+
+
+def post_request(worker, req, environ, resp):
+    with _lock:
+        _requests["inflight"] -= 1
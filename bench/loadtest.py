@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of one app instance
+
+Starts fake OMDb/embed/CDN upstreams (bench.upstreams), runs main:app under
+gunicorn with the production settings (gunicorn_config.py, loaded by
+bench/gunicorn_conf.py), and drives a mix of
+/search, /movie/<id>, /api/stream/<id> and /api/proxy at increasing
+concurrency. Each stage reports throughput, latency percentiles per
+endpoint, error and shed (503/429) rates, and worker saturation sampled
+inside gunicorn: busy CPU, requests in flight against the thread count,
+resolver queue depth and memory. The highest stage within the SLO is
+reported as the instance's capacity.
+
+Usage:
+    python -m bench.loadtest --workers 2 --threads 8 --stages 1,4,16,32 --duration 15
+    python -m bench.loadtest --mix search=1,movie=1,stream=4 --json > before.json
+    python -m bench.loadtest --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import random
+import signal
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import quote
+
+import requests
+
+import gunicorn_config
+from api import provider_stats
+from .fixtures import Corpus
+from .standin import StandInServer
+from .upstreams import FakeUpstreams, CDN_HOST, fake_imdb_id
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONF = os.path.join(ROOT, "bench", "gunicorn_conf.py")
+ENDPOINTS = ("search", "movie", "stream", "proxy")
+DEFAULT_MIX = "search=2,movie=3,stream=3,proxy=2"
+SEARCH_WORDS = ["batman", "love", "war", "night", "star", "king", "dark", "city", "dead", "girl",
+                "man", "world", "house", "last", "time", "story", "day", "blood", "game", "road"]
+CLIENT_TIMEOUT_SECONDS = 30
+SHED_STATUSES = (429, 503)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() in ENDPOINTS and weight:
+            mix[name.strip()] = float(weight)
+    return mix
+
+
+class Workload:
+    """Picks the next request of the mix; popular titles are asked for far more often"""
+
+    def __init__(self, mix, titles, seed):
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.titles = titles
+        self.seed = seed
+
+    def client(self, index):
+        rng = random.Random(self.seed * 1000 + index)
+
+        def next_request():
+            endpoint = rng.choices(self.names, self.weights)[0]
+            # Pareto-skewed title popularity, like a front page with a few hits
+            imdb_id = fake_imdb_id(int(rng.paretovariate(1.2) - 1) % self.titles)
+            if endpoint == "search":
+                return endpoint, f"/search?q={rng.choice(SEARCH_WORDS)}"
+            if endpoint == "movie":
+                return endpoint, f"/movie/{imdb_id}"
+            if endpoint == "stream":
+                return endpoint, f"/api/stream/{imdb_id}"
+            segment = f"https://{CDN_HOST}/hls/{imdb_id}/720p/seg-{rng.randrange(60)}.ts"
+            return endpoint, f"/api/proxy?url={quote(segment, safe='')}"
+
+        return next_request
+
+
+def run_stage(base_url, workload, concurrency, warmup, duration):
+    """
+    Closed-loop clients: each sends its next request as soon as the last one finished
+
+    Returns:
+        tuple: (records, started, ended) with records as (endpoint, seconds, status, bytes)
+               for requests that started after the warmup
+    """
+    records = []
+    lock = threading.Lock()
+    started = time.time()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client(index):
+        next_request = workload.client(index)
+        session = requests.Session()
+        while time.time() < stop_at:
+            endpoint, path = next_request()
+            began = time.time()
+            try:
+                response = session.get(base_url + path, timeout=CLIENT_TIMEOUT_SECONDS, stream=True)
+                size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+                status = response.status_code
+            except requests.RequestException:
+                size, status = 0, None
+            elapsed = time.time() - began
+            if began >= measure_from:
+                with lock:
+                    records.append((endpoint, elapsed, status, size))
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=warmup + duration + CLIENT_TIMEOUT_SECONDS + 5)
+    return records, measure_from, time.time()
+
+
+def read_worker_samples(stats_dir):
+    samples = {}
+    for path in glob.glob(os.path.join(stats_dir, "worker-*.jsonl")):
+        pid = os.path.basename(path)[len("worker-"):-len(".jsonl")]
+        with open(path) as f:
+            samples[pid] = [json.loads(line) for line in f if line.strip()]
+    return samples
+
+
+def saturation(samples, start, end, threads):
+    """Worker-side saturation between two timestamps, from the gunicorn_conf samples"""
+    workers = {}
+    for pid, rows in samples.items():
+        window = [r for r in rows if start <= r["t"] <= end]
+        if len(window) < 2:
+            continue
+        first, last = window[0], window[-1]
+        workers[pid] = {
+            "cpu_busy": round((last["cpu_seconds"] - first["cpu_seconds"]) / (last["t"] - first["t"]), 3),
+            "peak_inflight": max(r["peak_inflight"] for r in window),
+            "thread_utilization": round(max(r["peak_inflight"] for r in window) / threads, 2),
+            "peak_resolver_queued": max(r["resolver"]["queued"] for r in window),
+            "peak_resolver_inflight": max(r["resolver"]["inflight_resolutions"] for r in window),
+            "resolver_rejected": last["resolver"].get("rejected", 0) - first["resolver"].get("rejected", 0),
+            "peak_proxy_streams": max(r["proxy_streams"] for r in window),
+            "peak_rss_mb": round(max(r["rss_bytes"] or 0 for r in window) / 1e6, 1)
+        }
+    if not workers:
+        return {"workers": {}}
+    return {
+        "cpu_busy_mean": round(sum(w["cpu_busy"] for w in workers.values()) / len(workers), 3),
+        "thread_utilization_max": max(w["thread_utilization"] for w in workers.values()),
+        "resolver_queued_max": max(w["peak_resolver_queued"] for w in workers.values()),
+        "resolver_rejected": sum(w["resolver_rejected"] for w in workers.values()),
+        "rss_mb_total": round(sum(w["peak_rss_mb"] for w in workers.values()), 1),
+        "workers": workers
+    }
+
+
+def summarize_stage(concurrency, records, start, end, worker_stats):
+    wall = max(end - start, 1e-9)
+    by_endpoint = {}
+    for endpoint, seconds, status, size in records:
+        by_endpoint.setdefault(endpoint, []).append((seconds, status, size))
+
+    def block(rows):
+        ok = [r for r in rows if r[1] is not None and r[1] < 400]
+        shed = sum(1 for r in rows if r[1] in SHED_STATUSES)
+        summary = provider_stats.summarize(len(rows), len(ok), [r[0] for r in rows])
+        summary.update(
+            requests_per_second=round(len(rows) / wall, 2),
+            error_rate=round((len(rows) - len(ok) - shed) / len(rows), 4) if rows else None,
+            shed_rate=round(shed / len(rows), 4) if rows else None,
+            mb_per_second=round(sum(r[2] for r in rows) / wall / 1e6, 2)
+        )
+        return summary
+
+    all_rows = [(seconds, status, size) for _, seconds, status, size in records]
+    return {
+        "concurrency": concurrency,
+        "seconds": round(wall, 2),
+        "overall": block(all_rows),
+        "endpoints": {name: block(rows) for name, rows in sorted(by_endpoint.items())},
+        "saturation": worker_stats
+    }
+
+
+def capacity(stages, slo_p99, max_error_rate):
+    """The stage with the highest throughput that kept p99 and failures within the SLO"""
+    good = [s for s in stages
+            if s["overall"]["p99"] is not None and s["overall"]["p99"] <= slo_p99
+            and (s["overall"]["error_rate"] or 0) + (s["overall"]["shed_rate"] or 0) <= max_error_rate]
+    if not good:
+        return None
+    best = max(good, key=lambda s: s["overall"]["requests_per_second"])
+    return {"concurrency": best["concurrency"], "requests_per_second": best["overall"]["requests_per_second"]}
+
+
+def start_app(port, upstream_url, stats_dir, workers, threads, log_path):
+    env = dict(os.environ, BENCH_UPSTREAM_URL=upstream_url, BENCH_STATS_DIR=stats_dir,
+               BENCH_BIND=f"127.0.0.1:{port}", BENCH_WORKERS=str(workers), BENCH_THREADS=str(threads),
+               # Background work that would talk to real services or skew the numbers,
+               # and trace files that would land in the repo
+               HEALTH_BENCHMARK_INTERVAL="0", STREAM_CACHE_REDIS_URL="", TRACE_LOG="")
+    log = open(log_path, "w")
+    # The production app module, with gunicorn_config.py's settings via GUNICORN_CONF
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", GUNICORN_CONF, "main:app"],
+                               cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}, see {log_path}")
+        try:
+            if requests.get(base_url + "/health", timeout=2).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError(f"App did not become healthy within 60s, see {log_path}")
+
+
+def stop_app(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def compare(report, baseline):
+    """Per concurrency change of throughput and p99 against an earlier --json report, in percent"""
+    before = {s["concurrency"]: s for s in baseline.get("stages", [])}
+    changes = {}
+    for stage in report["stages"]:
+        old = before.get(stage["concurrency"])
+        if not old:
+            continue
+        changes[stage["concurrency"]] = {
+            metric: round((stage["overall"][metric] - old["overall"][metric]) / old["overall"][metric] * 100, 1)
+            if stage["overall"].get(metric) is not None and old["overall"].get(metric) else None
+            for metric in ("requests_per_second", "p50", "p99")
+        }
+    return changes
+
+
+def print_report(report, changes=None):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    def pct(value):
+        return "-" if value is None else f"{value * 100:.1f}%"
+
+    print(f"\n⚙️  {report['settings']}")
+    for stage in report["stages"]:
+        sat = stage["saturation"]
+        print(f"\n👥 {stage['concurrency']} clients: {stage['overall']['requests_per_second']} req/s, "
+              f"errors {pct(stage['overall']['error_rate'])}, shed {pct(stage['overall']['shed_rate'])}")
+        print(f"  {'endpoint':10} {'reqs':>6} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'err':>7} {'shed':>7}")
+        for name, row in {**stage["endpoints"], "all": stage["overall"]}.items():
+            print(f"  {name:10} {row['attempts']:>6} {row['requests_per_second']:>8} {ms(row['p50']):>8} "
+                  f"{ms(row['p90']):>8} {ms(row['p99']):>8} {pct(row['error_rate']):>7} {pct(row['shed_rate']):>7}")
+        if sat.get("workers"):
+            print(f"  workers: cpu busy {pct(sat['cpu_busy_mean'])}, threads used {pct(sat['thread_utilization_max'])}, "
+                  f"resolver queue {sat['resolver_queued_max']}, rejected {sat['resolver_rejected']}, "
+                  f"rss {sat['rss_mb_total']}MB")
+    cap = report["capacity"]
+    print("\n🏁 Capacity within SLO: "
+          + (f"{cap['requests_per_second']} req/s at {cap['concurrency']} clients" if cap else "no stage met the SLO"))
+    if changes:
+        print("\n📈 Change against baseline (per concurrency)")
+        for concurrency, change in changes.items():
+            parts = [f"{metric} {value:+.1f}%" for metric, value in change.items() if value is not None]
+            print(f"  {concurrency:>5} clients: {', '.join(parts) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app under gunicorn against fake upstreams")
+    parser.add_argument("--workers", type=int, default=gunicorn_config.workers,
+                        help=f"Gunicorn worker processes (default: production's {gunicorn_config.workers})")
+    parser.add_argument("--threads", type=int, default=gunicorn_config.threads,
+                        help=f"Threads per worker (default: production's {gunicorn_config.threads})")
+    parser.add_argument("--stages", default="1,4,16,32", help="Comma-separated client concurrency per stage")
+    parser.add_argument("--duration", type=float, default=15.0, help="Measured seconds per stage")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds at the start of each stage")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--titles", type=int, default=200, help="Distinct titles requested")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="Seconds every upstream response takes")
+    parser.add_argument("--upstream-jitter", type=float, default=0.05, help="Up to this many extra seconds")
+    parser.add_argument("--upstream-failure-rate", type=float, default=0.0, help="Share of upstream requests that fail")
+    parser.add_argument("--segment-kb", type=int, default=512, help="Size of proxied HLS segments")
+    parser.add_argument("--slo-p99", type=float, default=2.0, help="Seconds p99 may reach within capacity")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Errors plus shed requests allowed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-logs", action="store_true", help="Keep the gunicorn log and worker samples")
+    parser.add_argument("--compare", help="Earlier --json report to compare against")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if not mix:
+        parser.error(f"--mix needs at least one of {','.join(ENDPOINTS)}")
+    stages = [int(c) for c in args.stages.split(",") if c.strip()]
+    settings = {key: getattr(args, key) for key in
+                ("workers", "threads", "duration", "titles", "upstream_latency", "upstream_jitter",
+                 "upstream_failure_rate", "segment_kb", "seed")}
+    settings["mix"] = mix
+
+    work_dir = tempfile.mkdtemp(prefix="loadtest-")
+    upstreams = StandInServer(Corpus(None), latency=args.upstream_latency, jitter=args.upstream_jitter,
+                              failure_rate=args.upstream_failure_rate, failure_modes=("error", "reset"),
+                              seed=args.seed, fallback=FakeUpstreams(segment_bytes=args.segment_kb * 1024)).start()
+    process = None
+    results = []
+    try:
+        process, base_url = start_app(_free_port(), upstreams.url, work_dir, args.workers, args.threads,
+                                      os.path.join(work_dir, "gunicorn.log"))
+        workload = Workload(mix, args.titles, args.seed)
+        for concurrency in stages:
+            if not args.json:
+                print(f"👥 {concurrency} clients for {args.warmup + args.duration:.0f}s...", file=sys.stderr)
+            records, start, end = run_stage(base_url, workload, concurrency, args.warmup, args.duration)
+            worker_stats = saturation(read_worker_samples(work_dir), start, end, args.threads)
+            results.append(summarize_stage(concurrency, records, start, end, worker_stats))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if process:
+            stop_app(process)
+        upstreams.stop()
+        if args.keep_logs:
+            print(f"📁 Logs and worker samples kept in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"settings": settings, "stages": results, "upstream": upstreams.stats(),
+              "capacity": capacity(results, args.slo_p99, args.max_error_rate)}
+    changes = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            changes = compare(report, json.load(f))
+        report["compare"] = changes
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, changes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+/api/proxy throughput benchmark
+
+Starts a local origin serving HLS segment sets and large MP4s with Range
+support (bench.upstreams behind the stand-in server), runs the app under
+gunicorn, and plays N concurrent players through /api/proxy: HLS players
+fetch their playlist and then segments in order, MP4 players read
+sequential byte ranges, and both seek to random positions now and then.
+
+Per stage it reports aggregate MB/s, time to first byte per request kind,
+per-player throughput, worker CPU seconds per GB proxied and worker memory
+per open proxy connection, so proxy changes can be compared numerically.
+
+Usage:
+    python -m bench.proxy --players 1,8,32 --duration 20
+    python -m bench.proxy --players 16 --hls-share 0 --range-kb 4096 --json > before.json
+    python -m bench.proxy --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from urllib.parse import quote
+
+import requests
+
+import gunicorn_config
+from api import provider_stats
+from .fixtures import Corpus
+from .standin import StandInServer
+from .upstreams import FakeUpstreams, CDN_HOST, fake_imdb_id, SEGMENTS_PER_PLAYLIST
+from .loadtest import start_app, stop_app, read_worker_samples, _free_port, CLIENT_TIMEOUT_SECONDS
+
+READ_CHUNK_BYTES = 64 * 1024
+# Worker samples taken before the players start give the memory baseline
+BASELINE_SECONDS = 2.0
+
+
+def _proxied(base_url, url):
+    return f"{base_url}/api/proxy?url={quote(url, safe='')}"
+
+
+def _fetch(session, url, headers=None):
+    """GET and drain a response; returns (status, ttfb, seconds, bytes)"""
+    began = time.perf_counter()
+    try:
+        response = session.get(url, headers=headers, stream=True, timeout=CLIENT_TIMEOUT_SECONDS)
+        ttfb = None
+        size = 0
+        for chunk in response.iter_content(READ_CHUNK_BYTES):
+            if ttfb is None:
+                ttfb = time.perf_counter() - began
+            size += len(chunk)
+        response.close()
+        return response.status_code, ttfb, time.perf_counter() - began, size
+    except requests.RequestException:
+        return None, None, time.perf_counter() - began, 0
+
+
+def hls_player(base_url, rng, stop_at, seek_rate, record):
+    session = requests.Session()
+    imdb_id = fake_imdb_id(rng.randrange(1000))
+    playlist = f"https://{CDN_HOST}/hls/{imdb_id}/720p.m3u8"
+    status, ttfb, seconds, size = _fetch(session, _proxied(base_url, playlist))
+    record("playlist", status, ttfb, seconds, size)
+    index = 0
+    while time.time() < stop_at:
+        kind = "segment"
+        if rng.random() < seek_rate:
+            index, kind = rng.randrange(SEGMENTS_PER_PLAYLIST), "seek"
+        segment = f"https://{CDN_HOST}/hls/{imdb_id}/seg-{index}.ts"
+        record(kind, *_fetch(session, _proxied(base_url, segment)))
+        index = (index + 1) % SEGMENTS_PER_PLAYLIST
+    session.close()
+
+
+def mp4_player(base_url, rng, stop_at, seek_rate, record, range_bytes, file_bytes):
+    session = requests.Session()
+    url = _proxied(base_url, f"https://{CDN_HOST}/mp4/{fake_imdb_id(rng.randrange(1000))}.mp4")
+    position = 0
+    while time.time() < stop_at:
+        kind = "range"
+        if rng.random() < seek_rate:
+            position, kind = rng.randrange(0, file_bytes, range_bytes), "seek"
+        end = min(position + range_bytes, file_bytes) - 1
+        record(kind, *_fetch(session, url, headers={"Range": f"bytes={position}-{end}"}))
+        position = end + 1 if end + 1 < file_bytes else 0
+    session.close()
+
+
+def run_stage(base_url, players, duration, hls_share, seek_rate, range_bytes, file_bytes, seed):
+    """
+    Play `players` streams at once for `duration` seconds
+
+    Returns:
+        tuple: (records, per-player bytes, started, ended) with records as
+               (kind, status, ttfb, seconds, bytes)
+    """
+    records = []
+    player_bytes = [0] * players
+    lock = threading.Lock()
+    started = time.time()
+    stop_at = started + duration
+
+    def play(index):
+        rng = random.Random(seed * 1000 + index)
+
+        def record(kind, status, ttfb, seconds, size):
+            with lock:
+                records.append((kind, status, ttfb, seconds, size))
+                player_bytes[index] += size
+
+        if rng.random() < hls_share:
+            hls_player(base_url, rng, stop_at, seek_rate, record)
+        else:
+            mp4_player(base_url, rng, stop_at, seek_rate, record, range_bytes, file_bytes)
+
+    threads = [threading.Thread(target=play, args=(i,), daemon=True) for i in range(players)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=duration + CLIENT_TIMEOUT_SECONDS + 5)
+    return records, player_bytes, started, time.time()
+
+
+def worker_costs(samples, baseline_end, start, end):
+    """CPU seconds and memory growth of all workers over the stage, from the gunicorn_conf samples"""
+    cpu = 0.0
+    rss_base = 0
+    rss_peak = 0
+    peak_streams = 0
+    for rows in samples.values():
+        before = [r for r in rows if r["t"] <= baseline_end]
+        window = [r for r in rows if start <= r["t"] <= end]
+        if len(window) < 2:
+            continue
+        cpu += window[-1]["cpu_seconds"] - window[0]["cpu_seconds"]
+        rss_base += (before[-1] if before else window[0])["rss_bytes"] or 0
+        rss_peak += max(r["rss_bytes"] or 0 for r in window)
+        peak_streams += max(r["proxy_streams"] for r in window)
+    return {"cpu_seconds": round(cpu, 3), "rss_growth_bytes": max(0, rss_peak - rss_base),
+            "peak_proxy_streams": peak_streams}
+
+
+def summarize_stage(players, records, player_bytes, start, end, costs):
+    wall = max(end - start, 1e-9)
+    total = sum(r[4] for r in records)
+    ok = [r for r in records if r[1] in (200, 206)]
+    by_kind = {}
+    for kind, status, ttfb, seconds, size in ok:
+        by_kind.setdefault(kind, []).append(ttfb if ttfb is not None else seconds)
+    per_player = sorted(b / wall / 1e6 for b in player_bytes)
+    gigabytes = total / 1e9
+    return {
+        "players": players,
+        "seconds": round(wall, 2),
+        "requests": len(records),
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else None,
+        "mb_per_second": round(total / wall / 1e6, 2),
+        "bytes": total,
+        "ttfb": {kind: provider_stats.summarize(len(v), len(v), v) for kind, v in sorted(by_kind.items())},
+        "player_mb_per_second": {"min": round(per_player[0], 2), "p50": round(provider_stats.percentile(per_player, 0.5), 2)}
+        if per_player else None,
+        "cpu_seconds_per_gb": round(costs["cpu_seconds"] / gigabytes, 2) if gigabytes else None,
+        "memory_per_connection_mb": round(costs["rss_growth_bytes"] / costs["peak_proxy_streams"] / 1e6, 3)
+        if costs["peak_proxy_streams"] else None,
+        "workers": costs
+    }
+
+
+def compare(report, baseline):
+    """Per player count change of the headline numbers against an earlier --json report, in percent"""
+    before = {s["players"]: s for s in baseline.get("stages", [])}
+    changes = {}
+    for stage in report["stages"]:
+        old = before.get(stage["players"])
+        if not old:
+            continue
+        changes[stage["players"]] = {
+            metric: round((stage[metric] - old[metric]) / old[metric] * 100, 1)
+            if stage.get(metric) is not None and old.get(metric) else None
+            for metric in ("mb_per_second", "cpu_seconds_per_gb", "memory_per_connection_mb")
+        }
+    return changes
+
+
+def print_report(report, changes=None):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    print(f"\n⚙️  {report['settings']}")
+    for stage in report["stages"]:
+        player = stage["player_mb_per_second"] or {}
+        print(f"\n🎞️  {stage['players']} players: {stage['mb_per_second']} MB/s over {stage['requests']} requests, "
+              f"errors {(stage['error_rate'] or 0) * 100:.1f}%")
+        print(f"  per player MB/s: min {player.get('min', '-')}, p50 {player.get('p50', '-')}")
+        print(f"  cpu per GB: {stage['cpu_seconds_per_gb'] or '-'}s, "
+              f"memory per connection: {stage['memory_per_connection_mb'] or '-'}MB "
+              f"(peak {stage['workers']['peak_proxy_streams']} proxy streams)")
+        print(f"  {'ttfb':10} {'reqs':>6} {'p50':>9} {'p90':>9} {'p99':>9}")
+        for kind, row in stage["ttfb"].items():
+            print(f"  {kind:10} {row['attempts']:>6} {ms(row['p50']):>9} {ms(row['p90']):>9} {ms(row['p99']):>9}")
+    if changes:
+        print("\n📈 Change against baseline (per player count)")
+        for players, change in changes.items():
+            parts = [f"{metric} {value:+.1f}%" for metric, value in change.items() if value is not None]
+            print(f"  {players:>5} players: {', '.join(parts) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/proxy against a local HLS/MP4 origin")
+    parser.add_argument("--players", default="1,8,32", help="Comma-separated concurrent players per stage")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per stage")
+    parser.add_argument("--workers", type=int, default=gunicorn_config.workers,
+                        help=f"Gunicorn worker processes (default: production's {gunicorn_config.workers})")
+    parser.add_argument("--threads", type=int, default=gunicorn_config.threads,
+                        help=f"Threads per worker; each open stream holds one (default: production's {gunicorn_config.threads})")
+    parser.add_argument("--hls-share", type=float, default=0.5, help="Share of players on HLS, the rest on MP4")
+    parser.add_argument("--seek-rate", type=float, default=0.05, help="Chance each request seeks somewhere random")
+    parser.add_argument("--segment-kb", type=int, default=1024, help="HLS segment size")
+    parser.add_argument("--mp4-mb", type=int, default=256, help="MP4 file size")
+    parser.add_argument("--range-kb", type=int, default=2048, help="Bytes per MP4 range request")
+    parser.add_argument("--origin-latency", type=float, default=0.0, help="Seconds the origin waits before answering")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="Earlier --json report to compare against")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    stages = [int(p) for p in args.players.split(",") if p.strip()]
+    file_bytes = args.mp4_mb * 1024 * 1024
+    range_bytes = args.range_kb * 1024
+    settings = {key: getattr(args, key) for key in
+                ("duration", "workers", "threads", "hls_share", "seek_rate", "segment_kb", "mp4_mb", "range_kb",
+                 "origin_latency", "seed")}
+
+    work_dir = tempfile.mkdtemp(prefix="proxybench-")
+    origin = StandInServer(Corpus(None), latency=args.origin_latency, seed=args.seed,
+                           fallback=FakeUpstreams(segment_bytes=args.segment_kb * 1024, mp4_bytes=file_bytes)).start()
+    process = None
+    results = []
+    try:
+        process, base_url = start_app(_free_port(), origin.url, work_dir, args.workers, args.threads,
+                                      os.path.join(work_dir, "gunicorn.log"))
+        for players in stages:
+            if not args.json:
+                print(f"🎞️  {players} players for {args.duration:.0f}s...", file=sys.stderr)
+            time.sleep(BASELINE_SECONDS)
+            baseline_end = time.time()
+            records, player_bytes, start, end = run_stage(base_url, players, args.duration, args.hls_share,
+                                                          args.seek_rate, range_bytes, file_bytes, args.seed)
+            # Let the samplers record the end of the stage
+            time.sleep(1.0)
+            costs = worker_costs(read_worker_samples(work_dir), baseline_end, start, end + 1.0)
+            results.append(summarize_stage(players, records, player_bytes, start, end, costs))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if process:
+            stop_app(process)
+        origin.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"settings": settings, "stages": results, "origin": origin.stats()}
+    changes = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            changes = compare(report, json.load(f))
+        report["compare"] = changes
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, changes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
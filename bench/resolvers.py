@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Resolver benchmark against a stand-in server
+
+Runs get_m3u8_from_multiembed and every registered iframe extractor over
+the titles and pages of a fixture corpus, with all upstream traffic
+replayed by bench.standin, and reports latency percentiles and throughput
+per target. Nothing touches the real embed hosts, so two runs differ only
+by the code under test and the injected conditions. (get_best_stream is
+not a target: its providers are URL templates that make no requests.)
+
+Usage:
+    python -m bench.fixtures synth
+    python -m bench.resolvers --iterations 5 --concurrency 4
+    python -m bench.resolvers --latency 0.2 --jitter 0.3 --failure-rate 0.1 --seed 1 --output after.json
+    python -m bench.resolvers --compare before.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+
+from api import provider_stats, stream_cache
+from api.deadline import Deadline, STREAM_REQUEST_BUDGET_SECONDS
+from .fixtures import Corpus, DEFAULT_CORPUS, replaying
+from .standin import StandInServer, FAILURE_MODES
+
+TARGETS = ("multiembed", "extractors")
+
+
+def _clear_warm_caches():
+    # Validation and manifest caches would turn repeat iterations into lookups
+    from api import m3u8_validator, hls_manifest
+    with m3u8_validator._validation_cache_lock:
+        m3u8_validator._validation_cache.clear()
+    with hls_manifest._manifest_cache_lock:
+        hls_manifest._manifest_cache.clear()
+
+
+def build_cases(corpus, targets, budget, cold=True):
+    """
+    List the calls to time as (target, label, fn) where fn returns True on success
+
+    Returns:
+        list: Cases in a stable order
+    """
+    from api.stream_fetcher import get_m3u8_from_multiembed, stream_cache_key
+    from api.providers import IFRAME, providers_for
+
+    cases = []
+    for imdb_id in corpus.titles:
+        if "multiembed" in targets:
+            def multiembed(imdb_id=imdb_id):
+                if cold:
+                    stream_cache.invalidate(stream_cache_key(imdb_id))
+                return bool(get_m3u8_from_multiembed(imdb_id, 'auto', deadline=Deadline(budget)).get("success"))
+            cases.append(("get_m3u8_from_multiembed", imdb_id, multiembed))
+
+    if "extractors" in targets:
+        urls = corpus.urls()
+        for provider in providers_for(IFRAME):
+            for url in urls:
+                if provider.handles(url):
+                    cases.append((f"extractor:{provider.name}", url,
+                                  lambda provider=provider, url=url: bool(provider.extract(url, Deadline(budget)))))
+    return cases
+
+
+def run_cases(cases, iterations=3, concurrency=1, cold=True):
+    """
+    Call every case `iterations` times, `concurrency` calls at once per target
+
+    Returns:
+        dict: { target: {'attempts', 'successes', 'samples', 'wall_seconds'} }
+    """
+    by_target = {}
+    for target, label, fn in cases:
+        by_target.setdefault(target, []).append(fn)
+
+    results = {}
+    for target, fns in by_target.items():
+        samples = []
+        successes = 0
+        lock = threading.Lock()
+
+        def timed(fn):
+            nonlocal successes
+            if cold:
+                _clear_warm_caches()
+            started = time.perf_counter()
+            try:
+                ok = fn()
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append(elapsed)
+                successes += 1 if ok else 0
+
+        calls = [fn for _ in range(iterations) for fn in fns]
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            list(executor.map(timed, calls))
+        results[target] = {"attempts": len(calls), "successes": successes, "samples": samples,
+                           "wall_seconds": time.perf_counter() - started}
+    return results
+
+
+def build_report(results, server_stats, settings):
+    targets = {}
+    for target, r in results.items():
+        summary = provider_stats.summarize(r["attempts"], r["successes"], r["samples"])
+        summary["mean"] = sum(r["samples"]) / len(r["samples"]) if r["samples"] else None
+        summary["calls_per_second"] = round(r["attempts"] / r["wall_seconds"], 2) if r["wall_seconds"] else None
+        targets[target] = summary
+    return {"settings": settings, "targets": targets, "standin": server_stats, **provider_stats.get_provider_stats()}
+
+
+def compare(report, baseline):
+    """Per target change of p50/p90/throughput against an earlier --json report, in percent"""
+    changes = {}
+    for target, now in report["targets"].items():
+        before = baseline.get("targets", {}).get(target)
+        if not before:
+            continue
+        changes[target] = {
+            metric: round((now[metric] - before[metric]) / before[metric] * 100, 1)
+            if now.get(metric) is not None and before.get(metric) else None
+            for metric in ("p50", "p90", "calls_per_second")
+        }
+    return changes
+
+
+def print_report(report, changes=None):
+    def fmt(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    print(f"\n⚙️  {report['settings']}")
+    print(f"\n  {'target':36} {'calls':>6} {'ok%':>6} {'p50':>10} {'p90':>10} {'p99':>10} {'calls/s':>8}")
+    for name, row in report["targets"].items():
+        rate = "-" if row["success_rate"] is None else f"{row['success_rate'] * 100:.0f}"
+        print(f"  {name[:36]:36} {row['attempts']:>6} {rate:>6} {fmt(row['p50']):>10} "
+              f"{fmt(row['p90']):>10} {fmt(row['p99']):>10} {row['calls_per_second'] or '-':>8}")
+    if changes:
+        print("\n📈 Change against baseline (negative latency is faster)")
+        for name, change in changes.items():
+            parts = [f"{metric} {value:+.1f}%" for metric, value in change.items() if value is not None]
+            print(f"  {name[:36]:36} {', '.join(parts) or '-'}")
+    standin = report["standin"]
+    print(f"\n🎭 Stand-in: {standin['requests']} requests, {standin['hits']} replayed, "
+          f"{standin['misses']} not recorded, "
+          f"{sum(standin[f'injected_{mode}'] for mode in FAILURE_MODES)} injected failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stream resolvers against recorded fixtures")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=f"Corpus directory (default: {DEFAULT_CORPUS})")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma-separated subset of {','.join(TARGETS)}")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over every title and page")
+    parser.add_argument("--concurrency", type=int, default=1, help="Calls in flight at once per target")
+    parser.add_argument("--budget", type=float, default=STREAM_REQUEST_BUDGET_SECONDS, help="Deadline per call")
+    parser.add_argument("--warm", action="store_true", help="Keep stream, validation and manifest caches between calls")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stand-in adds to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many random extra seconds")
+    parser.add_argument("--recorded-timing", action="store_true", help="Replay each response's recorded latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of upstream requests that fail")
+    parser.add_argument("--failure-modes", default="error,reset,truncate",
+                        help=f"Comma-separated subset of {','.join(FAILURE_MODES)}")
+    parser.add_argument("--hang", type=float, default=30.0, help="Seconds a 'timeout' failure hangs")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for jitter and failure draws")
+    parser.add_argument("--server", help="Use an already running stand-in at this URL instead of starting one")
+    parser.add_argument("--compare", help="Earlier --json report to compare against")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON; anything the app prints goes to stderr instead")
+    parser.add_argument("--output", help="Also write the JSON report to this file, e.g. for a later --compare")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus)
+    if not corpus.titles:
+        print(f"❌ Corpus {args.corpus} has no titles; run `python -m bench.fixtures synth` or `record` first")
+        return 1
+    targets = {t.strip() for t in args.targets.split(",") if t.strip() in TARGETS}
+    cold = not args.warm
+    modes = [m.strip() for m in args.failure_modes.split(",") if m.strip() in FAILURE_MODES]
+    settings = {key: getattr(args, key) for key in
+                ("iterations", "concurrency", "budget", "latency", "jitter", "failure_rate", "seed")}
+    settings.update(failure_modes=modes, cold=cold, titles=len(corpus.titles))
+
+    server = None
+    if not args.server:
+        server = StandInServer(corpus, latency=args.latency, jitter=args.jitter,
+                               recorded_timing=args.recorded_timing, failure_rate=args.failure_rate,
+                               failure_modes=modes, hang_seconds=args.hang, seed=args.seed).start()
+    provider_stats.reset()
+    # App modules print while loading and resolving, which would corrupt a JSON report on stdout
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    try:
+        with quiet, replaying(args.server or server.url):
+            results = run_cases(build_cases(corpus, targets, args.budget, cold), args.iterations,
+                                args.concurrency, cold)
+    finally:
+        if server:
+            server.stop()
+
+    no_stats = {"requests": 0, "hits": 0, "misses": 0, **{f"injected_{mode}": 0 for mode in FAILURE_MODES}}
+    report = build_report(results, server.stats() if server else no_stats, settings)
+    changes = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            changes = compare(report, json.load(f))
+        report["compare"] = changes
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, changes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Stand-in upstream server replaying a fixture corpus
+
+Answers requests of the form /<scheme>/<host>/<path>?<query>, as sent by
+bench.fixtures.replaying(), with the recorded response for
+<scheme>://<host>/<path>?<query>. Latency and failures are injected so
+resolver changes can be measured under slow or flaky hosts, repeatably.
+
+Usage:
+    python -m bench.standin --corpus bench/corpus --port 8765 --latency 0.2 --failure-rate 0.1
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fixtures import Corpus, DEFAULT_CORPUS
+
+FAILURE_MODES = ("error", "reset", "timeout", "truncate")
+# Bodies are written in slices of this many bytes, so large files are never copied whole
+WRITE_CHUNK_BYTES = 64 * 1024
+# Most distinct unmatched URLs kept for the report
+MAX_MISSES_KEPT = 50
+
+
+class StandInServer:
+    """
+    Replays a corpus over HTTP on a local port
+
+    Args:
+        corpus (Corpus): Recorded responses
+        latency (float): Seconds added before every response
+        jitter (float): Extra random seconds, up to this much
+        recorded_timing (bool): Add each response's recorded latency as well
+        failure_rate (float): Share of requests that fail, 0..1
+        failure_modes (tuple): Failures drawn from: error (503), reset (connection
+            closed without a response), timeout (hang for `hang_seconds`),
+            truncate (body cut short)
+        miss_status (int): Status for requests with no recording
+        seed (int): Seed for jitter and failure draws, for repeatable runs
+        fallback (callable): (method, url) -> (status, headers, body) or None, asked
+            for requests the corpus has no recording of (see bench.upstreams)
+    """
+
+    def __init__(self, corpus, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, recorded_timing=False,
+                 failure_rate=0.0, failure_modes=FAILURE_MODES, hang_seconds=30.0, miss_status=404, seed=None,
+                 fallback=None):
+        self.corpus = corpus
+        self.fallback = fallback
+        self.latency = latency
+        self.jitter = jitter
+        self.recorded_timing = recorded_timing
+        self.failure_rate = failure_rate
+        self.failure_modes = tuple(failure_modes)
+        self.hang_seconds = hang_seconds
+        self.miss_status = miss_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bodies = {}
+        self.counters = {"requests": 0, "hits": 0, "misses": 0, "bytes": 0,
+                         **{f"injected_{mode}": 0 for mode in FAILURE_MODES}}
+        self.missed_urls = set()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True, name="standin-server")
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self.counters[name] += delta
+
+    def _draw(self):
+        # Returns (delay, failure mode or None) for one request
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            failure = None
+            if self.failure_rate and self.failure_modes and self._random.random() < self.failure_rate:
+                failure = self._random.choice(self.failure_modes)
+        return delay, failure
+
+    def _body(self, entry):
+        with self._lock:
+            body = self._bodies.get(entry["body"])
+        if body is None:
+            body = self.corpus.body(entry)
+            with self._lock:
+                self._bodies[entry["body"]] = body
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "missed_urls": sorted(self.missed_urls)}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _original_url(self):
+                scheme, _, rest = self.path.lstrip("/").partition("/")
+                return f"{scheme}://{rest}"
+
+            def _send(self, head_only=False):
+                server._count("requests")
+                url = self._original_url()
+                entry = server.corpus.lookup(self.command, url) or server.corpus.lookup("GET", url)
+                delay, failure = server._draw()
+                if entry and server.recorded_timing and entry.get("elapsed"):
+                    delay += entry["elapsed"]
+                if delay:
+                    time.sleep(delay)
+
+                if failure:
+                    server._count(f"injected_{failure}")
+                    if failure == "reset":
+                        self.close_connection = True
+                        return
+                    if failure == "timeout":
+                        time.sleep(server.hang_seconds)
+                        self.close_connection = True
+                        return
+                    if failure == "error":
+                        return self._respond(503, {"content-type": "text/plain"}, b"injected failure", head_only)
+
+                generated = server.fallback(self.command, url) if entry is None and server.fallback else None
+                if entry is None and generated is None:
+                    server._count("misses")
+                    with server._lock:
+                        if len(server.missed_urls) < MAX_MISSES_KEPT:
+                            server.missed_urls.add(url)
+                    return self._respond(server.miss_status, {"content-type": "text/plain"}, b"not recorded", head_only)
+
+                server._count("hits")
+                if entry is not None:
+                    status, headers, body = entry["status"], dict(entry["headers"]), server._body(entry)
+                else:
+                    status, headers, body = generated[0], dict(generated[1]), generated[2]
+                if status == 200 and body:
+                    status, headers, body = self._apply_range(headers, body)
+                self._respond(status, headers, body, head_only, truncate=failure == "truncate")
+
+            def _apply_range(self, headers, body):
+                spec = self.headers.get("Range", "")
+                if not spec.startswith("bytes=") or "," in spec:
+                    return 200, headers, body
+                start, _, end = spec[len("bytes="):].partition("-")
+                try:
+                    if start:
+                        first, last = int(start), int(end) if end else len(body) - 1
+                    else:
+                        first, last = max(0, len(body) - int(end)), len(body) - 1
+                except ValueError:
+                    return 200, headers, body
+                if first >= len(body) or first > last:
+                    return 416, {"content-range": f"bytes */{len(body)}"}, b""
+                last = min(last, len(body) - 1)
+                headers["content-range"] = f"bytes {first}-{last}/{len(body)}"
+                headers["accept-ranges"] = "bytes"
+                return 206, headers, memoryview(body)[first:last + 1]
+
+            def _respond(self, status, headers, body, head_only, truncate=False):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                if truncate:
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+                if head_only:
+                    return
+                payload = memoryview(body)[:len(body) // 2 if truncate else len(body)]
+                sent = 0
+                try:
+                    while sent < len(payload):
+                        self.wfile.write(payload[sent:sent + WRITE_CHUNK_BYTES])
+                        sent += WRITE_CHUNK_BYTES
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                server._count("bytes", min(sent, len(payload)))
+
+            def do_GET(self):
+                self._send()
+
+            def do_HEAD(self):
+                self._send(head_only=True)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                self._send()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fixture corpus as a stand-in for the upstream hosts")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=f"Corpus directory (default: {DEFAULT_CORPUS})")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many random extra seconds")
+    parser.add_argument("--recorded-timing", action="store_true", help="Also replay each response's recorded latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests that fail (0..1)")
+    parser.add_argument("--failure-modes", default=",".join(FAILURE_MODES),
+                        help=f"Comma-separated failures to inject (default: {','.join(FAILURE_MODES)})")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for repeatable jitter and failures")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus)
+    if not len(corpus):
+        print(f"❌ Corpus {args.corpus} is empty; record or synthesize one with bench.fixtures")
+        return 1
+    modes = [m.strip() for m in args.failure_modes.split(",") if m.strip() in FAILURE_MODES]
+    server = StandInServer(corpus, args.host, args.port, args.latency, args.jitter, args.recorded_timing,
+                           args.failure_rate, modes, seed=args.seed)
+    print(f"🎭 Replaying {len(corpus)} responses on {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"\n📊 {server.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Fake upstreams for load tests: OMDb, embed pages and a video CDN
+
+`FakeUpstreams` answers any URL the app would fetch with made-up but
+well-formed responses, deterministically per IMDb ID, so a load test needs
+no recordings. Plug it into a stand-in server as its fallback:
+
+    server = StandInServer(Corpus(None), fallback=FakeUpstreams()).start()
+
+Titles whose number is divisible by 4 have no direct embed and resolve
+through the multiembed page and a MixDrop iframe instead, so both resolver
+paths carry load. The CDN host contains "mixdrop" so /api/proxy accepts it.
+"""
+
+import re
+import json
+import zlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+CDN_HOST = "mixdrop-cdn.bench.invalid"
+MIXDROP_HOST = "mixdrop.bench.invalid"
+# Made-up titles are tt9100000 .. tt9100000 + FAKE_TITLES - 1
+FAKE_TITLE_BASE = 9100000
+FAKE_TITLES = 1000
+SEARCH_RESULTS = 10
+SEGMENTS_PER_PLAYLIST = 60
+SEGMENT_SECONDS = 6
+
+HTML = {"content-type": "text/html; charset=utf-8"}
+JSON = {"content-type": "application/json; charset=utf-8"}
+HLS = {"content-type": "application/vnd.apple.mpegurl"}
+
+
+def fake_imdb_id(n):
+    return f"tt{FAKE_TITLE_BASE + n % FAKE_TITLES:07d}"
+
+
+def title_number(imdb_id):
+    return int(imdb_id[2:]) - FAKE_TITLE_BASE if re.fullmatch(r"tt\d{7,8}", imdb_id or "") else -1
+
+
+class FakeUpstreams:
+    """
+    Generates upstream responses by URL
+
+    Args:
+        segment_bytes (int): Size of every HLS segment
+        mp4_bytes (int): Size of every MP4 file
+    """
+
+    def __init__(self, segment_bytes=512 * 1024, mp4_bytes=64 * 1024 * 1024):
+        self.segment_bytes = segment_bytes
+        self.mp4_bytes = mp4_bytes
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url):
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if host == "www.omdbapi.com":
+            return self._omdb(query)
+        if host == CDN_HOST:
+            return self._cdn(parts.path)
+        if host == MIXDROP_HOST:
+            return self._mixdrop(parts.path.rsplit("/", 1)[-1])
+        if host == "multiembed.mov" and parts.path == "/directstream.php":
+            return self._direct_embed(query.get("video_id", ""))
+        if host == "multiembed.mov" and parts.path.startswith("/movie/imdb/"):
+            return self._multiembed(parts.path.rsplit("/", 1)[-1])
+        return None
+
+    def _blob(self, size, fill):
+        # One shared buffer per size; the stand-in serves slices of it without copying
+        with self._lock:
+            blob = self._blobs.get((size, fill))
+            if blob is None:
+                blob = self._blobs[(size, fill)] = (fill * (size // len(fill) + 1))[:size]
+            return blob
+
+    def _omdb(self, query):
+        if "s" in query:
+            seed = zlib.crc32(query["s"].lower().encode())
+            movies = [{"Title": f"{query['s'].title()} {i + 1}", "Year": str(1990 + (seed + i) % 35),
+                       "imdbID": fake_imdb_id(seed + i), "Type": "movie",
+                       "Poster": f"https://img.bench.invalid/{fake_imdb_id(seed + i)}.jpg"}
+                      for i in range(SEARCH_RESULTS)]
+            body = {"Search": movies, "totalResults": str(SEARCH_RESULTS), "Response": "True"}
+        elif "i" in query:
+            n = title_number(query["i"])
+            if n < 0:
+                body = {"Response": "False", "Error": "Incorrect IMDb ID."}
+            else:
+                body = {"Title": f"Bench Movie {n}", "Year": str(1990 + n % 35), "Rated": "PG-13",
+                        "Released": "01 Jan 2000", "Runtime": f"{90 + n % 60} min", "Genre": "Action, Drama",
+                        "Director": "A. Director", "Writer": "A. Writer", "Actors": "One Actor, Two Actor",
+                        "Plot": "A load test walks into a bar. " * 8, "Language": "English", "Country": "USA",
+                        "Awards": "N/A", "Poster": f"https://img.bench.invalid/{query['i']}.jpg",
+                        "Metascore": "70", "imdbRating": "7.5", "imdbID": query["i"], "Type": "movie",
+                        "BoxOffice": "N/A", "Production": "N/A", "Website": "N/A", "Response": "True"}
+        else:
+            body = {"Response": "False", "Error": "No search parameter."}
+        return 200, JSON, json.dumps(body).encode()
+
+    def _page(self, inner):
+        filler = "".join(f"<div class='related'><a href='/movie/{fake_imdb_id(i)}'>More {i}</a></div>"
+                         for i in range(100))
+        return f"<html><head><title>Player</title></head><body>{filler}{inner}</body></html>".encode()
+
+    def _direct_embed(self, imdb_id):
+        n = title_number(imdb_id)
+        if n < 0 or n % 4 == 0:
+            return 404, HTML, b"<html><body>Not found</body></html>"
+        manifest = f"https://{CDN_HOST}/hls/{imdb_id}/master.m3u8"
+        return 200, HTML, self._page(
+            f"<div id='player'></div><script>jwplayer('player').setup({{file: \"{manifest}\"}});</script>")
+
+    def _multiembed(self, imdb_id):
+        return 200, HTML, self._page(f"<iframe src=\"https://{MIXDROP_HOST}/e/{imdb_id}\"></iframe>")
+
+    def _mixdrop(self, imdb_id):
+        manifest = f"https://{CDN_HOST}/hls/{imdb_id}/master.m3u8"
+        return 200, HTML, self._page(f"<video><source src=\"{manifest}\"></video>")
+
+    def _cdn(self, path):
+        name = path.rsplit("/", 1)[-1]
+        if name == "master.m3u8":
+            return 200, HLS, (
+                "#EXTM3U\n"
+                "#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\n720p.m3u8\n"
+                "#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n360p.m3u8\n").encode()
+        if name.endswith(".m3u8"):
+            lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                     "#EXT-X-MEDIA-SEQUENCE:0"]
+            for i in range(SEGMENTS_PER_PLAYLIST):
+                lines += [f"#EXTINF:{SEGMENT_SECONDS}.0,", f"seg-{i}.ts"]
+            lines.append("#EXT-X-ENDLIST")
+            return 200, HLS, ("\n".join(lines) + "\n").encode()
+        if name.endswith(".ts"):
+            # 0x47 is the MPEG-TS sync byte, so sniffers see a transport stream
+            return 200, {"content-type": "video/mp2t", "accept-ranges": "bytes"}, \
+                self._blob(self.segment_bytes, b"\x47" + b"\x00" * 187)
+        if name.endswith(".mp4"):
+            return 200, {"content-type": "video/mp4", "accept-ranges": "bytes"}, \
+                self._blob(self.mp4_bytes, b"\x00\x00\x00\x18ftypmp42")
+        return None
@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for production (Procfile, render.yaml)
+
+    gunicorn -c gunicorn_config.py main:app
+
+SSE streams and /api/proxy hold a request thread for as long as the player
+is connected, so workers are threaded; bench/gunicorn_conf.py loads these
+same settings so load tests measure what is deployed.
+"""
+
+import os
+
+# Worker processes; each keeps its own stream cache unless STREAM_CACHE_REDIS_URL is set
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Request threads per worker; every open SSE or proxy stream holds one. The app reads the same
+# variable: api/resolver_pool.py keeps RESOLVER_MAX_INFLIGHT below it and api/readiness.py
+# reports not ready once most of these threads are busy
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = "gthread" if threads > 1 else "sync"
+# Seconds a worker may go silent before it is restarted
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
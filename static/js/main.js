@@ -3,6 +3,8 @@
 // Global variables
 let currentQuery = '';
 let isSearching = false;
+// IMDb IDs already sent to the stream prefetch endpoint this page view
+const prefetchedStreams = new Set();
 
 // DOM Elements
 const searchForm = document.getElementById('search-form');
@@ -202,6 +204,12 @@ function displaySearchResults(groupedMovies) {
         }
     });
     
+    // Only the first row's worth; the rest are prefetched on hover
+    const firstRow = groupedMovies
+        .flatMap(item => item.type === 'series' ? item.movies : [item.movie])
+        .slice(0, 8);
+    prefetchRow(firstRow);
+    
     console.log('📱 Showing search results section');
     showSearchResults();
     scrollToSection('search-results');
@@ -250,6 +258,7 @@ function createMovieCard(movie) {
     const card = document.createElement('div');
     card.className = 'movie-card fade-in';
     card.onclick = () => watchMovie(movie.imdbID);
+    card.addEventListener('mouseenter', () => prefetchStreams([movie.imdbID]), { once: true });
     
     // Better poster handling
     let posterHtml = '';
@@ -300,6 +309,28 @@ function createSeriesCard(series) {
     return card;
 }
 
+// Warm the server's stream cache so a click on these titles starts playing sooner
+function prefetchStreams(imdbIds) {
+    const ids = imdbIds.filter(id => id && !prefetchedStreams.has(id));
+    if (ids.length === 0) return;
+    ids.forEach(id => prefetchedStreams.add(id));
+
+    fetch('/api/stream/prefetch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ imdb_ids: ids })
+    }).catch(error => {
+        // Best effort only: a failed prefetch just means a cold click
+        console.warn('Stream prefetch failed:', error);
+        ids.forEach(id => prefetchedStreams.delete(id));
+    });
+}
+
+// Prefetch a whole row once its cards are on the page
+function prefetchRow(movies) {
+    prefetchStreams(movies.map(movie => movie.imdbID));
+}
+
 // Navigate to watch page
 function watchMovie(imdbId) {
     if (imdbId) {
@@ -352,6 +383,7 @@ async function loadPopularMovies() {
                 const movieCard = createMovieCard(movie);
                 popularMovies.appendChild(movieCard);
             });
+            prefetchRow(validMovies);
         } else {
             popularMovies.innerHTML = `
                 <div class="no-movies">
@@ -9,6 +9,11 @@ class NetMirrorPlayer {
       this.maxRetries = 3;
       this.sourceIndex = 0;
       this.availableSources = ['auto', 'vidsrc', 'mixdrop', 'streamwish', 'doodstream', 'streamtape', 'vidcloud'];
+      this.streamVariants = [];
+      // Candidates pushed by /api/stream/<id>/events, kept for instant failover
+      this.candidates = [];
+      this.candidateIndex = -1;
+      this.eventSource = null;
   
       // DOM elements
       this.playerLoading = document.getElementById('player-loading');
@@ -108,36 +113,110 @@ class NetMirrorPlayer {
         console.log('loadStream called with source:', source);
         this.currentSource = source;
         this.retryCount = 0;
+        this.closeEventSource();
+        this.candidates = [];
+        this.candidateIndex = -1;
         // Update UI
         this.showLoading();
         this.hideError();
         this.hidePlayer();
         this.updateSourceButtons(source);
         this.updateDebugInfo(source, 'Loading...', 'Loading...');
+        if (source === 'auto' && window.EventSource) {
+            this.loadStreamProgressive();
+            return;
+        }
+        await this.loadStreamFromApi(source);
+    }
+
+    // Play the first candidate as soon as the server pushes it, collect the rest for failover
+    loadStreamProgressive() {
+        const events = new EventSource(`/api/stream/${this.imdbId}/events?source=auto`);
+        this.eventSource = events;
+
+        events.addEventListener('candidate', (e) => {
+            const candidate = JSON.parse(e.data);
+            console.log('Stream candidate:', candidate);
+            this.candidates.push(candidate);
+            if (this.candidateIndex === -1) {
+                this.playCandidate(0);
+            }
+        });
+
+        events.addEventListener('done', () => {
+            this.closeEventSource();
+            if (this.candidates.length === 0) {
+                this.showError('No playable stream found. Trying different source...');
+                this.tryDifferentSource();
+            }
+        });
+
+        events.onerror = () => {
+            // Stream unavailable or dropped: without candidates fall back to the one-shot API
+            if (this.eventSource !== events) return;
+            this.closeEventSource();
+            if (this.candidates.length === 0) {
+                this.loadStreamFromApi('auto');
+            }
+        };
+    }
+
+    closeEventSource() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+
+    async playCandidate(index) {
+        const candidate = this.candidates[index];
+        this.candidateIndex = index;
+        this.currentStreamUrl = candidate.url;
+        this.currentStreamType = candidate.type || this.determineStreamType(candidate.url);
+        this.streamVariants = Array.isArray(candidate.variants) ? candidate.variants : [];
+        this.updateDebugInfo(candidate.source || this.currentSource, this.currentStreamUrl, this.currentStreamType);
+        this.hideError();
+        try {
+            await this.playCurrentStream(this.currentStreamType === 'iframe');
+        } finally {
+            this.hideLoading();
+        }
+    }
+
+    async playCurrentStream(isEmbed) {
+        if (isEmbed || this.currentStreamType === 'iframe') {
+            await this.loadIframePlayer(this.currentStreamUrl);
+        } else if (this.currentStreamType === 'hls') {
+            await this.loadHLSPlayer();
+        } else if (this.currentStreamType === 'mp4') {
+            await this.loadMP4Player();
+        } else {
+            await this.loadIframePlayer(this.currentStreamUrl);
+        }
+    }
+
+    async loadStreamFromApi(source) {
         try {
             console.log('About to fetch stream from API...');
             // Fetch stream from API
-            const response = await fetch(`/api/stream/${this.imdbId}?source=${source}`);
+            // Ask for the ranked candidate list so failover needs no further request
+            const response = await fetch(`/api/stream/${this.imdbId}?source=${source}&candidates=1`);
             if (!response.ok) {
                 throw new Error(`API error: ${response.status}`);
             }
             const data = await response.json();
             console.log('Stream API data:', data);
 
-            if (data.success && data.stream_url) {
+            if (data.success && Array.isArray(data.candidates) && data.candidates.length > 0) {
+                this.candidates = data.candidates;
+                await this.playCandidate(0);
+            } else if (data.success && data.stream_url) {
                 this.currentStreamUrl = data.stream_url;
                 this.currentStreamType = this.determineStreamType(this.currentStreamUrl);
+                this.streamVariants = Array.isArray(data.variants) ? data.variants : [];
                 this.updateDebugInfo(source, this.currentStreamUrl, this.currentStreamType);
 
-                if (data.embed === true || this.currentStreamType === 'iframe') {
-                    await this.loadIframePlayer(this.currentStreamUrl);
-                } else if (this.currentStreamType === 'hls') {
-                    await this.loadHLSPlayer();
-                } else if (this.currentStreamType === 'mp4') {
-                    await this.loadMP4Player();
-                } else {
-                    await this.loadIframePlayer();
-                }
+                await this.playCurrentStream(data.embed === true);
             } else {
                 let userMessage = data.error || 'No playable stream found.';
                 this.showError(userMessage + ' Trying different source...');
@@ -207,7 +286,9 @@ class NetMirrorPlayer {
         this.showPlayer();
   
         if (Hls.isSupported()) {
-          this.hls = new Hls();
+          // Server-parsed ladder lets us fill the selector before the manifest round trip
+          this.populateQualityFromVariants(this.streamVariants);
+          this.hls = new Hls({ startLevel: this.pickStartLevel(this.streamVariants) });
   
           // Optional headers
           this.hls.config.xhrSetup = (xhr) => {
@@ -300,6 +381,37 @@ class NetMirrorPlayer {
       });
     }
   
+    // Fill the quality selector from the server-provided variants (ascending bandwidth = hls.js level order)
+    populateQualityFromVariants(variants) {
+      if (!this.qualitySelect || !variants || variants.length === 0) return;
+
+      this.qualitySelect.innerHTML = '<option value="auto" selected>Auto</option>';
+      variants
+        .map((variant, index) => ({ variant, index }))
+        .sort((a, b) => (b.variant.height || 0) - (a.variant.height || 0))
+        .forEach(({ variant, index }) => {
+          const option = document.createElement('option');
+          option.value = index;
+          option.textContent = variant.label || (variant.bandwidth ? `${Math.round(variant.bandwidth / 1000)} kbps` : `Level ${index}`);
+          this.qualitySelect.appendChild(option);
+        });
+      this.qualitySelect.disabled = false;
+    }
+
+    // Highest variant that fits comfortably in the estimated downlink, or -1 to let hls.js decide
+    pickStartLevel(variants) {
+      if (!variants || variants.length === 0) return -1;
+      const connection = navigator.connection || navigator.mozConnection || navigator.webkitConnection;
+      if (!connection || !connection.downlink) return -1;
+
+      const budget = connection.downlink * 1000000 * 0.8;
+      let level = 0;
+      variants.forEach((variant, index) => {
+        if (variant.bandwidth && variant.bandwidth <= budget) level = index;
+      });
+      return level;
+    }
+  
     onQualityChange(value) {
       if (!this.hls) return;
   
@@ -421,17 +533,46 @@ class NetMirrorPlayer {
     }
   
     async tryDifferentSource() {
+      if (this.candidateIndex >= 0) {
+        this.reportBrokenCandidate(this.candidates[this.candidateIndex]);
+      }
+      // Fail over to the next known candidate before asking the server again
+      if (this.candidateIndex + 1 < this.candidates.length) {
+        await this.playCandidate(this.candidateIndex + 1);
+        return;
+      }
+      if (this.eventSource && this.candidateIndex >= 0) {
+        // More candidates may still arrive; play the next one when it does
+        this.candidateIndex = -1;
+        this.candidates = [];
+        this.showLoading();
+        return;
+      }
       this.sourceIndex = (this.sourceIndex + 1) % this.availableSources.length;
       const nextSource = this.availableSources[this.sourceIndex];
       await this.loadStream(nextSource);
     }
   
+    // Feed playback failures back into the server's source health scores
+    reportBrokenCandidate(candidate) {
+      if (!candidate || !navigator.sendBeacon) return;
+      const report = JSON.stringify({
+        imdb_id: this.imdbId,
+        source: candidate.source,
+        url: candidate.url,
+        report_token: candidate.report_token,
+        note: 'playback failed, player failed over'
+      });
+      navigator.sendBeacon('/api/report-broken-source', new Blob([report], { type: 'application/json' }));
+    }
+
     getNextSource() {
       const currentIndex = this.availableSources.indexOf(this.currentSource);
       return this.availableSources[(currentIndex + 1) % this.availableSources.length];
     }
   
     destroy() {
+      this.closeEventSource();
       this.destroyHls();
       if (this.videoPlayer) {
         this.videoPlayer.src = '';
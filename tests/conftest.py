@@ -0,0 +1,22 @@
+import pytest
+
+
+class FakeClock:
+    """Stands in for the `time` module of the code under test; only moves when told to"""
+
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,46 @@
+import pytest
+
+from api import bandwidth
+from api.bandwidth import TokenBucket, PROXY_BURST_SECONDS
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(bandwidth, "time", clock)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    assert bucket.reserve(10 ** 9) == 0.0
+
+
+def test_starts_with_a_full_burst():
+    bucket = TokenBucket(1000)
+    assert bucket.capacity == 1000 * PROXY_BURST_SECONDS
+    assert bucket.reserve(1000 * PROXY_BURST_SECONDS) == 0.0
+
+
+def test_debt_turns_into_wait_time():
+    bucket = TokenBucket(1000)
+    bucket.reserve(bucket.capacity)
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    # Later callers queue behind the debt
+    assert bucket.reserve(500) == pytest.approx(1.0)
+
+
+def test_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(1000)
+    bucket.reserve(bucket.capacity)
+    clock.advance(0.25)
+    assert bucket.reserve(250) == 0.0
+    clock.advance(3600)
+    assert bucket.reserve(bucket.capacity) == 0.0
+    assert bucket.reserve(1) > 0
+
+
+def test_lowering_the_rate_trims_tokens():
+    bucket = TokenBucket(1000)
+    bucket.set_rate(100)
+    assert bucket.tokens == 100 * PROXY_BURST_SECONDS
+    bucket.set_rate(0)
+    assert bucket.reserve(10 ** 9) == 0.0
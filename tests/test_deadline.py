@@ -0,0 +1,76 @@
+import pytest
+
+from api import deadline as deadline_module
+from api.deadline import Deadline, DeadlineExceeded, MIN_CALL_TIMEOUT_SECONDS, ensure_deadline
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(deadline_module, "time", clock)
+
+
+def test_timeout_is_capped_by_remaining_budget(clock):
+    deadline = Deadline(10)
+    assert deadline.timeout(15) == 10
+    clock.advance(8)
+    assert deadline.timeout(15) == pytest.approx(2)
+    assert deadline.timeout(1) == 1
+
+
+def test_exhausted_budget_raises(clock):
+    deadline = Deadline(10)
+    clock.advance(10 - MIN_CALL_TIMEOUT_SECONDS / 2)
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(5)
+
+
+def test_unbounded_deadline():
+    deadline = ensure_deadline(None)
+    assert deadline.remaining() == float("inf")
+    assert deadline.timeout(7) == 7
+    assert not deadline.expired()
+
+
+def test_child_shares_expiry(clock):
+    parent = Deadline(10)
+    clock.advance(4)
+    child = parent.child()
+    assert child.remaining() == pytest.approx(6)
+    assert child.budget == parent.budget
+
+
+def test_cancelling_child_leaves_parent_running():
+    parent = Deadline(10)
+    child = parent.child()
+    child.cancel()
+    assert child.is_cancelled()
+    assert child.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded):
+        child.timeout(1)
+    assert not parent.is_cancelled()
+    assert parent.timeout(1) == 1
+
+
+def test_cancelling_parent_cancels_descendants():
+    parent = Deadline(10)
+    grandchild = parent.child().sub(3)
+    parent.cancel()
+    assert grandchild.is_cancelled()
+    assert grandchild.remaining() == 0.0
+
+
+def test_sub_takes_the_earlier_limit(clock):
+    parent = Deadline(10)
+    assert parent.sub(3).remaining() == pytest.approx(3)
+    clock.advance(8)
+    tight = parent.sub(3)
+    assert tight.remaining() == pytest.approx(2)
+    assert tight.budget == pytest.approx(2)
+
+
+def test_sub_of_unbounded_deadline(clock):
+    capped = Deadline(None).sub(4)
+    assert capped.remaining() == pytest.approx(4)
+    clock.advance(4)
+    assert capped.expired()
@@ -0,0 +1,59 @@
+from api.hls_manifest import parse_attributes, parse_playlist
+
+BASE = "https://cdn.example/movie/master.m3u8"
+
+MASTER = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=800000,AVERAGE-BANDWIDTH=700000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+360p/index.m3u8
+
+#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720,FRAME-RATE=29.970
+https://other.example/720p/index.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXTINF:6.0,
+seg0.ts
+#EXTINF:6.0,
+/abs/seg1.ts
+#EXT-X-ENDLIST
+"""
+
+
+def test_parse_attributes_keeps_quoted_commas():
+    assert parse_attributes('BANDWIDTH=800000,CODECS="avc1,mp4a",RESOLUTION=640x360') == {
+        "BANDWIDTH": "800000", "CODECS": "avc1,mp4a", "RESOLUTION": "640x360"
+    }
+
+
+def test_master_playlist_variants():
+    playlist = parse_playlist(MASTER, BASE)
+    assert playlist["is_master"] is True
+    assert playlist["segments"] == []
+    low, high = playlist["variants"]
+
+    assert low["url"] == "https://cdn.example/movie/360p/index.m3u8"
+    assert (low["bandwidth"], low["average_bandwidth"]) == (800000, 700000)
+    assert (low["width"], low["height"], low["label"]) == (640, 360, "360p")
+    assert low["codecs"] == "avc1.4d401e,mp4a.40.2"
+    assert low["frame_rate"] is None
+
+    assert high["url"] == "https://other.example/720p/index.m3u8"
+    assert high["average_bandwidth"] is None
+    assert high["frame_rate"] == 29.97
+    assert high["label"] == "720p"
+
+
+def test_media_playlist_segments():
+    playlist = parse_playlist(MEDIA, BASE)
+    assert playlist["is_master"] is False
+    assert playlist["variants"] == []
+    assert playlist["segments"] == ["https://cdn.example/movie/seg0.ts", "https://cdn.example/abs/seg1.ts"]
+
+
+def test_malformed_variant_attributes():
+    text = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=lots,RESOLUTION=wide\nv.m3u8\n"
+    variant, = parse_playlist(text, BASE)["variants"]
+    assert variant["bandwidth"] is None
+    assert (variant["width"], variant["height"], variant["label"]) == (None, None, None)
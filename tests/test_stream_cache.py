@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from api import stream_cache
+from api.stream_cache import (
+    CACHE_TTL_SECONDS, FAILURE_TTL_SECONDS, STALE_GRACE_SECONDS, MAX_TTL_SECONDS, EXPIRY_SAFETY_MARGIN_SECONDS
+)
+
+NOW = 1_800_000_000
+PLAIN = {"success": True, "m3u8": "https://cdn.example/index.m3u8", "source": "test"}
+
+
+def _signed(expiry):
+    return {"success": True, "m3u8": f"https://cdn.example/index.m3u8?expires={expiry}", "source": "test"}
+
+
+class FakeBackend:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    clock.now = NOW
+    monkeypatch.setattr(stream_cache, "time", clock)
+    monkeypatch.setattr(stream_cache, "_stream_cache", {})
+    monkeypatch.setattr(stream_cache, "_backend", None)
+    return stream_cache
+
+
+def test_ttl_for_failures_and_fallbacks():
+    assert stream_cache.ttl_for_result(None) == FAILURE_TTL_SECONDS
+    assert stream_cache.ttl_for_result({"success": False, "error": "nope"}) == FAILURE_TTL_SECONDS
+    assert stream_cache.ttl_for_result({"success": True}) == FAILURE_TTL_SECONDS
+    assert stream_cache.ttl_for_result(dict(PLAIN, fallback=True)) == FAILURE_TTL_SECONDS
+
+
+def test_ttl_for_unsigned_url():
+    assert stream_cache.ttl_for_result(PLAIN) == CACHE_TTL_SECONDS
+    assert stream_cache.ttl_for_result({"stream_url": "https://cdn.example/v.mp4"}) == CACHE_TTL_SECONDS
+
+
+def test_ttl_for_signed_url_stops_before_expiry():
+    assert stream_cache.ttl_for_result(_signed(NOW + 600), now=NOW) == 600 - EXPIRY_SAFETY_MARGIN_SECONDS
+
+
+def test_ttl_for_signed_url_is_capped_and_never_negative():
+    assert stream_cache.ttl_for_result(_signed(NOW + MAX_TTL_SECONDS * 2), now=NOW) == MAX_TTL_SECONDS
+    assert stream_cache.ttl_for_result(_signed(NOW + 10), now=NOW) == 0
+
+
+def test_get_stale_within_grace(cache, clock):
+    cache.put("k", PLAIN)
+    assert cache.get("k") == PLAIN
+    assert cache.get_stale("k") == dict(PLAIN, stale=True)
+
+    clock.advance(CACHE_TTL_SECONDS + 1)
+    assert cache.get("k") is None
+    assert cache.get_stale("k") == dict(PLAIN, stale=True)
+
+
+def test_get_stale_after_grace(cache, clock):
+    cache.put("k", PLAIN)
+    clock.advance(CACHE_TTL_SECONDS + STALE_GRACE_SECONDS)
+    assert cache.get_stale("k") is None
+
+
+def test_get_stale_never_serves_past_signed_expiry(cache, clock):
+    cache.put("k", _signed(NOW + 600))
+    clock.advance(600 - EXPIRY_SAFETY_MARGIN_SECONDS + 1)
+    assert cache.get_stale("k") is not None
+    clock.advance(EXPIRY_SAFETY_MARGIN_SECONDS)
+    assert cache.get_stale("k") is None
+
+
+def test_get_stale_ignores_failures(cache):
+    cache.put("k", {"success": False, "error": "nope"})
+    assert cache.get_stale("k") is None
+    assert cache.get_stale("missing") is None
+
+
+def test_expired_local_entry_reads_through_to_backend(cache, clock, monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(stream_cache, "_backend", backend)
+    cache.put("k", PLAIN)
+    clock.advance(CACHE_TTL_SECONDS + 1)
+
+    fresh = dict(PLAIN, m3u8="https://cdn.example/fresh.m3u8")
+    backend.data[stream_cache.BACKEND_KEY_PREFIX + "k"] = json.dumps([clock.now, clock.now + 300, fresh])
+    assert cache.get("k") == fresh
@@ -0,0 +1,39 @@
+import pytest
+
+from api import stream_cache, vidsrc_api
+from api.deadline import Deadline
+from api.stream_events import CandidateStream, _candidates_result, to_candidate
+from api.stream_cache import CACHE_TTL_SECONDS, FAILURE_TTL_SECONDS
+
+
+@pytest.fixture(autouse=True)
+def no_omdb(monkeypatch):
+    # The VidSrc template would otherwise queue a live OMDb details fetch
+    monkeypatch.setattr(vidsrc_api, "prefetch_movie_details", lambda imdb_id: False)
+
+
+def _template_candidates(imdb_id="tt0111161"):
+    # Only the attributes fallback_candidates reads; the constructor would start resolving
+    stream = CandidateStream.__new__(CandidateStream)
+    stream.imdb_id = imdb_id
+    stream.task_deadline = Deadline(5)
+    return stream.fallback_candidates()
+
+
+def test_template_candidates_are_marked_fallback():
+    candidates = _template_candidates()
+    assert candidates
+    assert all(candidate["fallback"] for candidate in candidates)
+
+
+def test_template_only_result_gets_the_short_ttl():
+    result = _candidates_result(_template_candidates())
+    assert result["success"] and result["fallback"]
+    assert stream_cache.ttl_for_result(result) == FAILURE_TTL_SECONDS
+
+
+def test_result_with_a_found_stream_gets_the_full_ttl():
+    found = to_candidate({"m3u8": "https://cdn.example/index.m3u8", "source": "test"})
+    result = _candidates_result([found] + _template_candidates())
+    assert "fallback" not in result
+    assert stream_cache.ttl_for_result(result) == CACHE_TTL_SECONDS
@@ -0,0 +1,62 @@
+import json
+import base64
+
+from api.url_expiry import parse_url_expiry, seconds_until_expiry
+
+EXPIRY = 1_900_000_000
+
+
+def _jwt(claims):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    return f"{encode({'alg': 'HS256'})}.{encode(claims)}.c2lnbmF0dXJl"
+
+
+def test_no_url_or_no_expiry():
+    assert parse_url_expiry(None) is None
+    assert parse_url_expiry("") is None
+    assert parse_url_expiry("https://cdn.example/video/index.m3u8?token=abc") is None
+
+
+def test_plain_expiry_parameter_in_seconds():
+    assert parse_url_expiry(f"https://cdn.example/index.m3u8?expires={EXPIRY}") == EXPIRY
+
+
+def test_expiry_parameter_in_milliseconds():
+    assert parse_url_expiry(f"https://cdn.example/index.m3u8?e={EXPIRY * 1000}") == EXPIRY
+
+
+def test_parameter_names_are_case_insensitive():
+    assert parse_url_expiry(f"https://cdn.example/index.m3u8?Expires={EXPIRY}") == EXPIRY
+
+
+def test_implausible_timestamps_are_ignored():
+    assert parse_url_expiry("https://cdn.example/index.m3u8?exp=12345") is None
+    assert parse_url_expiry("https://cdn.example/index.m3u8?expires=soon") is None
+
+
+def test_aws_sigv4():
+    url = "https://bucket.s3.amazonaws.com/v.mp4?X-Amz-Date=20300101T000000Z&X-Amz-Expires=3600"
+    assert parse_url_expiry(url) == 1_893_456_000 + 3600
+
+
+def test_akamai_token():
+    url = f"https://cdn.example/index.m3u8?hdnts=st%3D1800000000~exp%3D{EXPIRY}~acl%3D%2F*~hmac%3Dabc"
+    assert parse_url_expiry(url) == EXPIRY
+
+
+def test_jwt_in_path_and_query():
+    token = _jwt({"exp": EXPIRY})
+    assert parse_url_expiry(f"https://cdn.example/{token}/index.m3u8") == EXPIRY
+    assert parse_url_expiry(f"https://cdn.example/index.m3u8?auth={token}") == EXPIRY
+
+
+def test_earliest_of_disagreeing_encodings_wins():
+    url = f"https://cdn.example/index.m3u8?expires={EXPIRY + 600}&exp={EXPIRY}"
+    assert parse_url_expiry(url) == EXPIRY
+
+
+def test_seconds_until_expiry():
+    url = f"https://cdn.example/index.m3u8?expires={EXPIRY}"
+    assert seconds_until_expiry(url, now=EXPIRY - 90) == 90
+    assert seconds_until_expiry("https://cdn.example/index.m3u8") is None
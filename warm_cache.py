@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Stream cache warmer for Mushh's Galaxy App
+
+Resolves a list of IMDb IDs with the same resolver as /api/stream and
+writes the results into the shared Redis stream cache, so the web
+workers start with them warm. Prints success rate and latency
+percentiles per provider when done.
+
+Usage:
+    python warm_cache.py ids.txt --processes 4 --host-rate 2
+    cat ids.txt | python warm_cache.py - --json
+
+The ID file holds one IMDb ID per line; blank lines, '#' comments and
+anything after the first column are ignored.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+
+from api import provider_stats, stream_cache
+from api.deadline import Deadline, STREAM_REQUEST_BUDGET_SECONDS
+from api.omdb_fetcher import validate_imdb_id
+
+
+def read_ids(path):
+    """Read IMDb IDs from a file ('-' for stdin), dropping duplicates and junk"""
+    handle = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    ids = []
+    try:
+        for line in handle:
+            fields = line.split('#', 1)[0].split()
+            if fields and validate_imdb_id(fields[0]):
+                ids.append(fields[0])
+            elif fields:
+                print(f"⚠️  Skipping invalid IMDb ID: {fields[0]}", file=sys.stderr)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+    return list(dict.fromkeys(ids))
+
+
+def _init_worker(host_rate, redis_url):
+    from api import host_limits
+    host_limits.set_rate(host_rate)
+    if redis_url:
+        stream_cache.STREAM_CACHE_REDIS_URL = redis_url
+        stream_cache.connect_backend()
+
+
+def _resolve(imdb_id, source, budget, force):
+    """Resolve one title in a worker process; returns its outcome and the provider stats it produced"""
+    from api.stream_fetcher import get_m3u8_from_multiembed, stream_cache_key
+
+    key = stream_cache_key(imdb_id, source)
+    if not force and stream_cache.get(key) is not None:
+        return {"imdb_id": imdb_id, "status": "cached", "seconds": 0.0, "source": None, "stats": {}}
+    if force:
+        stream_cache.invalidate(key)
+
+    provider_stats.reset()
+    started = time.perf_counter()
+    try:
+        result = get_m3u8_from_multiembed(imdb_id, source, deadline=Deadline(budget))
+        ok = stream_cache.is_success(result)
+        winner = result.get("source") if ok else None
+    except Exception as e:
+        print(f"❌ {imdb_id}: {e}", file=sys.stderr)
+        ok, winner = False, None
+    return {
+        "imdb_id": imdb_id,
+        "status": "resolved" if ok else "failed",
+        "seconds": time.perf_counter() - started,
+        "source": winner,
+        "stats": provider_stats.snapshot()
+    }
+
+
+def build_report(outcomes, wall_seconds):
+    resolved = [o for o in outcomes if o["status"] != "cached"]
+    by_source = {}
+    for outcome in resolved:
+        by_source.setdefault(outcome["source"] or "none", []).append(outcome["seconds"])
+
+    successes = sum(1 for o in resolved if o["status"] == "resolved")
+    return {
+        "titles": len(outcomes),
+        "already_cached": len(outcomes) - len(resolved),
+        "wall_seconds": round(wall_seconds, 2),
+        "titles_summary": provider_stats.summarize(len(resolved), successes, [o["seconds"] for o in resolved]),
+        "winning_source": {
+            name: provider_stats.summarize(len(samples), len(samples) if name != "none" else 0, samples)
+            for name, samples in sorted(by_source.items())
+        },
+        **provider_stats.get_provider_stats()
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    def table(title, rows):
+        print(f"\n{title}")
+        print(f"  {'name':32} {'tries':>6} {'ok%':>6} {'p50':>8} {'p90':>8} {'p99':>8}")
+        for name, row in rows.items():
+            rate = "-" if row["success_rate"] is None else f"{row['success_rate'] * 100:.0f}"
+            print(f"  {name[:32]:32} {row['attempts']:>6} {rate:>6} "
+                  f"{fmt(row['p50']):>8} {fmt(row['p90']):>8} {fmt(row['p99']):>8}")
+
+    summary = report["titles_summary"]
+    print(f"\n🎬 {report['titles']} titles, {report['already_cached']} already cached, "
+          f"{report['wall_seconds']}s wall time")
+    table("Titles", {"all": summary})
+    table("Winning source", report["winning_source"])
+    table("Providers (every attempt)", report["providers"])
+    table("Hosts (every attempt)", report["hosts"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-resolve streams into the shared cache")
+    parser.add_argument("ids_file", help="File with one IMDb ID per line, or - for stdin")
+    parser.add_argument("--source", default="auto", help="Preferred source, as for /api/stream (default: auto)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 4, help="Worker processes")
+    parser.add_argument("--host-rate", type=float, default=2.0,
+                        help="Requests per second per upstream host, shared by all processes (0 = unlimited)")
+    parser.add_argument("--budget", type=float, default=STREAM_REQUEST_BUDGET_SECONDS,
+                        help="Seconds allowed per title")
+    parser.add_argument("--redis-url", default=os.getenv("STREAM_CACHE_REDIS_URL", ""),
+                        help="Shared stream cache (default: $STREAM_CACHE_REDIS_URL)")
+    parser.add_argument("--force", action="store_true", help="Re-resolve titles that are already cached")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    ids = read_ids(args.ids_file)
+    if not ids:
+        print("❌ No valid IMDb IDs to resolve")
+        return 1
+    if not args.redis_url:
+        print("⚠️  No shared cache configured (--redis-url / STREAM_CACHE_REDIS_URL): "
+              "results only feed the report", file=sys.stderr)
+    else:
+        # Fail here with the reason; a worker initializer failing only shows up as BrokenProcessPool
+        stream_cache.STREAM_CACHE_REDIS_URL = args.redis_url
+        try:
+            stream_cache.connect_backend()
+        except Exception as e:
+            print(f"❌ Cannot reach the shared cache (--redis-url): {e}", file=sys.stderr)
+            return 1
+
+    processes = max(1, min(args.processes, len(ids)))
+    # Each process enforces its share, so the host sees at most --host-rate overall
+    host_rate = args.host_rate / processes
+
+    outcomes = []
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(host_rate, args.redis_url)
+    ) as executor:
+        futures = [executor.submit(_resolve, imdb_id, args.source, args.budget, args.force) for imdb_id in ids]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            outcome = future.result()
+            provider_stats.merge(outcome.pop("stats"))
+            outcomes.append(outcome)
+            if not args.json:
+                print(f"[{done}/{len(ids)}] {outcome['imdb_id']}: {outcome['status']} "
+                      f"({outcome['seconds']:.1f}s{', ' + outcome['source'] if outcome['source'] else ''})",
+                      file=sys.stderr)
+
+    report = build_report(outcomes, time.perf_counter() - started)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if report["titles_summary"]["successes"] or report["already_cached"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())